@@ -0,0 +1,8 @@
+"""
+Benchmarks of the storefront hot paths, run from the repository root, e.g.::
+
+    python -m benchmarks.search --help
+
+Benchmarks creating data run against a throwaway test database, see
+``benchmarks.utils.test_database``.
+"""
@@ -0,0 +1,68 @@
+"""
+Soft-delete cascade of a category and its products with the set-based
+engine of ``e_shop.common``, against the former cascade saving and
+signaling every related row one by one.
+
+Runs on a throwaway test database::
+
+    python -m benchmarks.cascade --sizes 10 100 1000 10000 100000
+
+The former cascade is only run up to ``--former-max`` products.
+"""
+import argparse
+import time
+
+from benchmarks.utils import setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000]
+    )
+    parser.add_argument("--former-max", type=int, default=10000)
+    options = parser.parse_args()
+    setup_django()
+
+    from django.db import transaction
+    from safedelete.config import SOFT_DELETE, SOFT_DELETE_CASCADE
+
+    from store.models import Category, Product
+
+    def former_cascade(category):
+        # safedelete's cascade, one instance loaded and saved per related row.
+        with transaction.atomic():
+            for product in Product.objects.filter(category=category):
+                product.delete(force_policy=SOFT_DELETE)
+            category.delete(force_policy=SOFT_DELETE)
+
+    def cascade(category):
+        with transaction.atomic():
+            category.delete(force_policy=SOFT_DELETE_CASCADE)
+
+    with test_database():
+        for size in options.sizes:
+            category = Category.objects.create(name=f"{size} products")
+            for start in range(0, size, 5000):
+                Product.objects.bulk_create(
+                    Product(name=f"product {i}", category=category, deleted=None)
+                    for i in range(start, min(start + 5000, size))
+                )
+            legs = [("set-based", cascade)]
+            if size <= options.former_max:
+                legs.append(("former", former_cascade))
+            for label, func in legs:
+                category.refresh_from_db()
+                started = time.perf_counter()
+                func(category)
+                elapsed = time.perf_counter() - started
+                assert not Product.objects.filter(category=category).exists()
+                print(f"{size:>7} products  {label:<10} {elapsed * 1000:10.1f}ms")
+                # undeleted in bulk for the next leg.
+                Category.all_objects.filter(pk=category.pk).undelete(
+                    force_policy=SOFT_DELETE_CASCADE
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Latency of the storefront catalog page ``/`` per catalog size, with cold and
+warm caches and as a 304 revalidation, against the former page rendering every product at once.
+
+Runs on a throwaway test database::
+
+    python -m benchmarks.catalog --products 10000 1000000 --repeat 200
+
+The former page is only rendered up to ``--former-max`` products, it takes
+seconds per request beyond.
+"""
+import argparse
+
+from benchmarks.utils import measure, report, setup_django, test_database
+
+CATEGORIES = 20
+
+
+def populate(total):
+    from django.db import transaction
+
+    from store.models import Category, Product
+
+    if not Category.objects.exists():
+        Category.objects.bulk_create(
+            Category(name=f"category {i}", deleted=None) for i in range(CATEGORIES)
+        )
+    categories = list(Category.objects.all())
+    count = Product.all_objects.count()
+    while count < total:
+        size = min(5000, total - count)
+        with transaction.atomic():
+            Product.objects.bulk_create(
+                Product(
+                    name=f"product {count + i}",
+                    price=count + i,
+                    image=f"uploads/products/{count + i}.jpg",
+                    category=categories[(count + i) % len(categories)],
+                    deleted=None,
+                )
+                for i in range(size)
+            )
+        count += size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--products", type=int, nargs="+", default=[10000])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--former-max", type=int, default=10000)
+    options = parser.parse_args()
+    setup_django()
+
+    from django.core.cache import cache
+    from django.shortcuts import render
+    from django.test import Client, RequestFactory
+
+    from store.models import Category, Product
+    from store.utils import catalog_context
+
+    with test_database():
+        client = Client()
+
+        def get(path, clear=False, status=200, **headers):
+            if clear:
+                cache.clear()
+            response = client.get(path, **headers)
+            assert response.status_code == status, response.status_code
+            return response
+
+        for total in sorted(options.products):
+            populate(total)
+            print(f"{total} products")
+            last = Product.objects.order_by("-id").values_list("id", flat=True)[0]
+            deep = f"/?after={last - 100}"
+            category = f"/?category={Category.objects.first().id}"
+            report(
+                "first page, cold caches",
+                measure(lambda: get("/", True), options.repeat),
+            )
+            report("first page, warm caches", measure(lambda: get("/"), options.repeat))
+            etag = get("/")["ETag"]
+            report(
+                "first page, revalidated",
+                measure(
+                    lambda: get("/", status=304, HTTP_IF_NONE_MATCH=etag),
+                    options.repeat,
+                ),
+            )
+            report(
+                "deep page, cold caches",
+                measure(lambda: get(deep, True), options.repeat),
+            )
+            report(
+                "category page, cold caches",
+                measure(lambda: get(category, True), options.repeat),
+            )
+            if total <= options.former_max:
+                request = RequestFactory().get("/")
+
+                def former():
+                    render(
+                        request,
+                        "index.html",
+                        {"products": Product.objects.all(), **catalog_context()},
+                    )
+
+                report(
+                    "former page, every product",
+                    measure(former, max(options.repeat // 20, 3)),
+                )
+
+
+if __name__ == "__main__":
+    main()
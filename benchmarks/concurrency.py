@@ -0,0 +1,67 @@
+"""
+Throughput and latency of the site under concurrent clients, to compare the
+same pages served by gunicorn over WSGI (sync workers) and over ASGI
+(uvicorn workers, ``gunicorn.conf.py``).
+
+Needs the site served at ``--base-url``, e.g. ``gunicorn e_shop.wsgi -w 3``
+then ``gunicorn -c gunicorn.conf.py``::
+
+    python -m benchmarks.concurrency --base-url http://127.0.0.1:8000 \\
+        --path / --path "/?category=2" --concurrency 100 --requests 5000
+
+Each client sends its requests one after the other, over its own connection.
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+from benchmarks.utils import report
+
+
+async def client(session, urls, count, durations, errors):
+    for url in itertools.islice(urls, count):
+        started = time.perf_counter()
+        try:
+            async with session.get(url) as response:
+                await response.read()
+                if response.status >= 500:
+                    errors.append(response.status)
+        except Exception as e:
+            errors.append(e)
+        durations.append(time.perf_counter() - started)
+
+
+async def run(options):
+    import aiohttp
+
+    urls = itertools.cycle(options.base_url + path for path in options.path)
+    durations, errors = [], []
+    connector = aiohttp.TCPConnector(limit=options.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        per_client = options.requests // options.concurrency
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(
+                client(session, urls, per_client, durations, errors)
+                for _ in range(options.concurrency)
+            )
+        )
+        elapsed = time.perf_counter() - started
+    report(f"{options.concurrency} clients", durations)
+    print(f"{len(durations) / elapsed:.0f} requests/s, {len(errors)} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", action="append")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    options = parser.parse_args()
+    options.path = options.path or ["/"]
+    asyncio.run(run(options))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Page weight of the product cards with the resized WebP/JPEG derivatives
+picked through srcset, against the former cards loading every original,
+and the render time of the cards.
+
+Runs without a database::
+
+    python -m benchmarks.images --size 2000 1500 --cards 24 --repeat 200
+
+The original is a synthetic photo, noise over a gradient, saved as JPEG.
+"""
+import argparse
+import random
+import tempfile
+from io import BytesIO
+
+from benchmarks.utils import measure, report, setup_django
+
+# the cards are 18rem wide, 288 CSS pixels.
+CARD_WIDTH = 288
+
+
+def photo(width, height):
+    from PIL import Image, ImageFilter
+
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.frombytes(
+        "RGB", (width, height), random.randbytes(width * height * 3)
+    ).filter(ImageFilter.GaussianBlur(2))
+    buffer = BytesIO()
+    Image.blend(image, noise, 0.5).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def pick(derivatives, width):
+    # what a browser picks from srcset: the narrowest copy covering the slot.
+    covering = [pair for pair in derivatives if pair[0] >= width]
+    return min(covering) if covering else max(derivatives)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, nargs=2, default=[2000, 1500])
+    parser.add_argument("--cards", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=200)
+    options = parser.parse_args()
+    setup_django()
+
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import FileSystemStorage
+    from django.template.loader import render_to_string
+
+    from store.images import generate_derivatives, get_formats
+    from store.models import Product
+
+    with tempfile.TemporaryDirectory() as directory:
+        storage = FileSystemStorage(location=directory)
+        name = storage.save("photo.jpg", ContentFile(photo(*options.size)))
+        derivatives = generate_derivatives(storage, name)
+
+        print(f"original {options.size[0]}x{options.size[1]}")
+        original = storage.size(name)
+        print(f"{'former, original':<24} {options.cards * original / 1024:10.1f}KiB")
+        for fmt in get_formats():
+            for dpr in (1, 2):
+                width, copy = pick(derivatives[fmt], CARD_WIDTH * dpr)
+                weight = options.cards * storage.size(copy)
+                print(f"{f'{fmt} {width}w, {dpr}x':<24} {weight / 1024:10.1f}KiB")
+
+        products = [
+            Product(
+                name=f"product {i}",
+                price=i,
+                image=f"uploads/products/{i}.jpg",
+                image_derivatives=derivatives,
+            )
+            for i in range(options.cards)
+        ]
+        former = [
+            Product(name=p.name, price=p.price, image=p.image.name) for p in products
+        ]
+        for label, cards in (("cards, srcset", products), ("cards, former", former)):
+            report(
+                label,
+                measure(
+                    lambda: render_to_string("products.html", {"products": cards}),
+                    options.repeat,
+                ),
+            )
+
+
+if __name__ == "__main__":
+    main()
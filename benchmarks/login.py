@@ -0,0 +1,73 @@
+"""
+Login throughput of ``/user/login/``, issuing the token in-process, against
+the former flow checking the password then running the password grant of
+``/o/token/``, which hashes the password a second time.
+
+Runs on a throwaway test database::
+
+    python -m benchmarks.login --repeat 50
+
+The former flow is replayed in-process, its loopback HTTP round trip and
+the second worker it held are not counted, so the gap is a lower bound.
+"""
+import argparse
+
+from benchmarks.utils import measure, report, setup_django, test_database
+
+EMAIL = "bench@example.com"
+PASSWORD = "bench-Password-1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    options = parser.parse_args()
+    setup_django()
+
+    from django.contrib.auth.hashers import check_password
+    from django.test import Client
+    from oauth2_provider.models import Application
+
+    from users.models import User
+
+    with test_database():
+        user = User.objects.create_user(username=EMAIL, email=EMAIL, password=PASSWORD)
+        application = Application.objects.create(
+            user=user,
+            authorization_grant_type="password",
+            client_type="Confidential",
+            name=EMAIL,
+        )
+        client = Client()
+
+        def login():
+            response = client.post(
+                "/user/login/", {"email": EMAIL, "passWord": PASSWORD}
+            )
+            assert response.status_code == 200, response.content
+
+        def former_login():
+            account = User.objects.get(email=EMAIL)
+            assert check_password(PASSWORD, account.password)
+            response = client.post(
+                "/o/token/",
+                {
+                    "username": account.username,
+                    "password": PASSWORD,
+                    "client_id": application.client_id,
+                    "client_secret": application.client_secret,
+                    "grant_type": "password",
+                },
+            )
+            assert response.status_code == 200, response.content
+
+        for label, func in (
+            ("former: check + /o/token/", former_login),
+            ("login", login),
+        ):
+            func()
+            report(label, measure(func, options.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Insert rate of rows keyed by random public ids against time ordered
+snowflake public ids, the former and the current ``PUBLIC_ID_GENERATOR``.
+
+Runs on a throwaway test database::
+
+    python -m benchmarks.public_ids --rows 200000 --batch 1000
+
+Random ids land on random pages of the ``public_id`` unique index, the
+rate of the last batches shows how inserts slow down as the index grows.
+"""
+import argparse
+import time
+
+from benchmarks.utils import setup_django, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch", type=int, default=1000)
+    options = parser.parse_args()
+    setup_django()
+
+    from django.db import transaction
+
+    from e_shop.common import RandomIdGenerator, SnowflakeIdGenerator
+    from store.models import Category
+
+    legs = [("random", RandomIdGenerator()), ("snowflake", SnowflakeIdGenerator())]
+    with test_database():
+        for label, generator in legs:
+            durations = []
+            for start in range(0, options.rows, options.batch):
+                count = min(options.batch, options.rows - start)
+                started = time.perf_counter()
+                with transaction.atomic():
+                    Category.objects.bulk_create(
+                        Category(name=f"category {start + i}", public_id=public_id)
+                        for i, public_id in enumerate(generator.allocate(count))
+                    )
+                durations.append(time.perf_counter() - started)
+            tail = durations[-max(len(durations) // 10, 1) :]
+            print(
+                f"{label:<10} {options.rows / sum(durations):10.0f} rows/s overall"
+                f" {len(tail) * options.batch / sum(tail):10.0f} rows/s last 10%"
+            )
+            Category.all_objects.all()._raw_delete(Category.objects.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Overhead of the request log of ``RequestLogMiddleware`` per request, with
+logging off, through the queue handler of ``e_shop.log``, and written
+synchronously to the file handler as before the queue.
+
+Runs without a database::
+
+    python -m benchmarks.request_log --repeat 20000
+
+Records go to a temporary JSON lines file, as the ``file`` handler does.
+"""
+import argparse
+import logging
+import os
+import tempfile
+
+from benchmarks.utils import measure, report, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=20000)
+    options = parser.parse_args()
+    setup_django()
+
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+
+    from e_shop.log import JsonFormatter, queue_handler
+    from e_shop.middleware import RequestLogMiddleware
+
+    logger = logging.getLogger("e_shop.requests")
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    middleware = RequestLogMiddleware(lambda request: HttpResponse(b"ok"))
+    request = RequestFactory().get("/filter/?q=shoe")
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_handler = logging.FileHandler(os.path.join(directory, "requests.log"))
+        file_handler.setFormatter(JsonFormatter())
+        queue = queue_handler([file_handler], queue_size=options.repeat)
+        legs = [("off", None, logging.WARNING)]
+        legs.append(("queue", queue, logging.INFO))
+        legs.append(("file, former", file_handler, logging.INFO))
+        for label, handler, level in legs:
+            logger.setLevel(level)
+            if handler is not None:
+                logger.addHandler(handler)
+            report(label, measure(lambda: middleware(request), options.repeat))
+            if handler is not None:
+                logger.removeHandler(handler)
+        queue.close()
+        file_handler.close()
+
+
+if __name__ == "__main__":
+    main()
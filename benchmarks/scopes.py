@@ -0,0 +1,105 @@
+"""
+Scope checks of ``CustomPermissions`` against the former per request loop,
+which walked the lists of ``required_alternate_scopes`` and queried the
+user roles again for every alternative.
+
+Runs on a throwaway test database::
+
+    python -m benchmarks.scopes --repeat 10000
+"""
+import argparse
+
+from benchmarks.utils import measure, report, setup_django, test_database
+
+# alternatives of the benchmarked view, the last one is granted.
+ALTERNATIVES = [
+    ["create", "update", "delete"],
+    ["custom_scope1", "custom_scope2"],
+    ["admin"],
+    ["read", "create"],
+]
+
+
+def former_has_permission(request, view):
+    # CustomPermissions.has_permission before the scopes were compiled.
+    required_alternate_scopes = getattr(view, "required_alternate_scopes")
+    m = request.method.upper()
+    if m in required_alternate_scopes:
+        for alt in required_alternate_scopes[m]:
+            user_scopes = list(
+                {
+                    scope.name
+                    for role in request.user.user_roles.all()
+                    for scope in role.role_scopes.all()
+                }
+            )
+            for alt_scope in alt:
+                flag = False
+                if alt_scope in user_scopes:
+                    flag = True
+        return flag
+    else:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=10000)
+    parser.add_argument("--scopes", type=int, default=50, help="Scopes granted.")
+    options = parser.parse_args()
+    setup_django()
+
+    from django.test import RequestFactory
+
+    from e_shop.common import AlternateScopesMixin, CustomPermissions
+    from users.models import Roles, Scopes, User
+
+    class View(AlternateScopesMixin):
+        required_alternate_scopes = {"GET": ALTERNATIVES}
+
+    granted = ["read", "create"] + [f"scope{i}" for i in range(options.scopes - 2)]
+
+    # matching alone, against the scope names already resolved.
+    user_scopes, user_scope_set = list(granted), frozenset(granted)
+
+    def former_match():
+        for alt in ALTERNATIVES:
+            for alt_scope in alt:
+                flag = False
+                if alt_scope in user_scopes:
+                    flag = True
+        return flag
+
+    def match():
+        return any(
+            alt <= user_scope_set for alt in View.compiled_alternate_scopes["GET"]
+        )
+
+    report("match: former lists", measure(former_match, options.repeat))
+    report("match: compiled frozensets", measure(match, options.repeat))
+
+    with test_database():
+        user = User.objects.create_user(username="u", email="u@example.com")
+        role = Roles.objects.create(name="bench")
+        role.user.add(user)
+        for name in granted:
+            Scopes.objects.create(name=name).roles.add(role)
+        request = RequestFactory().get("/")
+        request.user = user
+        view, permission = View(), CustomPermissions()
+
+        def check():
+            # a new request each time, scopes come from the scopes cache.
+            request.__dict__.pop("_user_scopes", None)
+            assert permission.has_permission(request, view)
+
+        repeat = max(options.repeat // 100, 1)
+        report(
+            "has_permission: former",
+            measure(lambda: former_has_permission(request, view), repeat),
+        )
+        report("has_permission: warm cache", measure(check, repeat))
+
+
+if __name__ == "__main__":
+    main()
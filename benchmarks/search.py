@@ -0,0 +1,50 @@
+"""
+Storefront search run in-process by ``store.services`` against the former
+loopback, where ``/filter/`` fetched ``/search/`` over HTTP.
+
+Needs Elasticsearch with the products index and, for the loopback leg, the
+site served at ``--base-url``::
+
+    python -m benchmarks.search --query shoe --base-url http://127.0.0.1:8000
+
+A loopback search holds two workers, the caller waiting on the one serving
+``/search/``, the worker-seconds column accounts for both.
+"""
+import argparse
+
+from benchmarks.utils import measure, report, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--query", default="")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--base-url", help="Site serving /search/, for the loopback.")
+    options = parser.parse_args()
+    setup_django()
+
+    from e_shop.http_client import get_session
+    from store.services import search_products
+
+    legs = {"in-process": (1, lambda: search_products(options.query))}
+    if options.base_url:
+        session = get_session()
+        url = f"{options.base_url.rstrip('/')}/search/"
+
+        def loopback():
+            response = session.get(url, params={"search": options.query})
+            response.raise_for_status()
+            return response.json()["results"]
+
+        legs["loopback"] = (2, loopback)
+
+    for label, (workers, func) in legs.items():
+        func()  # warm up connections.
+        durations = measure(func, options.repeat)
+        report(label, durations)
+        held = workers * sum(durations) / len(durations)
+        print(f"{label:<36} worker-seconds per search: {held:.4f}")
+
+
+if __name__ == "__main__":
+    main()
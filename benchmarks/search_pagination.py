@@ -0,0 +1,73 @@
+"""
+Latency of deep pages of the product search, paged with ``search_after`` as
+``SearchAfterPagination`` does, against the former ``from``/``size`` offsets.
+
+Needs Elasticsearch with enough products in the index for the deepest page::
+
+    python -m benchmarks.search_pagination --pages 1 100 10000 --page-size 20
+
+Cursors are only reached by walking the pages before them, every page of
+the walk is timed and the requested ones are reported. Offsets past the
+``max_result_window`` of the index, 10,000 hits by default, are rejected
+by Elasticsearch and reported as such.
+"""
+import argparse
+import time
+
+from benchmarks.utils import report, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--query", default="")
+    options = parser.parse_args()
+    setup_django()
+
+    from elasticsearch.exceptions import TransportError
+
+    from store.services import product_search
+
+    size = options.page_size
+    search = product_search(options.query).extra(track_total_hits=False)
+
+    # search_after, the cursor of each requested page is found by walking.
+    cursors, after = {}, None
+    for page in range(1, max(options.pages) + 1):
+        if page in options.pages:
+            cursors[page] = after
+        paged = search.extra(search_after=after) if after else search
+        hits = paged[:size].execute()
+        if len(hits) < size:
+            break
+        after = list(hits[-1].meta.sort)
+    for page in options.pages:
+        if page not in cursors:
+            print(f"search_after page {page}: the index has fewer hits")
+            continue
+        paged = search.extra(search_after=cursors[page]) if cursors[page] else search
+        durations = []
+        for _ in range(options.repeat):
+            started = time.perf_counter()
+            paged[: size + 1].execute()
+            durations.append(time.perf_counter() - started)
+        report(f"search_after page {page}", durations)
+
+    for page in options.pages:
+        start = (page - 1) * size
+        durations = []
+        try:
+            for _ in range(options.repeat):
+                started = time.perf_counter()
+                search[start : start + size].execute()
+                durations.append(time.perf_counter() - started)
+        except TransportError as e:
+            print(f"from/size page {page}: rejected, {e.error}")
+            continue
+        report(f"from/size page {page}", durations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    """
+    This function is used to configure Django for a benchmark run from the repository root.
+    """
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "e_shop.settings")
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """
+    This function is used to run a benchmark against throwaway test databases.
+    """
+    from django.test.utils import (
+        setup_databases,
+        setup_test_environment,
+        teardown_databases,
+        teardown_test_environment,
+    )
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(func, repeat):
+    """
+    This function is used to time repeated calls of a function.
+
+    :param func: Called without arguments.
+    :type func: callable
+    :param repeat: Number of calls.
+    :type repeat: int
+    :return: return the duration of each call in seconds.
+    :rtype: list
+    """
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def percentile(durations, q):
+    ordered = sorted(durations)
+    return ordered[min(len(ordered) - 1, len(ordered) * q // 100)]
+
+
+def report(label, durations):
+    """
+    This function is used to print the latency summary of a benchmark leg.
+
+    :param label: Name of the leg.
+    :type label: str
+    :param durations: Duration of each call in seconds.
+    :type durations: list
+    """
+    total = sum(durations)
+    print(
+        f"{label:<36} n={len(durations):<6} "
+        f"mean={statistics.mean(durations) * 1000:9.3f}ms "
+        f"p50={percentile(durations, 50) * 1000:9.3f}ms "
+        f"p99={percentile(durations, 99) * 1000:9.3f}ms "
+        f"{len(durations) / total if total else 0:8.0f}/s"
+    )
@@ -9,8 +9,13 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "e_shop.settings")
 
-application = get_asgi_application()
+# get_asgi_application(), with streaming responses read off the event loop.
+django.setup(set_prefix=False)
+
+from e_shop.concurrency import StreamingASGIHandler  # noqa: E402
+
+application = StreamingASGIHandler()
@@ -1,11 +1,28 @@
 # reference https://djangosnippets.org/snippets/2513/
 
+import hashlib
+import logging
+import mimetypes
+import os
+import random
+import shutil
+import threading
+import time
+import unicodedata
 import uuid
 import warnings
+from collections import OrderedDict
 from http import HTTPStatus
 
+from django.conf import settings
+from django.core.cache import caches
 from django.core.exceptions import ImproperlyConfigured
-from django.db import models, router
+from django.core.files import File
+from django.db import DEFAULT_DB_ALIAS, connections, models, router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
 from django_mysql.models import Bit1BooleanField
 from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import BasePermission
@@ -16,11 +33,14 @@ from safedelete.managers import (
     SafeDeleteManager,
 )
 from safedelete.models import SOFT_DELETE_CASCADE
+from safedelete.queryset import SafeDeleteQueryset
 from safedelete.signals import post_softdelete, post_undelete, pre_softdelete
-from safedelete.utils import can_hard_delete, related_objects
+from safedelete.utils import can_hard_delete
 
 from e_shop.settings import HARD_DELETE_CASCADE
 
+logger = logging.getLogger(__name__)
+
 
 class CreateUpdateDate(models.Model):
     class Meta:
@@ -31,11 +51,424 @@ class CreateUpdateDate(models.Model):
     updated = models.DateTimeField(auto_now=True, null=True, blank=True)
 
 
+class RandomIdGenerator:
+    """
+    Random public ids, the 53 high bits of a uuid4.
+
+    Ids are unordered, so inserts land on random pages of the ``public_id``
+    index, and collisions are only caught by its unique constraint.
+    """
+
+    def __call__(self):
+        return uuid.uuid4().int >> 75
+
+    def allocate(self, count):
+        return [self() for _ in range(count)]
+
+
+class SnowflakeIdGenerator:
+    """
+    Time ordered public ids, unique per worker without any database round trip.
+
+    An id packs, from the high bits down: 40 bits of milliseconds since
+    ``EPOCH``, enough until 2055, 6 bits of worker id and 7 bits of sequence.
+    The 53 bits are exact in the JSON numbers of browser clients, like the
+    ids of ``RandomIdGenerator``, whose range they share, so a clash with
+    such a former id is left to the unique constraint of ``public_id``.
+    Consecutive ids increase, so inserts append to the ``public_id`` index.
+    Ids never run ahead of the clock, a worker id leased again by another
+    process after this one exits cannot repeat them.
+    """
+
+    EPOCH = 1609459200000  # 2021-01-01T00:00:00Z in milliseconds.
+    TIMESTAMP_BITS = 40
+    WORKER_BITS = 6
+    SEQUENCE_BITS = 7
+
+    def __init__(self, worker_id=0, lease=None):
+        if lease is not None:
+            worker_id = lease.worker_id
+        if not 0 <= worker_id < 1 << self.WORKER_BITS:
+            raise ImproperlyConfigured(
+                f"PUBLIC_ID_WORKER_ID must be between 0 and {(1 << self.WORKER_BITS) - 1}."
+            )
+        self.worker_id = worker_id
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._timestamp = 0
+        self._sequence = 0
+
+    def __call__(self):
+        return self.allocate(1)[0]
+
+    def now(self):
+        return int(time.time() * 1000) - self.EPOCH
+
+    def hold(self):
+        # ids are only issued while the leased worker id is known to be held.
+        if self.lease is not None:
+            self.worker_id = self.lease.hold()
+
+    def allocate(self, count):
+        """
+        This function is used to reserve ``count`` consecutive public ids.
+
+        :param count: Number of ids to reserve, e.g. the size of a ``bulk_create``.
+        :type count: int
+        :return: return the ids, in increasing order.
+        :rtype: list
+        :raises ImproperlyConfigured: if the lease of the worker id was lost
+            and could not be taken again.
+        """
+        ids = []
+        with self._lock:
+            self.hold()
+            now = self.now()
+            if now > self._timestamp:
+                self._timestamp, self._sequence = now, 0
+            # Once the sequence of the current millisecond is exhausted wait
+            # for the next one, or if the clock went backwards, for the clock
+            # to pass the last timestamp.
+            for _ in range(count):
+                if self._sequence >> self.SEQUENCE_BITS:
+                    self.hold()
+                    while now <= self._timestamp:
+                        time.sleep(0.0001)
+                        now = self.now()
+                    self._timestamp, self._sequence = now, 0
+                ids.append(
+                    self._timestamp << (self.WORKER_BITS + self.SEQUENCE_BITS)
+                    | self.worker_id << self.SEQUENCE_BITS
+                    | self._sequence
+                )
+                self._sequence += 1
+        return ids
+
+
+class WorkerIdLease:
+    """
+    Worker id of the process, leased from the MySQL server with ``GET_LOCK``.
+
+    The named lock is held by a connection of its own, checked out of the
+    pool of the database for good when it has one, so the id is released as
+    soon as the process exits or its connection drops. Ids are issued only
+    within ``HOLD_SECONDS`` of the last check that the lock is still held,
+    and only ``HOLD_SECONDS`` after it was taken: a process losing its lease,
+    e.g. to a restart of the server, stops issuing ids before another process
+    leasing the id starts. A thread pings the connection every
+    ``PING_INTERVAL`` seconds, keeping it from the server's ``wait_timeout``.
+    """
+
+    HOLD_SECONDS = 2
+    PING_INTERVAL = 60
+
+    def __init__(self, size, using=DEFAULT_DB_ALIAS):
+        self.size = size
+        self.using = using
+        self.worker_id = None
+        self._connection = None
+        self._lock = threading.Lock()
+        # monotonic times ids may be issued from and until.
+        self._valid_from = self._valid_until = 0.0
+
+    def lock_name(self, worker_id):
+        # Named locks are server wide, the database name keeps e.g. the test
+        # database apart. MySQL limits the name to 64 characters.
+        database = connections[self.using].settings_dict["NAME"]
+        return f"public_id_worker:{worker_id}:{database}"[:64]
+
+    def acquire(self):
+        """
+        This function is used to lease a worker id no other process holds.
+
+        :return: return the worker id, the previously leased one if still free.
+        :rtype: int
+        :raises ImproperlyConfigured: if the database is not MySQL or every
+            worker id is leased.
+        """
+        if connections[self.using].vendor != "mysql":
+            raise ImproperlyConfigured(
+                "Worker ids are leased from MySQL only, set PUBLIC_ID_WORKER_ID."
+            )
+        with self._lock:
+            return self._acquire()
+
+    def hold(self):
+        """
+        This function is used to wait until ids may be issued with the leased worker id.
+
+        :return: return the worker id, leased again if the lease was lost.
+        :rtype: int
+        :raises ImproperlyConfigured: if the lease was lost and no worker id
+            could be leased again.
+        """
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._valid_from:
+                    time.sleep(self._valid_from - now)
+                elif now < self._valid_until:
+                    return self.worker_id
+                elif self._is_held():
+                    self._valid_until = now + self.HOLD_SECONDS
+                else:
+                    logger.warning("Public id worker id %s lease lost.", self.worker_id)
+                    self._acquire()
+
+    def is_held(self):
+        with self._lock:
+            return self._is_held()
+
+    def keep(self):
+        """
+        This function is used to keep the connection of the lease open in a thread.
+
+        :return: return the started daemon thread.
+        :rtype: threading.Thread
+        """
+
+        def run():
+            while True:
+                time.sleep(self.PING_INTERVAL)
+                with self._lock:
+                    checked = time.monotonic()
+                    if self._is_held():
+                        self._valid_until = max(
+                            self._valid_until, checked + self.HOLD_SECONDS
+                        )
+                        continue
+                    logger.warning("Public id worker id %s lease lost.", self.worker_id)
+                    try:
+                        self._acquire()
+                    except Exception:
+                        # ids wait in hold() for a lease again.
+                        logger.exception("Leasing a public id worker id failed.")
+
+        thread = threading.Thread(target=run, name="public-id-lease", daemon=True)
+        thread.start()
+        return thread
+
+    def _acquire(self):
+        # called with the lock held.
+        self._disconnect()
+        self._connection = self._connect()
+        candidates = random.sample(range(self.size), self.size)
+        if self.worker_id is not None:
+            candidates.insert(0, self.worker_id)
+        started = time.monotonic()
+        with self._connection.cursor() as cursor:
+            for worker_id in candidates:
+                cursor.execute("SELECT GET_LOCK(%s, 0)", [self.lock_name(worker_id)])
+                if cursor.fetchone()[0] == 1:
+                    self.worker_id = worker_id
+                    # a former holder that lost the lock stops by then.
+                    self._valid_from = started + self.HOLD_SECONDS
+                    self._valid_until = self._valid_from
+                    return worker_id
+        self._disconnect()
+        raise ImproperlyConfigured(
+            f"All {self.size} public id worker ids are leased by other processes."
+        )
+
+    def _is_held(self):
+        try:
+            with self._connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT IS_USED_LOCK(%s) = CONNECTION_ID()",
+                    [self.lock_name(self.worker_id)],
+                )
+                return cursor.fetchone()[0] == 1
+        except Exception:
+            return False
+
+    def _connect(self):
+        connection = connections[self.using]
+        pool = getattr(connection, "pool", None)
+        if pool is not None:
+            return pool.checkout(held=True)[0]
+        from django.db.backends.mysql.base import Database
+
+        return Database.connect(**connection.get_connection_params())
+
+    def _disconnect(self):
+        conn, self._connection = self._connection, None
+        if conn is None:
+            return
+        pool = getattr(connections[self.using], "pool", None)
+        if pool is not None:
+            pool.discard(conn)
+            return
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_public_id_generator = None
+_public_id_generator_pid = None
+_public_id_generator_lock = threading.Lock()
+# Leases inherited from the parent of a forked process. Closing their
+# connection from the child would release the lock held by the parent.
+_inherited_leases = []
+
+
+def start_public_id_generator():
+    """
+    This function is used to set up the public id generator of the current process.
+
+    The class comes from ``settings.PUBLIC_ID_GENERATOR``. It is called at
+    startup by ``UsersConfig.ready`` and, in workers forked from a preloaded
+    application, by the ``post_fork`` hook of ``gunicorn.conf.py``, so no
+    model instance waits for a lease. ``settings.PUBLIC_ID_WORKER_ID`` pins
+    the worker id, otherwise it is leased with ``WorkerIdLease`` on MySQL
+    and 0 on any other database, which only a single process may use.
+
+    :return: return the generator instance, the one already set up if any.
+    :rtype: SnowflakeIdGenerator
+    :raises ImproperlyConfigured: if no worker id could be leased.
+    """
+    global _public_id_generator, _public_id_generator_pid
+    pid = os.getpid()
+    with _public_id_generator_lock:
+        if _public_id_generator is not None:
+            if _public_id_generator_pid == pid:
+                return _public_id_generator
+            _inherited_leases.append(getattr(_public_id_generator, "lease", None))
+        generator_class = import_string(settings.PUBLIC_ID_GENERATOR)
+        if generator_class is RandomIdGenerator:
+            generator = generator_class()
+        elif settings.PUBLIC_ID_WORKER_ID is not None:
+            generator = generator_class(worker_id=settings.PUBLIC_ID_WORKER_ID)
+        elif connections[DEFAULT_DB_ALIAS].vendor != "mysql":
+            generator = generator_class(worker_id=0)
+        else:
+            lease = WorkerIdLease(size=1 << generator_class.WORKER_BITS)
+            lease.acquire()
+            lease.keep()
+            generator = generator_class(lease=lease)
+        _public_id_generator, _public_id_generator_pid = generator, pid
+        return generator
+
+
+def get_public_id_generator():
+    """
+    This function is used to get the public id generator of the current process.
+
+    :return: return the generator of ``start_public_id_generator``, set up
+        here for a process forked without the hook.
+    :rtype: SnowflakeIdGenerator
+    """
+    generator = _public_id_generator
+    if generator is None or _public_id_generator_pid != os.getpid():
+        generator = start_public_id_generator()
+    return generator
+
+
 class PublicId:
     @staticmethod
     def create_public_id():
-        public_id = uuid.uuid4().int >> 75
-        return public_id
+        return get_public_id_generator()()
+
+    @staticmethod
+    def allocate_public_ids(count):
+        return get_public_id_generator().allocate(count)
+
+
+class PublicIdCache:
+    """
+    Bounded, least recently used cache of ``public_id`` to primary key mappings.
+
+    Entries are kept per process and, when ``settings.PUBLIC_ID_CACHE`` names a
+    cache alias, in that shared cache too. Unknown public ids are cached as
+    negative entries that expire after ``settings.PUBLIC_ID_NEGATIVE_TIMEOUT``.
+    """
+
+    # primary keys are auto incremented from 1, 0 marks a negative entry.
+    NOT_FOUND = 0
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model, public_id):
+        return f"public_id:{model._meta.label_lower}:{public_id}"
+
+    @staticmethod
+    def shared():
+        alias = settings.PUBLIC_ID_CACHE
+        return caches[alias] if alias else None
+
+    def get_many(self, model, public_ids):
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for public_id in public_ids:
+                entry = self._entries.get(self.key(model, public_id))
+                if entry is None or (entry[1] is not None and entry[1] < now):
+                    missing.append(public_id)
+                    continue
+                self._entries.move_to_end(self.key(model, public_id))
+                found[public_id] = entry[0]
+        shared = self.shared()
+        if shared is not None and missing:
+            keys = {self.key(model, public_id): public_id for public_id in missing}
+            for key, pk in shared.get_many(list(keys)).items():
+                found[keys[key]] = pk
+                self._set_local(key, pk)
+        return found
+
+    def set_many(self, model, mapping):
+        shared = self.shared()
+        for public_id, pk in mapping.items():
+            self._set_local(self.key(model, public_id), pk)
+        if shared is not None:
+            shared.set_many(
+                {
+                    self.key(model, public_id): pk
+                    for public_id, pk in mapping.items()
+                    if pk != self.NOT_FOUND
+                }
+            )
+            for public_id, pk in mapping.items():
+                if pk == self.NOT_FOUND:
+                    shared.set(
+                        self.key(model, public_id),
+                        pk,
+                        timeout=settings.PUBLIC_ID_NEGATIVE_TIMEOUT,
+                    )
+
+    def delete(self, model, public_id):
+        self.delete_many(model, [public_id])
+
+    def delete_many(self, model, public_ids):
+        keys = [self.key(model, public_id) for public_id in public_ids]
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        shared = self.shared()
+        if shared is not None and keys:
+            shared.delete_many(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _set_local(self, key, pk):
+        expires = None
+        if pk == self.NOT_FOUND:
+            expires = time.monotonic() + settings.PUBLIC_ID_NEGATIVE_TIMEOUT
+        with self._lock:
+            self._entries[key] = (pk, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+public_id_cache = PublicIdCache(
+    max_size=getattr(settings, "PUBLIC_ID_CACHE_SIZE", 10000)
+)
 
 
 class UniqueIds(models.Model):
@@ -52,6 +485,77 @@ class UniqueIds(models.Model):
         editable=False, default=PublicId.create_public_id, unique=True
     )
 
+    @classmethod
+    def resolve_public_id(cls, public_id):
+        """
+        This function is used to resolve a public id into a primary key.
+
+        :param public_id: Public id, e.g. taken from the request URL.
+        :type public_id: int
+        :return: return the primary key, deleted rows included.
+        :raises DoesNotExist: If no row has this public id.
+        :rtype: int
+        """
+        pk = cls.resolve_public_ids([public_id]).get(int(public_id))
+        if pk is None:
+            raise cls.DoesNotExist(
+                f"{cls._meta.object_name} matching public id {public_id} does not exist."
+            )
+        return pk
+
+    @classmethod
+    def resolve_public_ids(cls, public_ids):
+        """
+        This function is used to resolve public ids into primary keys.
+
+        Cached ids cost nothing, the others are fetched with a single query.
+
+        :param public_ids: Public ids to resolve.
+        :type public_ids: iterable
+        :return: return the primary key of each public id found.
+        :rtype: dict
+        """
+        public_ids = {int(public_id) for public_id in public_ids}
+        resolved = public_id_cache.get_many(cls, public_ids)
+        missing = public_ids - set(resolved)
+        if missing:
+            queryset = cls._base_manager.filter(public_id__in=missing)
+            fetched = dict(queryset.values_list("public_id", "pk"))
+            unknown = missing - set(fetched)
+            # a replica may lag, negative entries only come from the primary.
+            # The default alias is the primary of ReplicaRouter; asking its
+            # db_for_write would pin the whole request to the primary.
+            if unknown and queryset.db != DEFAULT_DB_ALIAS:
+                fetched.update(
+                    queryset.using(DEFAULT_DB_ALIAS)
+                    .filter(public_id__in=unknown)
+                    .values_list("public_id", "pk")
+                )
+            fetched.update(
+                (public_id, PublicIdCache.NOT_FOUND)
+                for public_id in missing - set(fetched)
+            )
+            public_id_cache.set_many(cls, fetched)
+            resolved.update(fetched)
+        return {
+            public_id: pk
+            for public_id, pk in resolved.items()
+            if pk != PublicIdCache.NOT_FOUND
+        }
+
+
+@receiver(post_save)
+def public_id_created(sender, instance, created, **kwargs):
+    # drop a negative entry cached before the row existed.
+    if created and isinstance(instance, UniqueIds):
+        public_id_cache.delete(sender, instance.public_id)
+
+
+@receiver(post_delete)
+def public_id_deleted(sender, instance, **kwargs):
+    if isinstance(instance, UniqueIds):
+        public_id_cache.delete(sender, instance.public_id)
+
 
 def is_safedelete_cls(cls):
     for base in cls.__bases__:
@@ -73,6 +577,65 @@ def is_safedelete(related):
     return is_safedelete_cls(related.__class__)
 
 
+# Rows updated per UPDATE statement by the bulk soft-delete engine.
+BULK_DELETE_CHUNK_SIZE = 1000
+
+# Sent once per chunk of rows soft-deleted or undeleted in bulk, with the
+# ``pks`` of the chunk, instead of the per instance safedelete signals.
+pre_bulk_softdelete = Signal()
+post_bulk_softdelete = Signal()
+post_bulk_undelete = Signal()
+
+
+class BulkSafeDeleteQueryset(SafeDeleteQueryset):
+    """Safedelete queryset soft-deleting and undeleting with set-based updates.
+
+    Soft deletes issue one ``UPDATE ... WHERE id IN (...)`` per model and chunk,
+    related rows included under ``SOFT_DELETE_CASCADE``, instead of saving
+    every row one by one.
+    """
+
+    def soft_delete(self, cascade=False):
+        """Soft-delete every model of the queryset.
+
+        Args:
+            cascade: Soft-delete the related objects too. (default: {False})
+        """
+        assert self.query.can_filter(), "Cannot use 'limit' or 'offset' with delete."
+        pks = list(self.values_list("pk", flat=True))
+        self._result_cache = None
+        return bulk_soft_delete(self.model, pks, using=self.db, cascade=cascade)
+
+    soft_delete.alters_data = True
+
+    def delete(self, force_policy=None):
+        current_policy = (
+            self.model._safedelete_policy if (force_policy is None) else force_policy
+        )
+        if current_policy in (SOFT_DELETE, SOFT_DELETE_CASCADE):
+            return self.soft_delete(cascade=current_policy == SOFT_DELETE_CASCADE)
+        elif current_policy in (HARD_DELETE, HARD_DELETE_CASCADE):
+            # Django's collector already deletes related objects per model.
+            return super(SafeDeleteQueryset, self).delete()
+        return super(BulkSafeDeleteQueryset, self).delete(force_policy=force_policy)
+
+    delete.alters_data = True
+
+    def undelete(self, force_policy=None):
+        assert self.query.can_filter(), "Cannot use 'limit' or 'offset' with undelete."
+        current_policy = force_policy or self.model._safedelete_policy
+        pks = list(self.values_list("pk", flat=True))
+        self._result_cache = None
+        return bulk_undelete(
+            self.model,
+            pks,
+            using=self.db,
+            cascade=current_policy == SOFT_DELETE_CASCADE,
+        )
+
+    undelete.alters_data = True
+
+
 class SafeDeleteModel(models.Model):
     """Abstract safedelete-ready model.
 
@@ -107,9 +670,9 @@ class SafeDeleteModel(models.Model):
 
     deleted = Bit1BooleanField(default=0, null=True)
 
-    objects = SafeDeleteManager()
-    all_objects = SafeDeleteAllManager()
-    deleted_objects = SafeDeleteDeletedManager()
+    objects = SafeDeleteManager(BulkSafeDeleteQueryset)
+    all_objects = SafeDeleteAllManager(BulkSafeDeleteQueryset)
+    deleted_objects = SafeDeleteDeletedManager(BulkSafeDeleteQueryset)
 
     class Meta:
         abstract = True
@@ -163,9 +726,12 @@ class SafeDeleteModel(models.Model):
 
         if current_policy == SOFT_DELETE_CASCADE:
 
-            for related in related_objects(self):
-                if is_safedelete_cls(related.__class__) and related.deleted:
-                    related.undelete()
+            # Undelete the related objects with one update per model
+            using = kwargs.get("using") or router.db_for_write(
+                self.__class__, instance=self
+            )
+            for model, pks in collect_cascade(self.__class__, [self.pk], using).items():
+                bulk_undelete(model, pks, using=using)
 
     def delete(self, force_policy=None, **kwargs):
         """Overrides Django's delete behaviour based on the model's delete policy.
@@ -193,11 +759,12 @@ class SafeDeleteModel(models.Model):
             hard_delete_no_cascade_policy(self)
         elif current_policy == SOFT_DELETE_CASCADE:
 
-            # Soft-delete on related objects before
-
-            for related in related_objects(self):
-                if is_safedelete_cls(related.__class__) and not related.deleted:
-                    related.delete(force_policy=SOFT_DELETE, **kwargs)
+            # Soft-delete on related objects before, one update per model
+            using = kwargs.get("using") or router.db_for_write(
+                self.__class__, instance=self
+            )
+            for model, pks in collect_cascade(self.__class__, [self.pk], using).items():
+                bulk_soft_delete(model, pks, using=using)
             # soft-delete the object
             self.delete(force_policy=SOFT_DELETE, **kwargs)
         elif current_policy == HARD_DELETE_CASCADE:
@@ -219,25 +786,50 @@ class SafeDeleteModel(models.Model):
 
     # We need to overwrite this check to ensure uniqueness is also checked
     # against "deleted" (but still in db) objects.
+    # All the checks of a model are OR-ed into one query, each row tells
+    # which checks it matched through a conditional annotation.
     # FIXME: Better/cleaner way ?
     def _perform_unique_checks(self, unique_checks):
         errors = {}
 
+        checks_by_model = {}
         for model_class, unique_check in unique_checks:
             lookup_kwargs = ensure_uniqueness(self, unique_check)
             if len(unique_check) != len(lookup_kwargs):
                 continue
+            checks_by_model.setdefault(model_class, []).append(
+                (unique_check, lookup_kwargs)
+            )
 
+        for model_class, checks in checks_by_model.items():
             # This is the changed line
             if hasattr(model_class, "all_objects"):
-                qs = model_class.all_objects.filter(**lookup_kwargs)
+                qs = model_class.all_objects.all()
             else:
-                qs = model_class._default_manager.filter(**lookup_kwargs)
+                qs = model_class._default_manager.all()
 
             model_class_pk = self._get_pk_val(model_class._meta)
             if not self._state.adding and model_class_pk is not None:
                 qs = qs.exclude(pk=model_class_pk)
-            if qs.exists():
+
+            matches = {}
+            for index, (_, lookup_kwargs) in enumerate(checks):
+                matches[f"unique_check_{index}"] = models.Case(
+                    models.When(models.Q(**lookup_kwargs), then=models.Value(True)),
+                    default=models.Value(False),
+                    output_field=models.BooleanField(),
+                )
+            condition = models.Q()
+            for _, lookup_kwargs in checks:
+                condition |= models.Q(**lookup_kwargs)
+            rows = qs.filter(condition).annotate(**matches).values(*matches)
+
+            failed = set()
+            for row in rows:
+                failed.update(name for name, matched in row.items() if matched)
+            for index, (unique_check, _) in enumerate(checks):
+                if f"unique_check_{index}" not in failed:
+                    continue
                 if len(unique_check) == 1:
                     key = unique_check[0]
                 else:
@@ -247,6 +839,94 @@ class SafeDeleteModel(models.Model):
                 )
         return errors
 
+    @classmethod
+    def bulk_unique_errors(cls, instances, exclude=()):
+        """Check the unique fields of many instances, one query per unique check.
+
+        Like ``_perform_unique_checks``, soft-deleted rows count as taken.
+        Values repeated inside ``instances`` are reported too. Text values are
+        compared under the collation of their column, so ``Foo@x.com`` clashes
+        with ``foo@x.com`` on a MySQL ``_ci`` column, as the database would.
+
+        Args:
+            instances: Instances of this model, saved or not.
+            exclude: Fields known to be unique already, e.g. generated ids,
+                the unique checks using any of them are skipped.
+
+        Returns:
+            list of the errors dict of each instance, in the order of ``instances``.
+        """
+        errors = [{} for _ in instances]
+        if not instances:
+            return errors
+        unique_checks, _ = instances[0]._get_unique_checks(exclude=exclude)
+
+        for model_class, unique_check in unique_checks:
+            lookups = [
+                ensure_uniqueness(instance, unique_check) for instance in instances
+            ]
+            values = [
+                tuple(lookup[name] for name in unique_check)
+                if len(lookup) == len(unique_check)
+                else None
+                for lookup in lookups
+            ]
+            wanted = {value for value in values if value is not None}
+            if not wanted:
+                continue
+
+            if hasattr(model_class, "all_objects"):
+                qs = model_class.all_objects.all()
+            else:
+                qs = model_class._default_manager.all()
+            # the router reads from the primary outside requests, in
+            # transactions and once the request wrote, see ReplicaRouter.
+            qs = qs.using(router.db_for_read(model_class))
+
+            # values are matched on their form under the column collation.
+            normalizers = [
+                get_collation_normalizer(model_class, name, qs.db)
+                for name in unique_check
+            ]
+
+            def normalize(value):
+                return tuple(
+                    normalizer(item) if normalizer and isinstance(item, str) else item
+                    for normalizer, item in zip(normalizers, value)
+                )
+
+            taken = {}
+            for chunk in chunked(wanted):
+                if len(unique_check) == 1:
+                    condition = models.Q(
+                        **{f"{unique_check[0]}__in": [v[0] for v in chunk]}
+                    )
+                else:
+                    condition = models.Q()
+                    for value in chunk:
+                        condition |= models.Q(**dict(zip(unique_check, value)))
+                for row in qs.filter(condition).values_list("pk", *unique_check):
+                    taken.setdefault(normalize(row[1:]), set()).add(row[0])
+
+            seen = set()
+            for instance, value, instance_errors in zip(instances, values, errors):
+                if value is None:
+                    continue
+                value = normalize(value)
+                others = taken.get(value, set()) - {
+                    instance._get_pk_val(model_class._meta)
+                }
+                if others or value in seen:
+                    if len(unique_check) == 1:
+                        key = unique_check[0]
+                    else:
+                        key = models.base.NON_FIELD_ERRORS
+                    instance_errors.setdefault(key, []).append(
+                        instance.unique_error_message(model_class, unique_check)
+                    )
+                seen.add(value)
+        return errors
+
 
 def soft_delete_policy(instance, **kwargs):
     instance.deleted = 1
@@ -268,11 +948,198 @@ def hard_delete_no_cascade_policy(instance, **kwargs):
 
 
 def hard_delete_cascade_policy(instance, **kwargs):
-    for related in related_objects(instance):
-        if is_safedelete_cls(related.__class__) and not related.deleted:
-            related.delete(force_policy=HARD_DELETE, **kwargs)
-    # hard-delete the object
-    instance.delete(force_policy=HARD_DELETE, **kwargs)
+    # Django's collector deletes the related objects with one query per model
+    # and chunk, before the object itself.
+    using = kwargs.get("using") or router.db_for_write(
+        instance.__class__, instance=instance
+    )
+    instance.__class__._base_manager.using(using).filter(pk=instance.pk).delete()
+
+
+def chunked(values, size=BULK_DELETE_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def collect_cascade(model, pks, using):
+    """Collect the safedelete rows a cascade from ``pks`` reaches.
+
+    The graph is walked through ``on_delete=CASCADE`` relations with one
+    ``values_list`` query per relation and chunk, no instance is loaded.
+
+    Args:
+        model: Model of the root objects.
+        pks: Primary keys of the root objects, not part of the result.
+        using: Database alias.
+
+    Returns:
+        dict of model to the list of primary keys of its related rows.
+    """
+    collected = {}
+    pending = [(model, list(pks))]
+    while pending:
+        parent, parent_pks = pending.pop()
+        for relation in parent._meta.related_objects:
+            related_model = relation.related_model
+            if (
+                relation.many_to_many
+                or relation.on_delete is not models.CASCADE
+                or not issubclass(related_model, SafeDeleteModel)
+            ):
+                continue
+            seen = collected.setdefault(related_model, set())
+            found = []
+            for chunk in chunked(parent_pks):
+                rows = related_model._base_manager.using(using).filter(
+                    **{f"{relation.field.name}__in": chunk}
+                )
+                found += [
+                    pk for pk in rows.values_list("pk", flat=True) if pk not in seen
+                ]
+            seen.update(found)
+            if found:
+                pending.append((related_model, found))
+    return {model: sorted(pks) for model, pks in collected.items() if pks}
+
+
+def bulk_soft_delete(model, pks, using=None, cascade=False):
+    """Soft-delete rows with one UPDATE per model and chunk.
+
+    Args:
+        model: Model of the rows.
+        pks: Primary keys of the rows.
+        using: Database alias. (default: {None})
+        cascade: Soft-delete the related rows too. (default: {False})
+
+    Returns:
+        tuple of the number of rows soft-deleted and a dict of that number per model.
+    """
+    return _bulk_set_deleted(model, pks, using, cascade, deleted=True)
+
+
+def bulk_undelete(model, pks, using=None, cascade=False):
+    """Undelete rows with one UPDATE per model and chunk.
+
+    Args:
+        model: Model of the rows.
+        pks: Primary keys of the rows.
+        using: Database alias. (default: {None})
+        cascade: Undelete the related rows too. (default: {False})
+
+    Returns:
+        tuple of the number of rows undeleted and a dict of that number per model.
+    """
+    return _bulk_set_deleted(model, pks, using, cascade, deleted=False)
+
+
+def _bulk_set_deleted(model, pks, using, cascade, deleted):
+    using = using or router.db_for_write(model)
+    targets = {model: list(pks)}
+    if cascade:
+        targets.update(collect_cascade(model, pks, using))
+
+    counts = {}
+    with transaction.atomic(using=using):
+        for target, target_pks in targets.items():
+            values = {"deleted": 1 if deleted else None}
+            if any(field.name == "updated" for field in target._meta.concrete_fields):
+                values["updated"] = timezone.now()
+            count = 0
+            for chunk in chunked(target_pks):
+                # only rows changing state are updated and signaled.
+                changed = list(
+                    target._base_manager.using(using)
+                    .filter(pk__in=chunk, deleted__isnull=deleted)
+                    .values_list("pk", flat=True)
+                )
+                if not changed:
+                    continue
+                if deleted:
+                    pre_bulk_softdelete.send(sender=target, pks=changed, using=using)
+                target._base_manager.using(using).filter(pk__in=changed).update(
+                    **values
+                )
+                signal = post_bulk_softdelete if deleted else post_bulk_undelete
+                signal.send(sender=target, pks=changed, using=using)
+                count += len(changed)
+            counts[target._meta.label] = count
+    return sum(counts.values()), counts
+
+
+def collation_normalizer(collation):
+    """Build the function giving the form a MySQL collation compares a text as.
+
+    Case-insensitive (``_ci``) collations are also accent-insensitive unless
+    ``_as_``, and all but the ``_0900_`` ones ignore trailing spaces.
+
+    Args:
+        collation: Collation name, e.g. ``utf8mb4_0900_ai_ci``.
+
+    Returns:
+        function normalizing a text, ``None`` when texts compare as they are.
+    """
+    collation = collation.lower()
+    pad_space = "_0900_" not in collation and collation != "binary"
+    case_insensitive = collation.endswith("_ci")
+    accent_insensitive = case_insensitive and "_as_" not in collation
+    if not (pad_space or case_insensitive):
+        return None
+
+    def normalize(value):
+        if pad_space:
+            value = value.rstrip(" ")
+        if accent_insensitive:
+            value = "".join(
+                char
+                for char in unicodedata.normalize("NFKD", value)
+                if not unicodedata.combining(char)
+            )
+        if case_insensitive:
+            value = value.casefold()
+        return value
+
+    return normalize
+
+
+# collation normalizer of each (alias, table, column), looked up once.
+_collation_normalizers = {}
+
+
+def get_collation_normalizer(model, field_name, using):
+    """Get the function giving the form the database compares a field's texts as.
+
+    Only MySQL compares texts other than as they are by default, the
+    collation of the column is read from ``information_schema`` once.
+
+    Args:
+        model: Model of the field.
+        field_name: Name of the field.
+        using: Database alias.
+
+    Returns:
+        function normalizing a text, ``None`` when texts compare as they are.
+    """
+    field = model._meta.get_field(field_name)
+    connection = connections[using]
+    if connection.vendor != "mysql" or not isinstance(
+        field, (models.CharField, models.TextField)
+    ):
+        return None
+    key = (using, model._meta.db_table, field.column)
+    if key not in _collation_normalizers:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COLLATION_NAME FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+                "AND COLUMN_NAME = %s",
+                [model._meta.db_table, field.column],
+            )
+            row = cursor.fetchone()
+        _collation_normalizers[key] = (
+            collation_normalizer(row[0]) if row and row[0] else None
+        )
+    return _collation_normalizers[key]
 
 
 def ensure_uniqueness(instance, unique_check):
@@ -305,6 +1172,43 @@ class SafeDeleteMixin(SafeDeleteModel):
         SafeDeleteModel.__init__(self, *args, **kwargs)
 
 
+def get_cache_version(cache, key):
+    """
+    This function is used to read a version number kept in a cache.
+
+    The version is seeded from the clock so that a version evicted from the
+    cache never comes back lower than the one it replaces.
+
+    :param cache: Cache holding the version.
+    :type cache: django.core.cache.backends.base.BaseCache
+    :param key: Cache key of the version.
+    :type key: str
+    :return: return the current version.
+    :rtype: int
+    """
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_cache_version(cache, key):
+    """
+    This function is used to bump a version number kept in a cache.
+
+    :param cache: Cache holding the version.
+    :type cache: django.core.cache.backends.base.BaseCache
+    :param key: Cache key of the version.
+    :type key: str
+    """
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), timeout=None)
+
+
 def validate_url_value(public_id, key_name):
     """
     This function is used to validate the public ids of URL.
@@ -336,6 +1240,36 @@ def validate_url_value(public_id, key_name):
         )
 
 
+def compile_alternate_scopes(required_alternate_scopes):
+    """
+    This function is used to compile the alternate scopes of a view.
+
+    :param required_alternate_scopes: Lists of alternative scope lists keyed by HTTP method.
+    :type required_alternate_scopes: dict
+    :return: return a tuple of frozensets keyed by upper cased HTTP method.
+    :rtype: dict
+    """
+    return {
+        method.upper(): tuple(frozenset(alt) for alt in alternatives)
+        for method, alternatives in required_alternate_scopes.items()
+    }
+
+
+class AlternateScopesMixin:
+    """
+    Compiles ``required_alternate_scopes`` once, when the view class is created,
+    so that ``CustomPermissions`` only runs set-subset tests per request.
+    """
+
+    required_alternate_scopes = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.compiled_alternate_scopes = compile_alternate_scopes(
+            cls.required_alternate_scopes
+        )
+
+
 class CustomPermissions(BasePermission):
     """
     :attr:alternate_required_scopes: dict keyed by HTTP method name with value: iterable alternate scope lists
@@ -347,6 +1281,7 @@ class CustomPermissions(BasePermission):
     [1](https://github.com/OAI/OpenAPI-Specification/blob/master/versions/3.0.0.md#securityRequirementObject)
 
     For each method, a list of lists of allowed scopes is tried in order and the first to match succeeds.
+    Every scope of an alternative is required, any one alternative is enough.
 
     @example
     required_alternate_scopes = {
@@ -354,41 +1289,267 @@ class CustomPermissions(BasePermission):
        'POST': [['create1','scope2'], ['alt-scope3'], ['alt-scope4','alt-scope5']],
     }
 
+    Views inheriting ``AlternateScopesMixin`` get their scopes compiled at import
+    time, other views are compiled on each check.
+
     TODO: DRY: subclass TokenHasScope and iterate over values of required_scope?
     """
 
     def has_permission(self, request, view):
-        required_alternate_scopes = getattr(view, "required_alternate_scopes")
-        m = request.method.upper()
-        if m in required_alternate_scopes:
-            for alt in required_alternate_scopes[m]:
-                user_scopes = list(
-                    {
-                        scope.name
-                        for role in request.user.user_roles.all()
-                        for scope in role.role_scopes.all()
-                    }
-                )
-                for alt_scope in alt:
-                    flag = False
-                    if alt_scope in user_scopes:
-                        flag = True
-            return flag
-        else:
+        # imported here, users.models depends on this module.
+        from users.utils import get_user_scopes
+
+        compiled_alternate_scopes = getattr(view, "compiled_alternate_scopes", None)
+        if compiled_alternate_scopes is None:
+            compiled_alternate_scopes = compile_alternate_scopes(
+                getattr(view, "required_alternate_scopes")
+            )
+        alternatives = compiled_alternate_scopes.get(request.method.upper())
+        if not alternatives:
             return False
+        user_scopes = get_user_scopes(request)
+        return any(alt <= user_scopes for alt in alternatives)
 
 
 # custom_storages.py
-from django.conf import settings
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
 from storages.backends.s3boto3 import S3Boto3Storage
 
 
-class StaticStorage(S3Boto3Storage):
+class CachedUrlMixin:
+    """
+    Storage mixin memoizing ``url()`` per file name.
+
+    Building an S3 URL, signed by default, costs an HMAC for every image of
+    every rendered page. URLs are kept in a per storage LRU of
+    ``settings.STORAGE_URL_CACHE_SIZE`` entries for at most
+    ``settings.STORAGE_URL_CACHE_TIMEOUT`` seconds, and a signed URL is never
+    kept past its expiry minus ``settings.STORAGE_URL_EXPIRY_MARGIN`` seconds,
+    so a cached URL always stays valid long enough for the browser to use it.
+    ``url_cache_hits`` counts the URL generations saved.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.url_cache_size = settings.STORAGE_URL_CACHE_SIZE
+        self.url_cache_hits = 0
+        self.url_cache_misses = 0
+        self._urls = OrderedDict()
+        self._urls_lock = threading.Lock()
+
+    def get_url_timeout(self, expire=None):
+        """
+        This function is used to get how long a generated url may be cached.
+
+        :param expire: Seconds the signed url is valid for, the storage default when ``None``.
+        :type expire: int
+        :return: return the number of seconds, ``0`` when it must not be cached.
+        :rtype: float
+        """
+        timeout = settings.STORAGE_URL_CACHE_TIMEOUT
+        if getattr(self, "querystring_auth", False):
+            if expire is None:
+                expire = self.querystring_expire
+            timeout = min(timeout, expire - settings.STORAGE_URL_EXPIRY_MARGIN)
+        return max(timeout, 0)
+
+    def url(self, name, *args, expire=None, **kwargs):
+        # custom parameters or methods are rare, always generated.
+        if args or kwargs:
+            return super().url(name, *args, expire=expire, **kwargs)
+        key = (name, expire)
+        now = time.monotonic()
+        with self._urls_lock:
+            entry = self._urls.get(key)
+            if entry is not None and entry[1] > now:
+                self._urls.move_to_end(key)
+                self.url_cache_hits += 1
+                return entry[0]
+            self.url_cache_misses += 1
+
+        url = super().url(name, expire=expire) if expire else super().url(name)
+        timeout = self.get_url_timeout(expire)
+        if timeout:
+            with self._urls_lock:
+                self._urls[key] = (url, now + timeout)
+                self._urls.move_to_end(key)
+                while len(self._urls) > self.url_cache_size:
+                    self._urls.popitem(last=False)
+        return url
+
+    def delete(self, name):
+        super().delete(name)
+        self.forget_url(name)
+
+    def forget_url(self, name):
+        with self._urls_lock:
+            for key in [key for key in self._urls if key[0] == name]:
+                del self._urls[key]
+
+    def url_cache_stats(self):
+        """
+        This function is used to report the url cache counters.
+
+        :return: return the hits (url generations saved), misses and size.
+        :rtype: dict
+        """
+        return {
+            "hits": self.url_cache_hits,
+            "misses": self.url_cache_misses,
+            "size": len(self._urls),
+        }
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """
+    This function is used to hash the content of a local file.
+
+    :param path: Path of the file.
+    :type path: str
+    :param chunk_size: Bytes read at a time.
+    :type chunk_size: int
+    :return: return the hex sha256 of the file.
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BulkUploadMixin:
+    """
+    S3 storage mixin uploading local files in parallel.
+
+    ``upload_file`` goes through the boto3 transfer manager, so files larger
+    than ``settings.AWS_S3_MULTIPART_THRESHOLD`` are sent as multipart uploads
+    of concurrent parts. The sha256 of every upload is kept in the object
+    metadata and a file whose content did not change is not sent again.
+    ``CacheControl`` is chosen per content type from
+    ``settings.AWS_S3_CACHE_CONTROL``.
+    """
+
+    digest_metadata_key = "sha256"
+
+    def get_object_parameters(self, name):
+        params = super().get_object_parameters(name)
+        content_type, _ = mimetypes.guess_type(name)
+        content_type = content_type or ""
+        for prefix, cache_control in settings.AWS_S3_CACHE_CONTROL.items():
+            if content_type.startswith(prefix):
+                params["CacheControl"] = cache_control
+                break
+        return params
+
+    def get_transfer_config(self):
+        return TransferConfig(
+            multipart_threshold=settings.AWS_S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.AWS_S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=settings.AWS_S3_MULTIPART_CONCURRENCY,
+        )
+
+    def get_digest(self, name):
+        # the boto3 connection is per thread, safe to call from a pool.
+        client = self.connection.meta.client
+        try:
+            head = client.head_object(Bucket=self.bucket_name, Key=name)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        return head["Metadata"].get(self.digest_metadata_key)
+
+    def upload_file(self, name, path):
+        """
+        This function is used to upload a local file unless it is unchanged.
+
+        :param name: Storage name of the file.
+        :type name: str
+        :param path: Local path of the file.
+        :type path: str
+        :return: return whether the file was sent.
+        :rtype: bool
+        """
+        key = self._normalize_name(self._clean_name(name))
+        digest = file_digest(path)
+        if self.get_digest(key) == digest:
+            return False
+        params = self._get_write_parameters(key)
+        params["Metadata"] = {self.digest_metadata_key: digest}
+        self.connection.meta.client.upload_file(
+            path,
+            self.bucket_name,
+            key,
+            ExtraArgs=params,
+            Config=self.get_transfer_config(),
+        )
+        self.forget_url(name)
+        return True
+
+
+def upload_with_save(storage, name, path):
+    """
+    This function is used to upload a local file to a storage without
+    ``upload_file``, e.g. ``FileSystemStorage``, unless it is unchanged.
+
+    A storage with local paths gets the file replaced atomically, readers see
+    the former or the new content, never a missing or partial file. Other
+    storages get the former file deleted, then the new one saved.
+
+    :param storage: Target storage.
+    :type storage: django.core.files.storage.Storage
+    :param name: Storage name of the file.
+    :type name: str
+    :param path: Local path of the file.
+    :type path: str
+    :return: return whether the file was sent.
+    :rtype: bool
+    """
+    digest = file_digest(path)
+    try:
+        target = storage.path(name)
+    except NotImplementedError:
+        target = None
+    if target is not None:
+        if os.path.exists(target) and file_digest(target) == digest:
+            return False
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+        # written next to the target, os.replace is atomic within a file system.
+        temporary = os.path.join(directory, f".upload-{uuid.uuid4().hex}")
+        try:
+            with open(temporary, "xb") as destination, open(path, "rb") as source:
+                shutil.copyfileobj(source, destination)
+            mode = getattr(storage, "file_permissions_mode", None)
+            if mode is not None:
+                os.chmod(temporary, mode)
+            os.replace(temporary, target)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+        return True
+    if storage.exists(name):
+        with storage.open(name) as current:
+            existing = hashlib.sha256()
+            for chunk in current.chunks():
+                existing.update(chunk)
+        if existing.hexdigest() == digest:
+            return False
+        storage.delete(name)
+    with open(path, "rb") as f:
+        storage.save(name, File(f))
+    return True
+
+
+class StaticStorage(BulkUploadMixin, CachedUrlMixin, S3Boto3Storage):
     default_acl = "public-read"
     location = settings.STATICFILES_LOCATION
 
 
-class MediaStorage(S3Boto3Storage):
+class MediaStorage(BulkUploadMixin, CachedUrlMixin, S3Boto3Storage):
     location = settings.MEDIAFILES_LOCATION
     default_acl = "public-read"
     file_overwrite = False
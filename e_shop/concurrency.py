@@ -0,0 +1,143 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_orm_executor():
+    """
+    This function is used to get the thread pool running the sync code of async views.
+
+    :return: return the pool of ``settings.ASYNC_ORM_WORKERS`` threads.
+    :rtype: concurrent.futures.ThreadPoolExecutor
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_ORM_WORKERS, thread_name_prefix="orm"
+            )
+        return _executor
+
+
+def orm_to_async(func):
+    """
+    This function is used to call sync ORM code from an async view.
+
+    Unlike ``sync_to_async(thread_sensitive=True)``, which runs every call of
+    the process on one thread, calls are spread over a bounded pool so that
+    at most ``settings.ASYNC_ORM_WORKERS`` database connections are open per
+    process. Connections are closed or kept after each call following
+    ``CONN_MAX_AGE``, as at the end of a sync request.
+
+    :param func: Sync function, e.g. a render reading lazy querysets.
+    :type func: callable
+    :return: return an awaitable version of ``func``.
+    :rtype: callable
+    """
+
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call, thread_sensitive=False, executor=get_orm_executor())
+
+
+def async_view(view):
+    """
+    This function is used to serve a sync view, e.g. a DRF view, as an async view.
+
+    Under ASGI, Django runs sync views one at a time per process on its
+    thread sensitive executor, wrapped views run concurrently on the ORM pool
+    and their response is rendered there.
+
+    :param view: Sync view function, e.g. ``ViewSet.as_view({...})``.
+    :type view: callable
+    :return: return the async view.
+    :rtype: callable
+    """
+
+    def call(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        # rendered on the pool too, Django would do it on its single thread.
+        if callable(getattr(response, "render", None)):
+            response.render()
+        return response
+
+    async def wrapper(request, *args, **kwargs):
+        return await orm_to_async(call)(request, *args, **kwargs)
+
+    wrapper.csrf_exempt = getattr(view, "csrf_exempt", False)
+    return wrapper
+
+
+def read_parts(parts, size):
+    """
+    This function is used to read the next parts of a streaming response.
+
+    :param parts: Iterator of a ``StreamingHttpResponse``.
+    :type parts: iterator
+    :param size: Bytes to read at least, unless the stream ends first.
+    :type size: int
+    :return: return the parts joined, empty once the stream is exhausted.
+    :rtype: bytes
+    """
+    buffer, read = [], 0
+    for part in parts:
+        buffer.append(part)
+        read += len(part)
+        if read >= size:
+            break
+    return b"".join(buffer)
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    ASGI handler reading streaming responses on the ORM pool.
+
+    Django 3.2 iterates a ``StreamingHttpResponse`` on the event loop, where
+    the queries of e.g. the product export raise ``SynchronousOnlyOperation``
+    and would block every other request meanwhile. Parts are read here with
+    ``orm_to_async``, at least ``STREAM_BUFFER_SIZE`` bytes per call.
+    """
+
+    STREAM_BUFFER_SIZE = 64 * 1024
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode("ascii")
+            if isinstance(value, str):
+                value = value.encode("latin1")
+            headers.append((bytes(header), bytes(value)))
+        for c in response.cookies.values():
+            headers.append((b"Set-Cookie", c.output(header="").encode("ascii").strip()))
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": headers,
+            }
+        )
+        # Access ``__iter__`` and not ``streaming_content``, as Django does.
+        parts = iter(response)
+        read = orm_to_async(read_parts)
+        while True:
+            body = await read(parts, self.STREAM_BUFFER_SIZE)
+            if not body:
+                break
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+        await send({"type": "http.response.body"})
+        await orm_to_async(response.close)()
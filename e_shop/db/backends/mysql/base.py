@@ -0,0 +1,121 @@
+"""
+MySQL backend checking connections out of a per process ``ConnectionPool``.
+
+Use it as ``ENGINE`` with the pool options under ``POOL``, all optional::
+
+    "ENGINE": "e_shop.db.backends.mysql",
+    "CONN_MAX_AGE": 0,
+    "POOL": {
+        "MAX_SIZE": 10,
+        "TIMEOUT": 10,
+        "IDLE_TIMEOUT": 300,
+        "PRE_PING": True,
+        "PING_INTERVAL": 1,
+    },
+
+Closing a connection, at the end of every request with ``CONN_MAX_AGE = 0``,
+gives it back to the pool, so threads share ``MAX_SIZE`` connections and
+requests skip the connect handshake.
+"""
+import threading
+
+from django.db.backends.mysql.base import Database
+from django.db.backends.mysql.base import DatabaseWrapper as MySQLDatabaseWrapper
+
+from e_shop.db.pool import ConnectionPool, PoolTimeout
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict, connect):
+    """
+    This function is used to get the pool of a database alias, created on first use.
+
+    :param alias: Database alias, e.g. ``default``.
+    :type alias: str
+    :param settings_dict: Settings of the database.
+    :type settings_dict: dict
+    :param connect: Opens a new raw connection.
+    :type connect: callable
+    :return: return the pool.
+    :rtype: e_shop.db.pool.ConnectionPool
+    """
+    with _pools_lock:
+        if alias not in _pools:
+            options = settings_dict.get("POOL", {})
+            _pools[alias] = ConnectionPool(
+                connect,
+                lambda conn: conn.ping(),
+                max_size=options.get("MAX_SIZE", 10),
+                timeout=options.get("TIMEOUT", 10.0),
+                idle_timeout=options.get("IDLE_TIMEOUT", 300.0),
+                pre_ping=options.get("PRE_PING", True),
+                ping_interval=options.get("PING_INTERVAL", 1.0),
+            )
+        return _pools[alias]
+
+
+def pool_stats():
+    """
+    This function is used to report the metrics of every pool of the process.
+
+    :return: return the ``ConnectionPool.stats()`` of each database alias.
+    :rtype: dict
+    """
+    with _pools_lock:
+        pools = dict(_pools)
+    return {alias: pool.stats() for alias, pool in pools.items()}
+
+
+def close_idle_pools():
+    """
+    This function is used to close the idle connections of every pool of the
+    process, e.g. in the gunicorn ``pre_fork`` hook so that workers never share
+    a socket with the arbiter.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
+
+
+class DatabaseWrapper(MySQLDatabaseWrapper):
+    @property
+    def pool(self):
+        return get_pool(
+            self.alias,
+            self.settings_dict,
+            lambda: super(DatabaseWrapper, self).get_new_connection(
+                self.get_connection_params()
+            ),
+        )
+
+    def get_new_connection(self, conn_params):
+        try:
+            connection, self._pooled_fresh = self.pool.checkout()
+        except PoolTimeout as e:
+            raise Database.OperationalError(str(e)) from e
+        return connection
+
+    def init_connection_state(self):
+        # session variables survive in the pool, set them once per connection.
+        if self._pooled_fresh:
+            super().init_connection_state()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # a connection closed inside an atomic block stays referenced here,
+        # and one that raised may be broken, neither can be shared.
+        if self.in_atomic_block or self.errors_occurred:
+            self.pool.discard(self.connection)
+            return
+        try:
+            if not self.get_autocommit():
+                self.connection.rollback()
+                self.connection.autocommit(self.settings_dict["AUTOCOMMIT"])
+        except Database.Error:
+            self.pool.discard(self.connection)
+        else:
+            self.pool.checkin(self.connection)
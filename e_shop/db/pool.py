@@ -0,0 +1,215 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection could be checked out within the pool timeout.
+    """
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of raw DB-API connections, independent of the driver.
+
+    At most ``max_size`` connections are open at a time, a checkout waits up
+    to ``timeout`` seconds for one to be returned before raising
+    ``PoolTimeout``. Idle connections are reused last in, first out, closed
+    once idle for more than ``idle_timeout`` seconds and, with ``pre_ping``,
+    pinged before reuse when idle for more than ``ping_interval`` seconds, a
+    connection failing the ping is replaced by a new one. A connection still
+    checked out by a thread that exited, e.g. a thread that never closed its
+    Django connection, is closed and its slot reclaimed once the pool is full.
+
+    :param connect: Opens a new connection.
+    :type connect: callable
+    :param ping: Raises if a connection is no longer usable.
+    :type ping: callable
+    """
+
+    def __init__(
+        self,
+        connect,
+        ping,
+        max_size=10,
+        timeout=10.0,
+        idle_timeout=300.0,
+        pre_ping=True,
+        ping_interval=1.0,
+    ):
+        self.connect = connect
+        self.ping = ping
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.pre_ping = pre_ping
+        self.ping_interval = ping_interval
+        # (connection, returned at) of the idle connections, newest last.
+        self._idle = deque()
+        self._size = 0
+        # id of each checked out connection: (connection, checking out thread),
+        # no thread for the held ones.
+        self._in_use = {}
+        self._available = threading.Condition(threading.Lock())
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+        self.evictions = 0
+        self.ping_failures = 0
+        self.reclaims = 0
+
+    def checkout(self, held=False):
+        """
+        This function is used to take a connection from the pool, opening one if needed.
+
+        :param held: Whether the connection stays checked out for good, e.g.
+            the one holding a named lock, it is then never reclaimed.
+        :type held: bool
+        :return: return the connection and whether it was just opened.
+        :rtype: tuple
+        :raises PoolTimeout: If ``max_size`` connections stay in use for ``timeout`` seconds.
+        """
+        started = time.monotonic()
+        waited = False
+        with self._available:
+            while True:
+                self._evict_idle()
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size >= self.max_size:
+                    self._reclaim_dead()
+                if self._size < self.max_size:
+                    # reserved now, opened outside of the lock.
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f"No connection available within {self.timeout}s, "
+                        f"all {self.max_size} are in use."
+                    )
+                waited = True
+                self._available.wait(remaining)
+            self.checkouts += 1
+            if waited:
+                wait_time = time.monotonic() - started
+                self.waits += 1
+                self.wait_time += wait_time
+                self.max_wait_time = max(self.max_wait_time, wait_time)
+
+        if conn is not None:
+            if not self.pre_ping or time.monotonic() - returned_at < self.ping_interval:
+                return self._track(conn, held), False
+            try:
+                self.ping(conn)
+                return self._track(conn, held), False
+            except Exception:
+                self.ping_failures += 1
+                self._close(conn)
+        try:
+            return self._track(self.connect(), held), True
+        except Exception:
+            self.discard(None)
+            raise
+
+    def checkin(self, conn):
+        """
+        This function is used to give a healthy connection back to the pool.
+
+        :param conn: Connection returned by ``checkout``.
+        :type conn: object
+        """
+        with self._available:
+            self._in_use.pop(id(conn), None)
+            self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def discard(self, conn):
+        """
+        This function is used to close a checked out connection instead of returning it.
+
+        :param conn: Connection returned by ``checkout``, ``None`` for a failed open.
+        :type conn: object
+        """
+        if conn is not None:
+            self._close(conn)
+        with self._available:
+            self._in_use.pop(id(conn), None)
+            self._size -= 1
+            self._available.notify()
+
+    def close_idle(self):
+        """
+        This function is used to close every idle connection, e.g. before a fork,
+        see ``e_shop.db.backends.mysql.base.close_idle_pools``.
+        """
+        with self._available:
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            self._available.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        """
+        This function is used to report the pool usage and wait metrics.
+
+        :return: return the counters, times in seconds.
+        :rtype: dict
+        """
+        with self._available:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max_size": self.max_size,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_time": self.wait_time,
+                "max_wait_time": self.max_wait_time,
+                "timeouts": self.timeouts,
+                "evictions": self.evictions,
+                "ping_failures": self.ping_failures,
+                "reclaims": self.reclaims,
+            }
+
+    def _evict_idle(self):
+        # oldest first, called with the lock held.
+        deadline = time.monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][1] < deadline:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self.evictions += 1
+            self._close(conn)
+
+    def _track(self, conn, held=False):
+        with self._available:
+            self._in_use[id(conn)] = (
+                conn,
+                None if held else threading.current_thread(),
+            )
+        return conn
+
+    def _reclaim_dead(self):
+        # called with the lock held, the owners can no longer check them in.
+        for key, (conn, thread) in list(self._in_use.items()):
+            if thread is not None and not thread.is_alive():
+                del self._in_use[key]
+                self._size -= 1
+                self.reclaims += 1
+                self._close(conn)
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            logger.debug("Closing a pooled connection failed.", exc_info=True)
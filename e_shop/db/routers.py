@@ -0,0 +1,131 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+
+class PinState:
+    """
+    Whether reads must go to the primary, and whether the current unit of
+    work, e.g. a request, wrote to it.
+    """
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_pin_state = contextvars.ContextVar("db_pin_state", default=None)
+
+
+def start_pin(pinned=False):
+    """
+    This function is used to start tracking writes, e.g. at the start of a request.
+
+    :param pinned: Send reads to the primary from the start, e.g. after a recent write.
+    :type pinned: bool
+    :return: return the state, read once the work is done.
+    :rtype: PinState
+    """
+    state = PinState(pinned)
+    _pin_state.set(state)
+    return state
+
+
+@contextmanager
+def pin_primary():
+    """
+    This function is used to read from the primary within a block, e.g. right
+    after a write made by another process.
+    """
+    token = _pin_state.set(PinState(pinned=True))
+    try:
+        yield
+    finally:
+        _pin_state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of ``settings.DATABASE_REPLICA_APPS`` models to a replica.
+
+    Replicas are the ``settings.DATABASE_REPLICAS`` aliases, picked at random,
+    for the reads of requests, see ``start_pin``. Reads go to the primary
+    instead:
+
+    - outside of a request, e.g. in the ``IndexWorker`` thread, management
+      commands and background jobs, which often read rows right after they
+      were written;
+    - once the current request (or ``pin_primary`` block) wrote, and for the
+      next ``settings.DATABASE_PIN_SECONDS`` seconds of the same client, see
+      ``ReplicaPinMiddleware``, so users read their own writes;
+    - inside a transaction on the primary;
+    - when no replica is reachable, a replica failing to connect is skipped
+      for ``settings.DATABASE_REPLICA_RETRY`` seconds.
+    """
+
+    def __init__(self):
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in settings.DATABASE_REPLICA_APPS:
+            return None
+        state = _pin_state.get()
+        if state is None or state.pinned:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return self.get_replica()
+
+    def db_for_write(self, model, **hints):
+        state = _pin_state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+    def get_replica(self):
+        """
+        This function is used to pick a reachable replica.
+
+        :return: return the replica alias, the primary alias when none is reachable.
+        :rtype: str
+        """
+        now = time.monotonic()
+        with self._lock:
+            replicas = [
+                alias
+                for alias in settings.DATABASE_REPLICAS
+                if self._down_until.get(alias, 0) <= now
+            ]
+        random.shuffle(replicas)
+        for alias in replicas:
+            try:
+                # a no-op when the thread is already connected.
+                connections[alias].ensure_connection()
+            except OperationalError:
+                logger.warning(f"Replica {alias} is unreachable, reading from primary.")
+                with self._lock:
+                    self._down_until[alias] = now + settings.DATABASE_REPLICA_RETRY
+                continue
+            return alias
+        return DEFAULT_DB_ALIAS
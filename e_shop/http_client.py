@@ -0,0 +1,236 @@
+import bisect
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from elasticsearch import RequestsHttpConnection, TransportError
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import EmptyPoolError
+from urllib3.util.retry import Retry
+
+# upper bounds, in seconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class JitterRetry(Retry):
+    """
+    ``Retry`` adding up to ``jitter`` seconds at random to every backoff, so
+    that clients failing together do not retry in lockstep.
+    """
+
+    def __init__(self, *args, jitter=0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.jitter = jitter
+
+    def new(self, **kw):
+        kw.setdefault("jitter", self.jitter)
+        return super().new(**kw)
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return 0
+        return backoff + random.uniform(0, self.jitter)
+
+
+def bounded_pool(pool_class, pool_timeout):
+    """
+    This function is used to make a urllib3 connection pool class wait at most
+    ``pool_timeout`` seconds for a free connection, ``requests`` never passes one.
+
+    :param pool_class: ``HTTPConnectionPool`` or ``HTTPSConnectionPool``.
+    :type pool_class: type
+    :param pool_timeout: Seconds a call waits for a connection of a full pool.
+    :type pool_timeout: float
+    :return: return the subclass.
+    :rtype: type
+    """
+
+    class BoundedPool(pool_class):
+        def _get_conn(self, timeout=None):
+            return super()._get_conn(pool_timeout if timeout is None else timeout)
+
+    return BoundedPool
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    ``HTTPAdapter`` whose calls wait at most ``pool_timeout`` seconds for a
+    connection of a full, blocking pool, then raise ``ConnectionError``.
+    """
+
+    def __init__(self, *args, pool_timeout=None, **kwargs):
+        self.pool_timeout = pool_timeout
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: bounded_pool(pool_class, self.pool_timeout)
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def send(self, request, *args, **kwargs):
+        try:
+            return super().send(request, *args, **kwargs)
+        except EmptyPoolError as e:
+            raise requests.ConnectionError(e, request=request)
+
+
+class LatencyHistogram:
+    """
+    Counts of call durations per ``LATENCY_BUCKETS`` bucket, the last count
+    being the calls slower than the last bound.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+
+    def to_dict(self):
+        calls = sum(self.counts)
+        return {
+            "buckets": dict(zip(LATENCY_BUCKETS + ("+Inf",), self.counts)),
+            "calls": calls,
+            "mean": self.total / calls if calls else 0.0,
+        }
+
+
+class OutboundSession(requests.Session):
+    """
+    ``requests.Session`` with a default timeout, recording the latency of every
+    call, retries included, per host and status.
+    """
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+        self.histograms = {}
+        self._histograms_lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = super().request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            self.observe(urlsplit(url).netloc, status, time.perf_counter() - started)
+
+    def observe(self, host, status, seconds):
+        with self._histograms_lock:
+            histogram = self.histograms.get((host, status))
+            if histogram is None:
+                histogram = self.histograms[(host, status)] = LatencyHistogram()
+            histogram.observe(seconds)
+
+
+def create_session():
+    """
+    This function is used to build an outbound session from ``settings.OUTBOUND_HTTP``.
+
+    Connections are kept alive in one pool per host of at most
+    ``POOL_MAXSIZE`` connections, a call waits up to ``POOL_TIMEOUT`` seconds
+    for a free one rather than opening more. Connection errors and ``RETRY_STATUSES`` responses of
+    idempotent methods are retried ``RETRIES`` times with an exponential
+    backoff of ``BACKOFF`` seconds plus up to ``JITTER`` seconds.
+
+    :return: return the session.
+    :rtype: OutboundSession
+    """
+    options = settings.OUTBOUND_HTTP
+    session = OutboundSession(timeout=options["TIMEOUT"])
+    retry = JitterRetry(
+        total=options["RETRIES"],
+        backoff_factor=options["BACKOFF"],
+        jitter=options["JITTER"],
+        status_forcelist=options["RETRY_STATUSES"],
+        raise_on_status=False,
+    )
+    adapter = PooledAdapter(
+        pool_connections=options["POOL_CONNECTIONS"],
+        pool_maxsize=options["POOL_MAXSIZE"],
+        pool_block=True,
+        pool_timeout=options["POOL_TIMEOUT"],
+        max_retries=retry,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    This function is used to get the outbound session of the process.
+
+    Sockets are not shared with forked processes, a new session is created
+    in each one.
+
+    :return: return the shared session, safe to use from several threads.
+    :rtype: OutboundSession
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session, _session_pid = create_session(), os.getpid()
+        return _session
+
+
+def latency_histograms():
+    """
+    This function is used to report the latency of the outbound calls of the process.
+
+    :return: return the histogram of each ``"host status"``.
+    :rtype: dict
+    """
+    session = get_session()
+    with session._histograms_lock:
+        return {
+            f"{host} {status}": histogram.to_dict()
+            for (host, status), histogram in session.histograms.items()
+        }
+
+
+class OutboundHttpConnection(RequestsHttpConnection):
+    """
+    Elasticsearch connection sending its requests over the pooled adapters of
+    ``get_session()``, its retries and pool limits included, and recording
+    their latency in the histograms of ``latency_histograms()``. The session
+    of the connection keeps the auth, TLS and headers of its host.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for prefix, adapter in get_session().adapters.items():
+            self.session.mount(prefix, adapter)
+
+    def perform_request(self, method, url, *args, **kwargs):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = super().perform_request(method, url, *args, **kwargs)
+            status = response[0]
+            return response
+        except TransportError as e:
+            if isinstance(e.status_code, int):
+                status = e.status_code
+            raise
+        finally:
+            get_session().observe(
+                urlsplit(self.host).netloc, status, time.perf_counter() - started
+            )
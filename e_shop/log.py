@@ -0,0 +1,103 @@
+import atexit
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+
+# attributes every LogRecord has, anything else was passed with ``extra``.
+RECORD_ATTRIBUTES = frozenset(
+    logging.LogRecord("", 0, "", 0, "", None, None).__dict__
+) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats every record as one JSON object per line.
+
+    The fields passed through ``extra`` are written next to the standard ones,
+    e.g. the timings of the request logs.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value)
+            for key, value in record.__dict__.items()
+            if key not in RECORD_ATTRIBUTES
+        )
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    ``QueueHandler`` dropping records rather than blocking on a full queue.
+
+    When the queue is full, new records are counted in ``dropped``. The
+    constructor is the standard one, so Python 3.12 ``dictConfig`` can build
+    it with ``queue`` and ``listener`` too. ``close()`` stops the attached
+    ``listener`` after it wrote the queued records.
+    """
+
+    listener = None
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def close(self):
+        # stop() flushes the queue, it must only run once.
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
+
+
+def queue_handler(handlers, queue_size=10000, respect_handler_level=True):
+    """
+    This function is used to build a queue handler and start its listener.
+
+    Logging from a request only formats the message and puts it on an
+    in-memory queue of ``queue_size`` records, the writes of the sink
+    ``handlers`` and their lock happen on the listener thread. The
+    ``dictConfig`` factory (``"()"``) bypasses the special handling of
+    ``QueueHandler`` classes, which differs between Python versions::
+
+        "queue": {
+            "()": "e_shop.log.queue_handler",
+            "handlers": ["cfg://handlers.file"],
+        }
+
+    The listener thread does not survive a fork, so logging must be
+    configured in the worker processes (the default, without ``--preload``).
+
+    :param handlers: Sink handlers, ``cfg://`` references of ``dictConfig``.
+    :type handlers: list
+    :param queue_size: Records kept waiting before new ones are dropped.
+    :type queue_size: int
+    :param respect_handler_level: Whether the listener applies the level of
+        each sink handler.
+    :type respect_handler_level: bool
+    :return: return the handler, its listener started.
+    :rtype: DroppingQueueHandler
+    """
+    handler = DroppingQueueHandler(Queue(queue_size))
+    # indexing resolves the ``cfg://`` references of dictConfig.
+    handlers = [handlers[i] for i in range(len(handlers))]
+    handler.listener = QueueListener(
+        handler.queue, *handlers, respect_handler_level=respect_handler_level
+    )
+    handler.listener.start()
+    atexit.register(handler.close)
+    return handler
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils.functional import LazyObject, empty
+
+from e_shop.db.routers import start_pin
+
+logger = logging.getLogger("e_shop.requests")
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting the queries of a request and their time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def resolved_user(request):
+    """
+    This function is used to get the user of a request, if it was resolved.
+
+    ``AuthenticationMiddleware`` sets a lazy user, loaded from the session on
+    first access. Loading it only to log it would cost queries, and raise
+    ``SynchronousOnlyOperation`` on the event loop of an async view.
+
+    :param request: Request, after the view returned.
+    :type request: django.http.HttpRequest
+    :return: return the user the view authenticated, ``None`` otherwise.
+    :rtype: users.models.User
+    """
+    user = getattr(request, "user", None)
+    if isinstance(user, LazyObject):
+        # DRF replaces the lazy user with the one it authenticated.
+        user = None if user._wrapped is empty else user._wrapped
+    return user
+
+
+class RequestLogMiddleware:
+    """
+    Logs one structured record per request on the ``e_shop.requests`` logger.
+
+    The record carries the method, path, status, response size, user, when
+    the view resolved it, and the timings: total ``duration_ms``, and the number of database queries with
+    their ``db_ms`` when served synchronously. Streamed responses are logged
+    once the view returned, before their content is sent.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # marks the instance as a coroutine function, as MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not logger.isEnabledFor(logging.INFO):
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        self.log(request, response, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        if not logger.isEnabledFor(logging.INFO):
+            return await self.get_response(request)
+
+        # queries run on other threads, their timings are not collected.
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.log(request, response, time.perf_counter() - started)
+        return response
+
+    def log(self, request, response, duration, timer=None):
+        user = resolved_user(request)
+        fields = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "bytes": None if response.streaming else len(response.content),
+            "user": user.pk if user is not None and user.is_authenticated else None,
+            "duration_ms": round(duration * 1000, 2),
+        }
+        if timer is not None:
+            fields["db_queries"] = timer.count
+            fields["db_ms"] = round(timer.duration * 1000, 2)
+        logger.info("request", extra=fields)
+
+
+class ReplicaPinMiddleware:
+    """
+    Keeps a client reading from the primary database right after it wrote.
+
+    A request that wrote sets the ``db_pin`` cookie for
+    ``settings.DATABASE_PIN_SECONDS`` seconds, and ``ReplicaRouter`` sends the
+    reads of requests carrying it to the primary, so the client reads its
+    own writes whatever the replication lag.
+    """
+
+    cookie_name = "db_pin"
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        state = start_pin(self.cookie_name in request.COOKIES)
+        return self.pin(self.get_response(request), state)
+
+    async def __acall__(self, request):
+        state = start_pin(self.cookie_name in request.COOKIES)
+        return self.pin(await self.get_response(request), state)
+
+    def pin(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                self.cookie_name,
+                "1",
+                max_age=settings.DATABASE_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
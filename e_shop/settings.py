@@ -12,10 +12,13 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 import logging
 import os
 import re
+import tempfile
 from pathlib import Path
 
 import environ
 
+from e_shop.http_client import OutboundHttpConnection
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -58,11 +61,30 @@ INSTALLED_APPS = [
     "storages",
 ]
 
+# Requests go through the pools and retries of e_shop.http_client, the
+# transport does not retry on top of them. The async client of async views
+# drops both options, see store.services.async_client_options.
 ELASTICSEARCH_DSL = {
-    "default": {"hosts": "http://127.0.0.1:9200"},
+    "default": {
+        "hosts": "http://127.0.0.1:9200",
+        "connection_class": OutboundHttpConnection,
+        "max_retries": 0,
+    },
+}
+
+# Saves and deletes queue their index operations, a background worker sends
+# them with the _bulk API, see store.indexing.
+ELASTICSEARCH_DSL_SIGNAL_PROCESSOR = "store.indexing.QueuedSignalProcessor"
+ELASTICSEARCH_INDEX_QUEUE = {
+    "BATCH_SIZE": env.int("ELASTICSEARCH_INDEX_BATCH_SIZE", default=500),
+    "FLUSH_INTERVAL": env.float("ELASTICSEARCH_INDEX_FLUSH_INTERVAL", default=1.0),
+    "MAX_RETRIES": env.int("ELASTICSEARCH_INDEX_MAX_RETRIES", default=3),
+    "RETRY_BACKOFF": 0.5,
 }
 
 MIDDLEWARE = [
+    "e_shop.middleware.RequestLogMiddleware",
+    "e_shop.middleware.ReplicaPinMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -96,17 +118,116 @@ WSGI_APPLICATION = "e_shop.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# DB_POOL checks connections out of a per process pool (e_shop.db.pool),
+# returned to it at the end of every request. Otherwise connections persist
+# per thread for DB_CONN_MAX_AGE seconds.
+DB_POOL = env.bool("DB_POOL", default=False)
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.mysql",
+        "ENGINE": "e_shop.db.backends.mysql" if DB_POOL else "django.db.backends.mysql",
         "NAME": "e_shop",
         "HOST": "127.0.0.1",
         "PORT": "3306",
         "USER": "eshop",
         "PASSWORD": "Password@123",
+        "CONN_MAX_AGE": 0 if DB_POOL else env.int("DB_CONN_MAX_AGE", default=60),
+        "POOL": {
+            "MAX_SIZE": env.int("DB_POOL_MAX_SIZE", default=10),
+            "TIMEOUT": env.float("DB_POOL_TIMEOUT", default=10.0),
+            "IDLE_TIMEOUT": env.float("DB_POOL_IDLE_TIMEOUT", default=300.0),
+            "PRE_PING": env.bool("DB_POOL_PRE_PING", default=True),
+            "PING_INTERVAL": env.float("DB_POOL_PING_INTERVAL", default=1.0),
+        },
+    },
+}
+
+# Read replicas of "default", one alias per DB_REPLICA_HOSTS entry. Reads of
+# the DATABASE_REPLICA_APPS models go to them, see e_shop.db.routers.
+DATABASE_REPLICAS = []
+for index, host in enumerate(env.list("DB_REPLICA_HOSTS", default=[])):
+    alias = f"replica{index + 1}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["e_shop.db.routers.ReplicaRouter"]
+DATABASE_REPLICA_APPS = ("store", "users")
+# seconds a client keeps reading from the primary after writing.
+DATABASE_PIN_SECONDS = env.int("DB_PIN_SECONDS", default=5)
+# seconds an unreachable replica is skipped.
+DATABASE_REPLICA_RETRY = env.int("DB_REPLICA_RETRY", default=30)
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# The default cache holds the catalog fragments and pages and the version
+# invalidating them, it must be shared by every process serving the site.
+# CACHE_LOCATION=127.0.0.1:11211 selects memcached, needed when several hosts
+# serve the site. Without it the cache is kept in files under CACHE_DIR,
+# shared by the processes of one host, e.g. the gunicorn workers.
+CACHE_LOCATION = env.str("CACHE_LOCATION", default=None)
+CACHE_DIR = env.str(
+    "CACHE_DIR", default=os.path.join(tempfile.gettempdir(), "e_shop_cache")
+)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+        "LOCATION": CACHE_LOCATION,
+    }
+    if CACHE_LOCATION
+    else {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": CACHE_DIR,
+        # entries are culled past MAX_ENTRIES, by listing the directory.
+        "OPTIONS": {"MAX_ENTRIES": 10000},
     },
+    # Resolved role scopes per user, least recently used entries are culled
+    # once MAX_ENTRIES is reached. The cache is local to each worker process,
+    # TIMEOUT bounds how long another process can serve stale scopes.
+    "scopes": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "user-scopes",
+        "TIMEOUT": env.int("SCOPES_CACHE_TIMEOUT", default=300),
+        "OPTIONS": {"MAX_ENTRIES": env.int("SCOPES_CACHE_MAX_ENTRIES", default=10000)},
+    },
+}
+
+# Outbound HTTP calls, through e_shop.http_client.get_session(). TIMEOUT is
+# (connect, read) seconds, POOL_MAXSIZE the kept-alive connections per host
+# and POOL_TIMEOUT the seconds a call waits for one of them.
+OUTBOUND_HTTP = {
+    "TIMEOUT": (3.05, env.float("OUTBOUND_HTTP_READ_TIMEOUT", default=10.0)),
+    "RETRIES": env.int("OUTBOUND_HTTP_RETRIES", default=3),
+    "BACKOFF": 0.3,
+    "JITTER": 0.3,
+    "RETRY_STATUSES": (502, 503, 504),
+    "POOL_CONNECTIONS": 10,
+    "POOL_MAXSIZE": env.int("OUTBOUND_HTTP_POOL_MAXSIZE", default=10),
+    "POOL_TIMEOUT": env.float("OUTBOUND_HTTP_POOL_TIMEOUT", default=5.0),
 }
 
+# threads running the ORM code of async views, per process, which bounds the
+# database connections an ASGI worker opens.
+ASYNC_ORM_WORKERS = env.int("ASYNC_ORM_WORKERS", default=10)
+
+# Storefront catalog, products per page and lifetime of the cached fragments.
+CATALOG_PAGE_SIZE = env.int("CATALOG_PAGE_SIZE", default=24)
+CATALOG_CACHE_TIMEOUT = env.int("CATALOG_CACHE_TIMEOUT", default=600)
+# seconds browsers reuse a storefront page before revalidating its ETag.
+CATALOG_HTTP_MAX_AGE = env.int("CATALOG_HTTP_MAX_AGE", default=60)
+
+# Resized copies of product images, written next to the original on upload
+# by a pool of background threads and offered to browsers through srcset.
+IMAGE_DERIVATIVE_WIDTHS = (256, 512, 1024)
+IMAGE_DERIVATIVE_FORMATS = ("webp", "jpeg")
+IMAGE_DERIVATIVE_QUALITY = 80
+IMAGE_DERIVATIVE_WORKERS = env.int("IMAGE_DERIVATIVE_WORKERS", default=2)
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -152,7 +273,6 @@ USE_TZ = True
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # MEDIA_URL = "/images/"
 # MEDIA_ROOT = BASE_DIR
-LOCAL_HOST = env.str("LOCAL_HOST")
 AUTH_USER_MODEL = "users.User"
 LOGIN_URL = "/admin/login/"
 
@@ -172,13 +292,31 @@ OAUTH2_PROVIDER = {
     # access token expire time in seconds.
     "ACCESS_TOKEN_EXPIRE_SECONDS": 31556952,
 }
-HARD_DELETE_CASCADE = env.str("HARD_DELETE_CASCADE")
+HARD_DELETE_CASCADE = env.int("HARD_DELETE_CASCADE")
+
+# Generator of the UniqueIds.public_id values, each process sharing the
+# database needs its own worker id (0-63), leased from MySQL at startup when
+# unset, see e_shop.common.start_public_id_generator. Only pin one for a
+# single process, processes sharing it generate the same ids. Other databases
+# than MySQL default to worker id 0, right for a single process only.
+PUBLIC_ID_GENERATOR = env.str(
+    "PUBLIC_ID_GENERATOR", default="e_shop.common.SnowflakeIdGenerator"
+)
+PUBLIC_ID_WORKER_ID = env.int("PUBLIC_ID_WORKER_ID", default=None)
+
+# public id to primary key lookups, kept in a per process LRU and, when set,
+# in the named shared cache. Unknown ids are remembered for a short while.
+PUBLIC_ID_CACHE = env.str("PUBLIC_ID_CACHE", default=None)
+PUBLIC_ID_CACHE_SIZE = env.int("PUBLIC_ID_CACHE_SIZE", default=10000)
+PUBLIC_ID_NEGATIVE_TIMEOUT = env.int("PUBLIC_ID_NEGATIVE_TIMEOUT", default=30)
 
+# records are queued by the "queue" handler and written by its listener
+# thread to the single rotating "file" sink, one JSON object per line.
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": {
-        "standard": {"format": "%(levelname)-8s [%(asctime)s] %(name)s: %(message)s"},
+        "json": {"()": "e_shop.log.JsonFormatter"},
     },
     "handlers": {
         "file": {
@@ -187,28 +325,32 @@ LOGGING = {
             "filename": "logging_history.log",
             "when": "D",
             "backupCount": 30,
-            "formatter": "standard",
+            "formatter": "json",
         },
-        "console": {
-            "level": "DEBUG",
-            "class": "logging.FileHandler",
-            "filename": "logging_history.log",
-            "formatter": "standard",
+        "queue": {
+            "()": "e_shop.log.queue_handler",
+            "handlers": ["cfg://handlers.file"],
+            "queue_size": env.int("LOG_QUEUE_SIZE", default=10000),
         },
     },
     "loggers": {
         "django": {
-            "handlers": ["console", "file"],
+            "handlers": ["queue"],
+            "level": "INFO",
+            "propagate": True,
+        },
+        "e_shop": {
+            "handlers": ["queue"],
             "level": "INFO",
             "propagate": True,
         },
         "store": {
-            "handlers": ["console", "file"],
+            "handlers": ["queue"],
             "level": "INFO",
             "propagate": True,
         },
         "users": {
-            "handlers": ["console", "file"],
+            "handlers": ["queue"],
             "level": "INFO",
             "propagate": True,
         },
@@ -227,6 +369,23 @@ if USE_S3:
     AWS_S3_OBJECT_PARAMETERS = {
         "CacheControl": "max-age=86400",
     }
+    # CacheControl by content type prefix, first match wins, the default above
+    # applies to anything else.
+    AWS_S3_CACHE_CONTROL = {
+        "image/": "max-age=2592000",
+        "font/": "max-age=2592000",
+        "text/css": "max-age=604800",
+        "text/javascript": "max-age=604800",
+        "application/javascript": "max-age=604800",
+    }
+    # files above the threshold are uploaded as concurrent multipart chunks.
+    AWS_S3_MULTIPART_THRESHOLD = env.int(
+        "AWS_S3_MULTIPART_THRESHOLD", default=8 * 1024 * 1024
+    )
+    AWS_S3_MULTIPART_CHUNKSIZE = env.int(
+        "AWS_S3_MULTIPART_CHUNKSIZE", default=8 * 1024 * 1024
+    )
+    AWS_S3_MULTIPART_CONCURRENCY = env.int("AWS_S3_MULTIPART_CONCURRENCY", default=4)
     STATICFILES_LOCATION = "static"
 
     STATICFILES_DIRS = [
@@ -247,3 +406,9 @@ else:
     STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
     MEDIA_URL = "/mediafiles/"
     MEDIA_ROOT = os.path.join(BASE_DIR, "mediafiles")
+
+# urls built by the S3 storages are memoized per file name, signed urls are
+# dropped STORAGE_URL_EXPIRY_MARGIN seconds before their signature expires.
+STORAGE_URL_CACHE_SIZE = env.int("STORAGE_URL_CACHE_SIZE", default=10000)
+STORAGE_URL_CACHE_TIMEOUT = env.int("STORAGE_URL_CACHE_TIMEOUT", default=600)
+STORAGE_URL_EXPIRY_MARGIN = env.int("STORAGE_URL_EXPIRY_MARGIN", default=60)
@@ -0,0 +1,593 @@
+import contextvars
+import logging
+import sqlite3
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue
+from unittest import mock, skipUnless
+
+import requests
+from asgiref.sync import sync_to_async
+from botocore.stub import Stubber
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage, Storage
+from django.db import connection, connections, router
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from elasticsearch import Elasticsearch
+
+from e_shop.common import (
+    CachedUrlMixin,
+    MediaStorage,
+    SnowflakeIdGenerator,
+    WorkerIdLease,
+    file_digest,
+    start_public_id_generator,
+    upload_with_save,
+)
+from e_shop.db.pool import ConnectionPool, PoolTimeout
+from e_shop.db.routers import pin_primary, start_pin
+from e_shop.http_client import JitterRetry, OutboundHttpConnection, create_session
+from e_shop.log import DroppingQueueHandler, queue_handler
+from store.models import Category
+from users.models import User
+
+
+class SnowflakeIdGeneratorTest(TestCase):
+    def test_ids_increase_and_carry_the_worker_id(self):
+        generator = SnowflakeIdGenerator(worker_id=50)
+        ids = generator.allocate(1000) + [generator()]
+        self.assertEqual(ids, sorted(set(ids)))
+        mask = (1 << SnowflakeIdGenerator.WORKER_BITS) - 1
+        self.assertEqual(
+            {i >> SnowflakeIdGenerator.SEQUENCE_BITS & mask for i in ids}, {50}
+        )
+        # exact as JSON numbers in browsers, Number.MAX_SAFE_INTEGER.
+        self.assertTrue(all(0 < i < 2 ** 53 for i in ids))
+
+    def test_ids_never_run_ahead_of_the_clock(self):
+        generator = SnowflakeIdGenerator()
+        ids = generator.allocate(1000)
+        shift = SnowflakeIdGenerator.WORKER_BITS + SnowflakeIdGenerator.SEQUENCE_BITS
+        timestamp = ids[-1] >> shift
+        self.assertLessEqual(timestamp, generator.now())
+
+    def test_clock_going_backwards_repeats_no_id(self):
+        generator = SnowflakeIdGenerator()
+        now = generator.now()
+        clock = iter([now, now - 5] + list(range(now - 5, now + 100)))
+        with mock.patch.object(generator, "now", lambda: next(clock)):
+            first = generator.allocate(128)
+            ids = first + generator.allocate(128)
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids, sorted(ids))
+
+    def test_invalid_worker_id(self):
+        with self.assertRaises(ImproperlyConfigured):
+            SnowflakeIdGenerator(worker_id=1 << SnowflakeIdGenerator.WORKER_BITS)
+
+
+class WorkerIdLeaseTest(TestCase):
+    @skipUnless(connection.vendor != "mysql", "leases are supported on MySQL")
+    def test_lease_requires_mysql(self):
+        with self.assertRaises(ImproperlyConfigured):
+            WorkerIdLease(size=4).acquire()
+
+    @skipUnless(connection.vendor == "mysql", "leases need MySQL")
+    def test_processes_lease_distinct_worker_ids(self):
+        leases = [WorkerIdLease(size=2) for _ in range(2)]
+        self.assertEqual({lease.acquire() for lease in leases}, {0, 1})
+        self.assertTrue(all(lease.is_held() for lease in leases))
+        with self.assertRaises(ImproperlyConfigured):
+            WorkerIdLease(size=2).acquire()
+
+    @skipUnless(connection.vendor != "mysql", "leases are supported on MySQL")
+    @override_settings(PUBLIC_ID_WORKER_ID=None)
+    def test_other_databases_default_to_worker_id_zero(self):
+        with mock.patch("e_shop.common._public_id_generator", None):
+            generator = start_public_id_generator()
+            self.assertIs(start_public_id_generator(), generator)
+        self.assertEqual(generator.worker_id, 0)
+        self.assertIsNone(generator.lease)
+
+    def get_leased_generator(self):
+        lease = WorkerIdLease(size=4)
+        lease.worker_id = 3
+        # a clock only moved by sleep().
+        clock = [1000.0]
+        for name, function in (
+            ("monotonic", lambda: clock[0]),
+            ("sleep", lambda seconds: clock.__setitem__(0, clock[0] + seconds)),
+        ):
+            patcher = mock.patch(f"e_shop.common.time.{name}", side_effect=function)
+            self.addCleanup(patcher.stop)
+            patcher.start()
+        return SnowflakeIdGenerator(lease=lease), lease, clock
+
+    def test_lost_lease_stops_the_ids(self):
+        generator, lease, _ = self.get_leased_generator()
+        with mock.patch.object(
+            lease, "_is_held", return_value=False
+        ), mock.patch.object(lease, "_acquire", side_effect=ImproperlyConfigured):
+            with self.assertRaises(ImproperlyConfigured):
+                generator.allocate(10)
+
+    def test_ids_of_a_new_lease_wait_for_the_former_holder(self):
+        generator, lease, clock = self.get_leased_generator()
+        started = clock[0]
+
+        def acquire():
+            lease.worker_id = 2
+            lease._valid_from = lease._valid_until = clock[0] + lease.HOLD_SECONDS
+
+        with mock.patch.object(
+            lease, "_is_held", side_effect=[False, True]
+        ), mock.patch.object(lease, "_acquire", side_effect=acquire):
+            public_id = generator()
+        self.assertEqual(clock[0] - started, lease.HOLD_SECONDS)
+        mask = (1 << SnowflakeIdGenerator.WORKER_BITS) - 1
+        self.assertEqual(public_id >> SnowflakeIdGenerator.SEQUENCE_BITS & mask, 2)
+        # held within HOLD_SECONDS of the last check, no query meanwhile.
+        with mock.patch.object(lease, "_is_held") as is_held:
+            generator.allocate(10)
+        is_held.assert_not_called()
+
+
+class SignedUrlStorage(Storage):
+    """In-memory stand-in for S3Boto3Storage signing every url."""
+
+    querystring_auth = True
+    querystring_expire = 3600
+
+    def __init__(self):
+        self.signed = 0
+
+    def url(self, name, expire=None):
+        self.signed += 1
+        return f"/{name}?expire={expire or self.querystring_expire}&sig={self.signed}"
+
+    def delete(self, name):
+        pass
+
+
+class CachedUrlStorage(CachedUrlMixin, SignedUrlStorage):
+    pass
+
+
+@override_settings(
+    STORAGE_URL_CACHE_SIZE=2,
+    STORAGE_URL_CACHE_TIMEOUT=600,
+    STORAGE_URL_EXPIRY_MARGIN=60,
+)
+class CachedUrlMixinTest(SimpleTestCase):
+    def setUp(self):
+        self.storage = CachedUrlStorage()
+        self.now = 1000.0
+        patcher = mock.patch("e_shop.common.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached_url_is_reused_then_refreshed_after_expiry(self):
+        url = self.storage.url("a.jpg")
+        self.now += 599
+        self.assertEqual(self.storage.url("a.jpg"), url)
+        self.assertEqual(self.storage.signed, 1)
+        self.now += 2
+        self.assertNotEqual(self.storage.url("a.jpg"), url)
+        self.assertEqual(self.storage.signed, 2)
+        self.assertEqual(
+            self.storage.url_cache_stats(), {"hits": 1, "misses": 2, "size": 1}
+        )
+
+    def test_url_is_not_kept_past_its_signature(self):
+        url = self.storage.url("a.jpg", expire=120)
+        self.now += 59
+        self.assertEqual(self.storage.url("a.jpg", expire=120), url)
+        self.now += 2
+        self.assertNotEqual(self.storage.url("a.jpg", expire=120), url)
+        self.assertEqual(self.storage.url("a.jpg", expire=30), "/a.jpg?expire=30&sig=3")
+        self.assertEqual(self.storage.url("a.jpg", expire=30), "/a.jpg?expire=30&sig=4")
+
+    def test_least_recently_used_and_deleted_urls_are_dropped(self):
+        self.storage.url("a.jpg")
+        self.storage.url("b.jpg")
+        self.storage.url("a.jpg")
+        self.storage.url("c.jpg")
+        self.storage.url("a.jpg")
+        self.assertEqual(self.storage.signed, 3)
+        self.storage.url("b.jpg")
+        self.assertEqual(self.storage.signed, 4)
+        self.storage.delete("a.jpg")
+        self.storage.url("a.jpg")
+        self.assertEqual(self.storage.signed, 5)
+
+
+MiB = 1024 * 1024
+
+
+@override_settings(
+    AWS_S3_OBJECT_PARAMETERS={"CacheControl": "max-age=86400"},
+    AWS_S3_CACHE_CONTROL={"image/": "max-age=2592000"},
+    AWS_S3_MULTIPART_THRESHOLD=5 * MiB,
+    AWS_S3_MULTIPART_CHUNKSIZE=5 * MiB,
+    AWS_S3_MULTIPART_CONCURRENCY=3,
+)
+class BulkUploadTest(SimpleTestCase):
+    """Uploads against a stubbed S3 client, which answers without any request."""
+
+    def setUp(self):
+        self.storage = MediaStorage(
+            bucket_name="bucket",
+            access_key="a",
+            secret_key="b",
+            region_name="us-east-1",
+        )
+        client = self.storage.connection.meta.client
+        self.stubber = Stubber(client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+        self.calls = []
+        client.meta.events.register("provide-client-params.s3.*", self.record)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def record(self, params, model, **kwargs):
+        self.calls.append((model.name, dict(params)))
+
+    def params(self, operation):
+        return [params for name, params in self.calls if name == operation]
+
+    def write(self, name, size):
+        path = f"{self.directory}/{name}"
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def test_large_file_is_sent_in_concurrent_parts(self):
+        path = self.write("shoe.jpg", 11 * MiB)
+        self.stubber.add_client_error("head_object", "404", http_status_code=404)
+        self.stubber.add_response("create_multipart_upload", {"UploadId": "u"})
+        for part in range(3):
+            self.stubber.add_response("upload_part", {"ETag": f'"{part}"'})
+        self.stubber.add_response("complete_multipart_upload", {})
+        self.assertTrue(self.storage.upload_file("products/shoe.jpg", path))
+        self.stubber.assert_no_pending_responses()
+        (create,) = self.params("CreateMultipartUpload")
+        self.assertEqual(create["Key"], "media/products/shoe.jpg")
+        self.assertEqual(create["ContentType"], "image/jpeg")
+        self.assertEqual(create["CacheControl"], "max-age=2592000")
+        self.assertEqual(create["ACL"], "public-read")
+        self.assertEqual(create["Metadata"], {"sha256": file_digest(path)})
+        parts = self.params("UploadPart")
+        self.assertEqual(sorted(part["PartNumber"] for part in parts), [1, 2, 3])
+
+    def test_small_file_gets_the_default_cache_control(self):
+        path = self.write("notes.txt", 10)
+        self.stubber.add_client_error("head_object", "404", http_status_code=404)
+        self.stubber.add_response("put_object", {})
+        self.assertTrue(self.storage.upload_file("notes.txt", path))
+        (put,) = self.params("PutObject")
+        self.assertEqual(put["ContentType"], "text/plain")
+        self.assertEqual(put["CacheControl"], "max-age=86400")
+
+    def test_unchanged_file_is_not_sent(self):
+        path = self.write("notes.txt", 10)
+        self.stubber.add_response(
+            "head_object", {"Metadata": {"sha256": file_digest(path)}}
+        )
+        self.assertFalse(self.storage.upload_file("notes.txt", path))
+        self.stubber.assert_no_pending_responses()
+        self.assertEqual([name for name, _ in self.calls], ["HeadObject"])
+
+
+class UploadWithSaveTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = FileSystemStorage(location=f"{directory.name}/storage")
+        self.local = f"{directory.name}/local.txt"
+
+    def upload(self, content):
+        with open(self.local, "w") as f:
+            f.write(content)
+        return upload_with_save(self.storage, "docs/notes.txt", self.local)
+
+    def read(self):
+        with self.storage.open("docs/notes.txt") as f:
+            return f.read()
+
+    def test_changed_file_replaces_the_former_under_its_name(self):
+        self.assertTrue(self.upload("former"))
+        self.assertFalse(self.upload("former"))
+        self.assertTrue(self.upload("new"))
+        self.assertEqual(self.read(), b"new")
+        self.assertEqual(self.storage.listdir("docs"), ([], ["notes.txt"]))
+
+    def test_failed_upload_keeps_the_former_file(self):
+        self.upload("former")
+        with mock.patch(
+            "e_shop.common.shutil.copyfileobj", side_effect=OSError("disk full")
+        ):
+            with self.assertRaises(OSError):
+                self.upload("new")
+        self.assertEqual(self.read(), b"former")
+        self.assertEqual(self.storage.listdir("docs"), ([], ["notes.txt"]))
+
+
+class QueueHandlerTest(SimpleTestCase):
+    def record(self, message):
+        return logging.LogRecord("test", logging.INFO, "", 0, message, None, None)
+
+    def test_listener_writes_to_the_sinks(self):
+        sink = mock.Mock(level=logging.NOTSET)
+        handler = queue_handler([sink])
+        handler.handle(self.record("hello"))
+        handler.close()
+        self.assertEqual(sink.handle.call_args.args[0].getMessage(), "hello")
+        self.assertIsNone(handler.listener._thread)
+
+    def test_full_queue_drops_records(self):
+        handler = DroppingQueueHandler(Queue(1))
+        handler.handle(self.record("kept"))
+        handler.handle(self.record("dropped"))
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(handler.queue.get_nowait().getMessage(), "kept")
+
+
+class RequestLogMiddlewareTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="buyer@example.com", email="buyer@example.com"
+        )
+
+    async def test_async_view_does_not_load_the_session_user(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        with self.assertLogs("e_shop.requests") as logs:
+            response = await self.async_client.get("/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(logs.records[0].user)
+
+    def test_user_resolved_by_the_view_is_logged(self):
+        self.client.force_login(self.user)
+        with self.assertLogs("e_shop.requests") as logs:
+            response = self.client.get("/export/")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(logs.records[0].user, self.user.pk)
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    def get_pool(self, **kwargs):
+        pool = ConnectionPool(
+            lambda: sqlite3.connect(":memory:", check_same_thread=False),
+            lambda conn: conn.execute("SELECT 1"),
+            **kwargs,
+        )
+        self.addCleanup(pool.close_idle)
+        return pool
+
+    def test_returned_connection_is_reused(self):
+        pool = self.get_pool()
+        conn, fresh = pool.checkout()
+        self.assertTrue(fresh)
+        pool.checkin(conn)
+        self.assertEqual(pool.checkout(), (conn, False))
+        self.assertEqual(pool.stats()["in_use"], 1)
+
+    def test_checkout_waits_at_most_timeout_when_full(self):
+        pool = self.get_pool(max_size=1, timeout=0.05)
+        conn, _ = pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        threading.Timer(0.01, pool.checkin, [conn]).start()
+        pool.timeout = 5
+        self.assertEqual(pool.checkout(), (conn, False))
+        stats = pool.stats()
+        self.assertEqual((stats["size"], stats["timeouts"], stats["waits"]), (1, 1, 1))
+
+    def test_stale_connection_is_replaced(self):
+        pool = self.get_pool(ping_interval=0)
+        conn, _ = pool.checkout()
+        pool.checkin(conn)
+        conn.close()
+        replaced, fresh = pool.checkout()
+        self.assertIsNot(replaced, conn)
+        self.assertTrue(fresh)
+        self.assertEqual(pool.stats()["ping_failures"], 1)
+        self.assertEqual(pool.stats()["size"], 1)
+
+    def test_idle_connections_are_closed(self):
+        pool = self.get_pool(idle_timeout=0)
+        conn, _ = pool.checkout()
+        pool.checkin(conn)
+        self.assertIsNot(pool.checkout()[0], conn)
+        self.assertEqual(pool.stats()["evictions"], 1)
+
+    def test_connection_of_an_exited_thread_is_reclaimed(self):
+        pool = self.get_pool(max_size=1, timeout=0.05)
+        thread = threading.Thread(target=pool.checkout)
+        thread.start()
+        thread.join()
+        conn, fresh = pool.checkout()
+        self.assertTrue(fresh)
+        stats = pool.stats()
+        self.assertEqual((stats["size"], stats["reclaims"]), (1, 1))
+
+    def test_held_connection_is_never_reclaimed(self):
+        pool = self.get_pool(max_size=1, timeout=0.05)
+        thread = threading.Thread(target=pool.checkout, kwargs={"held": True})
+        thread.start()
+        thread.join()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        self.assertEqual(pool.stats()["reclaims"], 0)
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"])
+class ReplicaRouterTest(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        engine = "django.db.backends.sqlite3"
+        # replica1 is a SQLite file of its own, replica2 cannot be opened.
+        for alias, name in (
+            ("replica1", f"{directory.name}/replica1.sqlite3"),
+            ("replica2", f"{directory.name}/missing/replica2.sqlite3"),
+        ):
+            connections.databases[alias] = {
+                **connections.databases["default"],
+                "ENGINE": engine,
+                "NAME": name,
+            }
+            self.addCleanup(self.remove_alias, alias)
+        with connections["replica1"].schema_editor() as editor:
+            editor.create_model(Category)
+        Category.objects.using("replica1").create(name="replicated")
+        router.routers[0]._down_until.clear()
+
+    def remove_alias(self, alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.databases[alias]
+
+    def read(self, request=True, pinned=False):
+        def run():
+            if request:
+                start_pin(pinned)
+            return Category.objects.filter(name="replicated").exists()
+
+        # a context of its own, as every request.
+        return contextvars.Context().run(run)
+
+    def test_request_reads_go_to_a_reachable_replica(self):
+        with mock.patch("e_shop.db.routers.random.shuffle", list.reverse):
+            with self.assertLogs("e_shop.db.routers", "WARNING"):
+                self.assertTrue(self.read())
+            self.assertTrue(self.read())
+
+    def test_reads_outside_of_a_request_go_to_the_primary(self):
+        self.assertFalse(self.read(request=False))
+
+    def test_pinned_reads_go_to_the_primary(self):
+        self.assertFalse(self.read(pinned=True))
+
+        def run():
+            with pin_primary():
+                return Category.objects.filter(name="replicated").exists()
+
+        self.assertFalse(contextvars.Context().run(run))
+
+    def test_reads_after_a_write_go_to_the_primary(self):
+        def run():
+            state = start_pin()
+            Category.objects.create(name="new")
+            return state.wrote, Category.objects.filter(name="new").exists()
+
+        self.assertEqual(contextvars.Context().run(run), (True, True))
+
+    def test_unknown_public_id_is_checked_on_the_primary(self):
+        category = Category.objects.create(name="not replicated yet")
+
+        def run():
+            start_pin()
+            return Category.resolve_public_ids([category.public_id])
+
+        resolved = contextvars.Context().run(run)
+        self.assertEqual(resolved, {category.public_id: category.pk})
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers with the next scripted (status, delay) of its server."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.ports.append(self.client_address[1])
+        status, delay = self.server.script.pop(0) if self.server.script else (200, 0)
+        time.sleep(delay)
+        body = b'{"version": {"number": "7.17.0"}, "tagline": "You Know, for Search"}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except ConnectionError:
+            pass  # the client timed out.
+
+    def log_message(self, *args):
+        pass
+
+
+OUTBOUND_HTTP = {
+    "TIMEOUT": (1.0, 0.2),
+    "RETRIES": 2,
+    "BACKOFF": 0.01,
+    "JITTER": 0.01,
+    "RETRY_STATUSES": (503,),
+    "POOL_CONNECTIONS": 2,
+    "POOL_MAXSIZE": 1,
+    "POOL_TIMEOUT": 0.1,
+}
+
+
+@override_settings(OUTBOUND_HTTP=OUTBOUND_HTTP)
+class OutboundSessionTest(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.script, self.server.ports = [], []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        self.session = create_session()
+        self.addCleanup(self.session.close)
+
+    def test_unavailable_responses_are_retried(self):
+        self.server.script = [(503, 0), (503, 0)]
+        self.assertEqual(self.session.get(self.url).status_code, 200)
+        self.assertEqual(len(self.server.ports), 3)
+        host = f"127.0.0.1:{self.server.server_port}"
+        self.assertEqual(self.session.histograms[(host, 200)].to_dict()["calls"], 1)
+
+    def test_backoff_adds_jitter(self):
+        retry = JitterRetry(total=3, backoff_factor=0.1, jitter=0.5)
+        retry = retry.increment("GET", "/").increment("GET", "/")
+        with mock.patch("e_shop.http_client.random.uniform", return_value=0.5):
+            self.assertEqual(retry.get_backoff_time(), 0.2 + 0.5)
+        self.assertEqual(retry.new().jitter, 0.5)
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            self.session.get(self.url)
+        self.assertEqual(len(set(self.server.ports)), 1)
+
+    def test_slow_peer_times_out(self):
+        self.server.script = [(200, 0.5)] * 3
+        started = time.monotonic()
+        with self.assertRaises(requests.RequestException):
+            self.session.get(self.url)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_full_pool_waits_at_most_pool_timeout(self):
+        self.server.script = [(200, 0.5)]
+        thread = threading.Thread(target=self.session.get, args=[self.url])
+        thread.start()
+        time.sleep(0.1)
+        started = time.monotonic()
+        with self.assertRaises(requests.ConnectionError):
+            self.session.get(self.url)
+        self.assertLess(time.monotonic() - started, 0.4)
+        thread.join()
+        self.assertEqual(self.session.get(self.url).status_code, 200)
+
+    def test_elasticsearch_calls_go_through_the_session(self):
+        with mock.patch("e_shop.http_client.get_session", return_value=self.session):
+            client = Elasticsearch(
+                self.url, connection_class=OutboundHttpConnection, max_retries=0
+            )
+            self.assertEqual(client.info()["version"]["number"], "7.17.0")
+        host = f"127.0.0.1:{self.server.server_port}"
+        self.assertIn((host, 200), self.session.histograms)
@@ -0,0 +1,31 @@
+# gunicorn configuration, picked up when ``gunicorn`` runs from this directory.
+# The ASGI application is served by uvicorn workers, so async views share one
+# event loop per worker process. Sync views run on Django's executor and
+# streaming responses, e.g. the product export, are read on the ORM pool by
+# e_shop.concurrency.StreamingASGIHandler. Serve e_shop.wsgi:application
+# with the default sync workers to compare, see benchmarks/concurrency.py.
+import multiprocessing
+import os
+import sys
+
+wsgi_app = "e_shop.asgi:application"
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+
+def pre_fork(server, worker):
+    # With preload_app the arbiter may have connected, its connections go back
+    # to the pool and are closed rather than inherited by the worker.
+    backend = sys.modules.get("e_shop.db.backends.mysql.base")
+    if backend is not None:
+        sys.modules["django.db"].connections.close_all()
+        backend.close_idle_pools()
+
+
+def post_fork(server, worker):
+    # With preload_app the application, and its public id worker id lease,
+    # were loaded in the arbiter, every worker leases a worker id of its own.
+    common = sys.modules.get("e_shop.common")
+    if common is not None:
+        common.start_public_id_generator()
@@ -1,11 +1,62 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 
 # Register your models here.
+from store.importing import FORMATS, ProductImporter, read_rows
 from store.models import Category, Product
 
 
+class ProductImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV with a header line, or JSONL.")
+    format = forms.ChoiceField(choices=[(fmt, fmt.upper()) for fmt in FORMATS])
+    create_categories = forms.BooleanField(required=False)
+
+
 class AdminProduct(admin.ModelAdmin):
     list_display = ["name", "price", "description", "category"]
+    change_list_template = "admin/store/product/change_list.html"
+
+    def get_urls(self):
+        return [
+            path(
+                "import/",
+                self.admin_site.admin_view(self.import_view),
+                name="store_product_import",
+            )
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect("admin:store_product_changelist")
+        form = ProductImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            importer = ProductImporter(
+                create_categories=form.cleaned_data["create_categories"]
+            )
+            try:
+                importer.run(
+                    read_rows(form.cleaned_data["file"], form.cleaned_data["format"])
+                )
+            except ValueError as e:
+                messages.error(request, f"Import stopped: {e}")
+            for line, error in importer.errors[:20]:
+                messages.warning(request, f"Row {line}: {error}")
+            messages.success(
+                request,
+                f"Imported {importer.created} products, {len(importer.errors)} "
+                f"rows rejected ({importer.rows_per_second:.0f} rows/s).",
+            )
+            return redirect("admin:store_product_changelist")
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Import products",
+            "form": form,
+        }
+        return TemplateResponse(request, "admin/store/product/import.html", context)
 
 
 class CategoryAdmin(admin.ModelAdmin):
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "store"
+
+    def ready(self):
+        # ``document`` is not autodiscovered, the registry expects ``documents``.
+        from store import document, signals  # noqa: F401
@@ -15,3 +15,12 @@ class ProductDocument(Document):
     class Django:
         model = Product
         fields = ["name", "description", "price", "image"]
+        # rows fetched per query when (re)building the index.
+        queryset_pagination = 5000
+
+    def get_queryset(self):
+        # soft-deleted products are hidden by the default manager.
+        return Product.objects.select_related("category")
+
+    def should_index_object(self, obj):
+        return not obj.deleted
@@ -0,0 +1,104 @@
+import csv
+import json
+
+from store.models import Product
+
+CSV = "csv"
+NDJSON = "ndjson"
+CONTENT_TYPES = {
+    CSV: "text/csv; charset=utf-8",
+    NDJSON: "application/x-ndjson",
+}
+
+# Exported columns, ``category`` is the category name, as read by ``import_products``.
+EXPORT_FIELDS = (
+    "public_id",
+    "name",
+    "price",
+    "description",
+    "image",
+    "category",
+    "created",
+    "updated",
+)
+_COLUMNS = EXPORT_FIELDS[:5] + ("category__name", "created", "updated")
+
+# Soft-delete visibility of the exported rows, as the managers of ``SafeDeleteModel``.
+VISIBILITY = {
+    "visible": Product.objects,
+    "all": Product.all_objects,
+    "deleted": Product.deleted_objects,
+}
+
+
+def export_rows(category=None, visibility="visible", chunk_size=2000):
+    """
+    This function is used to read the products to export, one chunk at a time.
+
+    Chunks are keyset pages on ``id`` (``id > last id``, ordered by id), so
+    only ``chunk_size`` rows are ever held in memory and every page is an
+    index range scan, however deep into the table. ``QuerySet.iterator()``
+    alone does not bound memory on MySQL, whose driver buffers the whole
+    result set client side.
+
+    :param category: Only export the products of this category id.
+    :type category: int
+    :param visibility: Key of ``VISIBILITY``.
+    :type visibility: str
+    :param chunk_size: Rows fetched per query.
+    :type chunk_size: int
+    :return: return rows as dicts keyed by ``EXPORT_FIELDS``.
+    :rtype: generator
+    """
+    queryset = VISIBILITY[visibility].order_by("id")
+    if category:
+        queryset = queryset.filter(category_id=category)
+    last = 0
+    while True:
+        chunk = list(
+            queryset.filter(id__gt=last).values_list("id", *_COLUMNS)[:chunk_size]
+        )
+        for row in chunk:
+            yield dict(zip(EXPORT_FIELDS, row[1:]))
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1][0]
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """
+    This function is used to render rows as CSV, one line at a time.
+
+    :param rows: Dicts keyed by ``EXPORT_FIELDS``.
+    :type rows: iterable
+    :return: return the header line then one line per row.
+    :rtype: generator
+    """
+    writer = csv.DictWriter(_Echo(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    """
+    This function is used to render rows as newline delimited JSON.
+
+    :param rows: Dicts keyed by ``EXPORT_FIELDS``.
+    :type rows: iterable
+    :return: return one JSON object per line.
+    :rtype: generator
+    """
+    for row in rows:
+        yield json.dumps(row, default=str) + "\n"
+
+
+RENDERERS = {
+    CSV: csv_lines,
+    NDJSON: ndjson_lines,
+}
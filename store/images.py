@@ -0,0 +1,163 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, features
+
+logger = logging.getLogger(__name__)
+
+# Pillow format and file extension of each derivative format.
+FORMATS = {
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+}
+
+_executor = None
+
+
+def get_formats():
+    """
+    This function is used to get the derivative formats this Pillow build can write.
+
+    :return: return the format names, e.g. ``("webp", "jpeg")``.
+    :rtype: tuple
+    """
+    return tuple(
+        fmt
+        for fmt in settings.IMAGE_DERIVATIVE_FORMATS
+        if fmt != "webp" or features.check("webp")
+    )
+
+
+def derivative_name(name, width, fmt):
+    """
+    This function is used to name a derivative next to its original.
+
+    ``uploads/products/shoe.png`` gives ``uploads/products/shoe_512.webp``.
+
+    :param name: Storage name of the original image.
+    :type name: str
+    :param width: Width of the derivative in pixels.
+    :type width: int
+    :param fmt: Derivative format, a key of ``FORMATS``.
+    :type fmt: str
+    :return: return the storage name of the derivative.
+    :rtype: str
+    """
+    root, _ = os.path.splitext(name)
+    return f"{root}_{width}.{FORMATS[fmt][1]}"
+
+
+def srcset(image, fmt, derivatives):
+    """
+    This function is used to build the ``srcset`` attribute of an image field.
+
+    Only the derivatives recorded by ``generate_derivatives`` are listed, with
+    their real widths, so a missing or failed copy never breaks the image.
+
+    :param image: Image field file of a model instance.
+    :type image: django.db.models.fields.files.ImageFieldFile
+    :param fmt: Derivative format, a key of ``FORMATS``.
+    :type fmt: str
+    :param derivatives: Derivatives written for ``image``, as returned by
+        ``generate_derivatives``.
+    :type derivatives: dict
+    :return: return the srcset value, empty until derivatives are written.
+    :rtype: str
+    """
+    if not image or fmt not in get_formats():
+        return ""
+    return ", ".join(
+        f"{image.storage.url(name)} {width}w"
+        for width, name in (derivatives or {}).get(fmt, ())
+    )
+
+
+def generate_derivatives(storage, name):
+    """
+    This function is used to write the resized copies of an original image.
+
+    Every width of ``settings.IMAGE_DERIVATIVE_WIDTHS`` is written in every
+    supported format, without upscaling, through the storage of the original
+    (``MediaStorage`` on S3 or ``MEDIA_ROOT`` locally). Widths above the
+    original collapse into a single copy of its own width.
+
+    :param storage: Storage holding the original.
+    :type storage: django.core.files.storage.Storage
+    :param name: Storage name of the original image.
+    :type name: str
+    :return: return the ``[width, storage name]`` pairs written per format.
+    :rtype: dict
+    """
+    with storage.open(name) as original:
+        image = Image.open(original)
+        image.load()
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    written = {fmt: [] for fmt in get_formats()}
+    widths = sorted(
+        {min(width, image.width) for width in settings.IMAGE_DERIVATIVE_WIDTHS}
+    )
+    for width in widths:
+        resized = image.copy()
+        resized.thumbnail((width, width * image.height // image.width or 1))
+        for fmt in written:
+            buffer = BytesIO()
+            resized.save(
+                buffer,
+                FORMATS[fmt][0],
+                quality=settings.IMAGE_DERIVATIVE_QUALITY,
+                optimize=True,
+            )
+            target = derivative_name(name, width, fmt)
+            # replace older copies, the storage would pick another name.
+            if storage.exists(target):
+                storage.delete(target)
+            saved = storage.save(target, ContentFile(buffer.getvalue()))
+            written[fmt].append([resized.width, saved])
+    return written
+
+
+def _generate(storage, name, on_done):
+    try:
+        written = generate_derivatives(storage, name)
+    except Exception:
+        logger.exception(f"Image derivatives of {name} failed.")
+        return
+    if on_done is None:
+        return
+    close_old_connections()
+    try:
+        on_done(written)
+    except Exception:
+        logger.exception(f"Recording the image derivatives of {name} failed.")
+    finally:
+        close_old_connections()
+
+
+def schedule_derivatives(image, on_done=None):
+    """
+    This function is used to generate the derivatives of an image in the background.
+
+    Work starts once the current transaction commits, on a pool of
+    ``settings.IMAGE_DERIVATIVE_WORKERS`` threads.
+
+    :param image: Image field file of a saved model instance.
+    :type image: django.db.models.fields.files.ImageFieldFile
+    :param on_done: Called with the result of ``generate_derivatives`` once
+        the derivatives are written.
+    :type on_done: callable
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_DERIVATIVE_WORKERS,
+            thread_name_prefix="image-derivatives",
+        )
+    storage, name = image.storage, image.name
+    transaction.on_commit(lambda: _executor.submit(_generate, storage, name, on_done))
@@ -0,0 +1,174 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from django.db import transaction
+
+from e_shop.common import PublicId, public_id_cache
+from store.indexing import enqueue
+from store.models import Category, Product
+from store.utils import invalidate_catalog
+
+CSV = "csv"
+JSONL = "jsonl"
+FORMATS = (CSV, JSONL)
+
+# Columns read from every row, ``category`` holds the category name.
+IMPORT_FIELDS = ("name", "price", "description", "image", "category")
+
+# Rejected rows kept for the report, the others are only counted.
+MAX_REPORTED_ERRORS = 100
+
+
+def read_rows(stream, fmt):
+    """
+    This function is used to read import rows one at a time.
+
+    :param stream: Binary file, e.g. an open file or an uploaded file.
+    :type stream: io.IOBase
+    :param fmt: ``CSV`` with a header line, or ``JSONL`` with one object per line.
+    :type fmt: str
+    :return: return the rows as dicts, lazily.
+    :rtype: generator
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == CSV:
+        yield from csv.DictReader(text)
+    else:
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+
+
+class CategoryLookup:
+    """
+    Category name to id mapping, loaded with one query and kept for the import.
+
+    Unknown names are created on first use when ``create`` is set.
+    """
+
+    def __init__(self, create=False):
+        self.create = create
+        self._ids = dict(Category.objects.values_list("name", "id"))
+
+    def get(self, name):
+        category_id = self._ids.get(name)
+        if category_id is None and self.create and name:
+            category_id = self._ids[name] = Category.objects.create(name=name).id
+        return category_id
+
+
+class ProductImporter:
+    """
+    Streams rows into ``Product`` with ``bulk_create``, ``chunk_size`` rows at a time.
+
+    Every chunk is inserted in its own transaction with pre-allocated public
+    ids, which are then used to read the new primary keys back (MySQL does not
+    return them from a bulk insert) and queue their indexing once committed.
+    Only one chunk is held in memory at a time, rejected rows are counted in
+    ``rejected`` and only the first ``max_errors`` of them kept in ``errors``.
+    """
+
+    def __init__(
+        self, chunk_size=2000, create_categories=False, max_errors=MAX_REPORTED_ERRORS
+    ):
+        self.chunk_size = chunk_size
+        self.categories = CategoryLookup(create=create_categories)
+        self.created = 0
+        self.changed_categories = set()
+        self.rejected = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+    def reject(self, line, error):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, error))
+
+    def build(self, line, row):
+        category_id = self.categories.get(row.get("category"))
+        if category_id is None:
+            self.reject(line, f"unknown category {row.get('category')!r}")
+            return None
+        try:
+            price = int(row.get("price") or 0)
+        except (TypeError, ValueError):
+            self.reject(line, f"invalid price {row.get('price')!r}")
+            return None
+        if not row.get("name"):
+            self.reject(line, "missing name")
+            return None
+        return Product(
+            name=row["name"],
+            price=price,
+            description=row.get("description") or "",
+            image=row.get("image") or "",
+            category_id=category_id,
+            # bulk_create skips save(), which marks rows as not deleted.
+            deleted=None,
+        )
+
+    def import_chunk(self, numbered_rows):
+        products = []
+        for line, row in numbered_rows:
+            product = self.build(line, row)
+            if product is not None:
+                products.append((line, product))
+        if not products:
+            return
+        public_ids = PublicId.allocate_public_ids(len(products))
+        for (_, product), public_id in zip(products, public_ids):
+            product.public_id = public_id
+
+        # the allocated public ids are unique by construction, not checked.
+        errors = Product.bulk_unique_errors(
+            [product for _, product in products], exclude=["public_id"]
+        )
+        valid = []
+        for (line, product), error in zip(products, errors):
+            if error:
+                self.reject(line, error)
+            else:
+                valid.append(product)
+
+        with transaction.atomic():
+            Product.objects.bulk_create(valid, batch_size=self.chunk_size)
+            pks = Product.objects.filter(
+                public_id__in=[product.public_id for product in valid]
+            ).values_list("pk", flat=True)
+            enqueue(Product, pks)
+            # bulk_create sends no post_save, drop the negative entries here.
+            public_ids = [product.public_id for product in valid]
+            transaction.on_commit(
+                lambda: public_id_cache.delete_many(Product, public_ids)
+            )
+        self.created += len(valid)
+        self.changed_categories.update(product.category_id for product in valid)
+
+    def run(self, rows):
+        """
+        This function is used to import rows.
+
+        :param rows: Dicts keyed by ``IMPORT_FIELDS``, e.g. from ``read_rows``.
+        :type rows: iterable
+        :return: return the number of products created.
+        :rtype: int
+        """
+        started = time.monotonic()
+        numbered_rows = enumerate(rows, start=1)
+        while True:
+            chunk = list(islice(numbered_rows, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+        self.elapsed = time.monotonic() - started
+        if self.created:
+            invalidate_catalog(self.changed_categories)
+        return self.created
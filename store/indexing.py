@@ -0,0 +1,305 @@
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+from django_elasticsearch_dsl.registries import registry
+from django_elasticsearch_dsl.signals import BaseSignalProcessor
+from elasticsearch.exceptions import TransportError
+from elasticsearch.helpers import bulk
+from elasticsearch_dsl.connections import connections
+from safedelete.signals import post_softdelete, post_undelete
+
+from e_shop.common import post_bulk_softdelete, post_bulk_undelete
+
+logger = logging.getLogger(__name__)
+
+INDEX = "index"
+DELETE = "delete"
+
+
+class IndexQueue:
+    """
+    Deduplicating buffer of pending index operations.
+
+    Operations are keyed by ``(model, pk)``, queuing the same object again only
+    keeps its latest action, so a product saved ten times before the next
+    flush is indexed once.
+    """
+
+    def __init__(self):
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, model, pk, action=INDEX):
+        with self._lock:
+            self._pending.pop((model, pk), None)
+            self._pending[(model, pk)] = action
+
+    def take(self, size):
+        """
+        This function is used to remove the oldest pending operations.
+
+        :param size: Maximum number of operations to take.
+        :type size: int
+        :return: return ``(model, pk, action)`` tuples, oldest first.
+        :rtype: list
+        """
+        with self._lock:
+            batch = []
+            while self._pending and len(batch) < size:
+                (model, pk), action = self._pending.popitem(last=False)
+                batch.append((model, pk, action))
+            return batch
+
+    def requeue(self, batch):
+        """
+        This function is used to put taken operations back, in front of the others.
+
+        An object queued again since the batch was taken keeps its newer action.
+
+        :param batch: Operations returned by ``take``.
+        :type batch: list
+        """
+        with self._lock:
+            for model, pk, action in reversed(batch):
+                if (model, pk) not in self._pending:
+                    self._pending[(model, pk)] = action
+                    self._pending.move_to_end((model, pk), last=False)
+
+
+class IndexWorker:
+    """
+    Flushes an ``IndexQueue`` to Elasticsearch with the ``_bulk`` API.
+
+    Objects queued for indexing are loaded per model with one query per batch,
+    objects no longer returned by the document queryset are deleted from the
+    index instead. A batch failing on a transport error is retried with an
+    exponential backoff, then put back on the queue, as is a batch whose
+    objects could not be loaded, and the flush stops until the next one.
+    """
+
+    def __init__(
+        self,
+        queue,
+        client=None,
+        batch_size=500,
+        flush_interval=1.0,
+        max_retries=3,
+        retry_backoff=0.5,
+    ):
+        self.queue = queue
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def get_client(self):
+        return self.client or connections.get_connection()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="index-worker", daemon=True
+            )
+            self._thread.start()
+
+    def notify(self):
+        if len(self.queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            # as around requests, drop connections broken or past CONN_MAX_AGE.
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Index queue flush failed.")
+            finally:
+                close_old_connections()
+
+    def shutdown(self):
+        """
+        This function is used to send the pending operations before the process exits.
+        """
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Index queue flush at exit failed.")
+
+    def flush(self):
+        """
+        This function is used to send every pending operation to Elasticsearch.
+
+        :return: return the number of operations sent.
+        :rtype: int
+        """
+        sent = 0
+        while True:
+            batch = self.queue.take(self.batch_size)
+            if not batch:
+                return sent
+            if not self.send(batch):
+                return sent
+            sent += len(batch)
+
+    def send(self, batch):
+        """
+        This function is used to send one batch of operations with the ``_bulk`` API.
+
+        :param batch: Operations returned by ``IndexQueue.take``.
+        :type batch: list
+        :return: return whether the batch was sent, it is back on the queue otherwise.
+        :rtype: bool
+        """
+        try:
+            actions = list(self.get_actions(batch))
+        except Exception:
+            logger.exception(
+                f"Loading {len(batch)} objects to index failed, re-queuing."
+            )
+            self.queue.requeue(batch)
+            return False
+        for attempt in range(self.max_retries + 1):
+            try:
+                _, errors = bulk(
+                    self.get_client(), actions, raise_on_error=False, stats_only=False
+                )
+            except TransportError as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Bulk indexing failed, re-queuing {len(batch)}: {e}")
+                    self.queue.requeue(batch)
+                    return False
+                time.sleep(self.retry_backoff * 2 ** attempt)
+            else:
+                for error in errors:
+                    # deleting a document that was never indexed is not an error.
+                    if error.get(DELETE, {}).get("status") != 404:
+                        logger.error(f"Bulk indexing error: {error}")
+                return True
+
+    def get_actions(self, batch):
+        pks = defaultdict(dict)
+        for model, pk, action in batch:
+            pks[model][pk] = action
+        for model, actions in pks.items():
+            for document_class in registry.get_documents([model]):
+                document = document_class()
+                index_pks = [pk for pk, action in actions.items() if action == INDEX]
+                found = set()
+                if index_pks:
+                    queryset = document.get_queryset().filter(pk__in=index_pks)
+                    for instance in queryset:
+                        found.add(instance.pk)
+                        if document.should_index_object(instance):
+                            yield document._prepare_action(instance, INDEX)
+                for pk in actions:
+                    if pk not in found:
+                        yield {
+                            "_op_type": DELETE,
+                            "_index": document._index._name,
+                            "_id": pk,
+                        }
+
+
+index_queue = IndexQueue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_index_worker():
+    """
+    This function is used to get the process wide index worker, started lazily.
+
+    :return: return the worker flushing ``index_queue``.
+    :rtype: IndexWorker
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            options = getattr(settings, "ELASTICSEARCH_INDEX_QUEUE", {})
+            _worker = IndexWorker(
+                index_queue,
+                batch_size=options.get("BATCH_SIZE", 500),
+                flush_interval=options.get("FLUSH_INTERVAL", 1.0),
+                max_retries=options.get("MAX_RETRIES", 3),
+                retry_backoff=options.get("RETRY_BACKOFF", 0.5),
+            )
+            # the thread is a daemon, operations still queued at exit are lost.
+            atexit.register(_worker.shutdown)
+        _worker.start()
+        return _worker
+
+
+def enqueue(model, pks, action=INDEX):
+    """
+    This function is used to queue index operations once the transaction commits.
+
+    :param model: Model class registered with a document.
+    :type model: django.db.models.Model
+    :param pks: Primary keys of the objects to index or delete.
+    :type pks: iterable
+    :param action: ``INDEX`` or ``DELETE``.
+    :type action: str
+    """
+    if model not in registry.get_models():
+        return
+    pks = list(pks)
+
+    def put():
+        for pk in pks:
+            index_queue.put(model, pk, action)
+        get_index_worker().notify()
+
+    transaction.on_commit(put)
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """
+    Signal processor queuing index operations for ``IndexWorker``.
+
+    Unlike ``RealTimeSignalProcessor``, saving or deleting a model never waits
+    on Elasticsearch. Soft-deleted objects are removed from the index and
+    added back when undeleted.
+    """
+
+    def setup(self):
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+        post_softdelete.connect(self.handle_delete)
+        post_undelete.connect(self.handle_save)
+        post_bulk_softdelete.connect(self.handle_bulk_delete)
+        post_bulk_undelete.connect(self.handle_bulk_save)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+        post_softdelete.disconnect(self.handle_delete)
+        post_undelete.disconnect(self.handle_save)
+        post_bulk_softdelete.disconnect(self.handle_bulk_delete)
+        post_bulk_undelete.disconnect(self.handle_bulk_save)
+
+    def handle_save(self, sender, instance, **kwargs):
+        deleted = getattr(instance, "deleted", None)
+        enqueue(sender, [instance.pk], DELETE if deleted else INDEX)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        enqueue(sender, [instance.pk], DELETE)
+
+    def handle_bulk_save(self, sender, pks, **kwargs):
+        enqueue(sender, pks, INDEX)
+
+    def handle_bulk_delete(self, sender, pks, **kwargs):
+        enqueue(sender, pks, DELETE)
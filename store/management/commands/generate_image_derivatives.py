@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.images import generate_derivatives
+from store.models import Product
+from store.utils import invalidate_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the resized WebP/JPEG copies of every product image, for images "
+        "uploaded before derivatives were generated on save."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.IMAGE_DERIVATIVE_WORKERS,
+            help="Number of images resized at the same time.",
+        )
+
+    def handle(self, *args, **options):
+        storage = Product._meta.get_field("image").storage
+        names = (
+            Product.objects.exclude(image="")
+            .order_by()
+            .values_list("image", flat=True)
+            .distinct()
+        )
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            futures = {
+                executor.submit(generate_derivatives, storage, name): name
+                for name in names.iterator()
+            }
+            for future in as_completed(futures):
+                try:
+                    Product.all_objects.filter(image=futures[future]).update(
+                        image_derivatives=future.result()
+                    )
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{futures[future]}: {e}")
+        invalidate_catalog()
+        self.stdout.write(
+            self.style.SUCCESS(f"Resized {done} images, {failed} failed.")
+        )
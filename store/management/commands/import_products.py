@@ -0,0 +1,65 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.importing import CSV, FORMATS, JSONL, ProductImporter, read_rows
+from store.indexing import get_index_worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Import products from a CSV (with a header line) or JSONL file, "
+        "streamed and inserted in chunks with bulk_create."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file to import.")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="File format, guessed from the file extension by default.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of rows inserted per transaction.",
+        )
+        parser.add_argument(
+            "--create-categories",
+            action="store_true",
+            help="Create categories missing from the database instead of "
+            "rejecting their rows.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"]
+        if fmt is None:
+            fmt = JSONL if os.path.splitext(path)[1] in (".jsonl", ".ndjson") else CSV
+        importer = ProductImporter(
+            chunk_size=options["chunk_size"],
+            create_categories=options["create_categories"],
+        )
+        try:
+            with open(path, "rb") as f:
+                importer.run(read_rows(f, fmt))
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+        finally:
+            # the worker thread dies with the command, send the queued rows.
+            get_index_worker().flush()
+
+        for line, error in importer.errors:
+            self.stderr.write(f"row {line}: {error}")
+        if importer.rejected > len(importer.errors):
+            self.stderr.write(
+                f"... and {importer.rejected - len(importer.errors)} more rows rejected."
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {importer.created} products, {importer.rejected} "
+                f"rows rejected, in {importer.elapsed:.1f}s "
+                f"({importer.rows_per_second:.0f} rows/s)."
+            )
+        )
@@ -0,0 +1,182 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max, Min
+from django.utils import timezone
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import bulk
+
+from e_shop.common import chunked
+from store.document import PUBLISHER_INDEX, ProductDocument
+from store.indexing import DELETE, enqueue, get_index_worker
+from store.models import Product
+
+
+def index_range(index_name, low, high, chunk_size):
+    """
+    This function is used to index the products with ``low <= pk < high``.
+
+    It runs in a worker process with its own database and Elasticsearch
+    connections.
+
+    :return: return the range, the primary keys indexed and the seconds spent.
+    :rtype: tuple
+    """
+    client = Elasticsearch(**settings.ELASTICSEARCH_DSL["default"])
+    document = ProductDocument()
+    queryset = document.get_queryset().filter(pk__gte=low, pk__lt=high).order_by("pk")
+    pks = []
+
+    def actions():
+        for instance in queryset.iterator(chunk_size=chunk_size):
+            if document.should_index_object(instance):
+                action = document._prepare_action(instance, "index")
+                action["_index"] = index_name
+                pks.append(instance.pk)
+                yield action
+
+    started = time.monotonic()
+    bulk(client, actions(), chunk_size=chunk_size, stats_only=True)
+    return low, high, pks, time.monotonic() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the products index into a new versioned index, loaded in "
+        "parallel, then atomically point the index alias to it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of indexing processes, one primary key range each.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Rows fetched per query and documents sent per bulk request.",
+        )
+        parser.add_argument(
+            "--keep-old",
+            action="store_true",
+            help="Keep the indices previously behind the alias.",
+        )
+
+    def handle(self, *args, **options):
+        alias = PUBLISHER_INDEX._name
+        index = PUBLISHER_INDEX.clone(f"{alias}_{timezone.now():%Y%m%d%H%M%S}")
+        client = index._get_connection()
+        live_settings = PUBLISHER_INDEX.to_dict().get("settings", {})
+        restored_settings = {
+            "number_of_replicas": live_settings.get("number_of_replicas", 1),
+            "refresh_interval": live_settings.get("refresh_interval", "1s"),
+        }
+
+        started = timezone.now()
+        index.settings(number_of_replicas=0, refresh_interval="-1")
+        index.create()
+        self.stdout.write(f"Created index {index._name}.")
+
+        try:
+            indexed = self.load(index._name, options["workers"], options["chunk_size"])
+            index.put_settings(body={"index": restored_settings})
+            index.refresh()
+            old_indices = self.swap_alias(client, alias, index._name)
+        except BaseException:
+            # interrupted runs included, the alias still points to the old index.
+            index.delete(ignore=404)
+            self.stderr.write(f"Reindex failed, deleted index {index._name}.")
+            raise
+        self.stdout.write(f"Alias {alias} now points to {index._name}.")
+
+        # saves and deletes made during the load went to the previous index,
+        # soft deletes are saves, hard deletes are the indexed rows now gone.
+        missed = Product.all_objects.filter(updated__gte=started).values_list(
+            "pk", flat=True
+        )
+        enqueue(Product, missed)
+        enqueue(Product, self.get_hard_deleted(indexed), DELETE)
+        get_index_worker().flush()
+
+        if not options["keep_old"]:
+            for name in old_indices:
+                client.indices.delete(index=name)
+                self.stdout.write(f"Deleted index {name}.")
+
+    def load(self, index_name, workers, chunk_size):
+        """
+        This function is used to index every product into ``index_name`` in parallel.
+
+        :return: return the primary keys indexed.
+        :rtype: list
+        """
+        ranges = self.get_ranges(workers)
+        # forked workers must not share the parent's connections.
+        connections.close_all()
+        indexed, load_started = [], time.monotonic()
+        with ProcessPoolExecutor(max_workers=max(len(ranges), 1)) as executor:
+            jobs = [
+                executor.submit(index_range, index_name, low, high, chunk_size)
+                for low, high in ranges
+            ]
+            for job in jobs:
+                low, high, pks, seconds = job.result()
+                indexed += pks
+                self.stdout.write(
+                    f"pk [{low}, {high}): {len(pks)} docs in {seconds:.1f}s, "
+                    f"{len(pks) / seconds if seconds else 0:.0f} docs/sec"
+                )
+        elapsed = time.monotonic() - load_started
+        self.stdout.write(
+            f"Indexed {len(indexed)} docs in {elapsed:.1f}s, "
+            f"{len(indexed) / elapsed if elapsed else 0:.0f} docs/sec"
+        )
+        return indexed
+
+    def get_hard_deleted(self, pks):
+        """
+        This function is used to find the products deleted from the database since indexed.
+
+        :param pks: Primary keys indexed.
+        :type pks: list
+        :return: return the primary keys no longer in the database.
+        :rtype: list
+        """
+        deleted = []
+        for chunk in chunked(pks):
+            present = set(
+                Product.all_objects.filter(pk__in=chunk).values_list("pk", flat=True)
+            )
+            deleted += [pk for pk in chunk if pk not in present]
+        return deleted
+
+    def get_ranges(self, workers):
+        bounds = (
+            ProductDocument().get_queryset().aggregate(low=Min("pk"), high=Max("pk"))
+        )
+        if bounds["low"] is None:
+            return []
+        low, high = bounds["low"], bounds["high"] + 1
+        step = max(-(-(high - low) // max(workers, 1)), 1)
+        return [(start, min(start + step, high)) for start in range(low, high, step)]
+
+    def swap_alias(self, client, alias, index_name):
+        actions = [{"add": {"index": index_name, "alias": alias}}]
+        old_indices = []
+        if client.indices.exists_alias(name=alias):
+            old_indices = list(client.indices.get_alias(name=alias))
+            actions += [
+                {"remove": {"index": name, "alias": alias}} for name in old_indices
+            ]
+        elif client.indices.exists(index=alias):
+            # first run, the live index still owns the alias name.
+            actions.append({"remove_index": {"index": alias}})
+        client.indices.update_aliases(body={"actions": actions})
+        return old_indices
@@ -0,0 +1,123 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from e_shop.common import upload_with_save
+
+
+def iter_directory(directory, prefix):
+    """
+    This function is used to list the files of a local directory.
+
+    :param directory: Local directory walked recursively.
+    :type directory: str
+    :param prefix: Storage prefix of the files, e.g. ``uploads/products/``.
+    :type prefix: str
+    :return: return ``(storage name, local path)`` tuples.
+    :rtype: generator
+    """
+    for root, _, files in os.walk(directory):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            relative = os.path.relpath(path, directory).replace(os.sep, "/")
+            yield prefix + relative, path
+
+
+def iter_static():
+    """
+    This function is used to list the static files, as ``collectstatic`` finds them.
+
+    :return: return ``(storage name, local path)`` tuples.
+    :rtype: generator
+    """
+    seen = set()
+    for finder in finders.get_finders():
+        for path, storage in finder.list(["CVS", ".*", "*~"]):
+            name = path
+            prefix = getattr(storage, "prefix", None)
+            if prefix:
+                name = os.path.join(prefix, path)
+            name = name.replace(os.sep, "/")
+            # the first finder wins, as with collectstatic.
+            if name not in seen:
+                seen.add(name)
+                yield name, storage.path(path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Upload a directory to the media storage, or the static files to the "
+        "static storage, on a thread pool. Unchanged files are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "directory",
+            nargs="?",
+            help="Local directory uploaded to the media storage.",
+        )
+        parser.add_argument(
+            "--static",
+            action="store_true",
+            help="Upload the static files instead, like collectstatic.",
+        )
+        parser.add_argument(
+            "--prefix", default="", help="Storage prefix of the uploaded files."
+        )
+        parser.add_argument(
+            "--workers", type=int, default=8, help="Number of concurrent uploads."
+        )
+
+    def handle(self, *args, **options):
+        if options["static"]:
+            storage, files = staticfiles_storage, iter_static()
+        elif options["directory"]:
+            if not os.path.isdir(options["directory"]):
+                raise CommandError(f"{options['directory']} is not a directory.")
+            prefix = options["prefix"]
+            if prefix and not prefix.endswith("/"):
+                prefix += "/"
+            storage = default_storage
+            files = iter_directory(options["directory"], prefix)
+        else:
+            raise CommandError("Give a directory or --static.")
+
+        upload = getattr(storage, "upload_file", None)
+        if upload is None:
+
+            def upload(name, path):
+                return upload_with_save(storage, name, path)
+
+        uploaded = skipped = failed = size = 0
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            futures = {
+                executor.submit(upload, name, path): (name, path)
+                for name, path in files
+            }
+            for future in as_completed(futures):
+                name, path = futures[future]
+                try:
+                    sent = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{name}: {e}")
+                    continue
+                if sent:
+                    uploaded += 1
+                    size += os.path.getsize(path)
+                else:
+                    skipped += 1
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Uploaded {uploaded} files ({size} bytes), skipped {skipped} "
+                f"unchanged, {failed} failed in {elapsed:.1f}s: "
+                f"{uploaded / elapsed:.1f} files/s, {size / elapsed:.0f} bytes/s."
+            )
+        )
@@ -2,6 +2,7 @@ from django.db import models
 
 # Create your models here.
 from e_shop.common import CreateUpdateDate, SafeDeleteModel, UniqueIds
+from store.images import srcset
 
 
 class Product(CreateUpdateDate, UniqueIds, SafeDeleteModel):
@@ -10,10 +11,20 @@ class Product(CreateUpdateDate, UniqueIds, SafeDeleteModel):
     description = models.CharField(max_length=200, default="")
     image = models.ImageField(upload_to="uploads/products/")
     category = models.ForeignKey("Category", on_delete=models.CASCADE)
+    # resized copies of ``image`` written so far, see generate_derivatives.
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    @property
+    def image_srcset_webp(self):
+        return srcset(self.image, "webp", self.image_derivatives)
+
+    @property
+    def image_srcset_jpeg(self):
+        return srcset(self.image, "jpeg", self.image_derivatives)
+
     class Meta:
         db_table = "product"
 
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+
+from django.core import signing
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class SearchAfterPagination(BasePagination):
+    """
+    Cursor pagination for Elasticsearch searches, built on ``search_after``.
+
+    Pages follow the ordering of the search, e.g. ``?ordering=-id``, with
+    ``id`` appended as tie-breaker, and the cursor holds the signed sort
+    values of the last hit of the previous page, so Elasticsearch never
+    collects and discards the hits of earlier pages and the cost of a page
+    does not grow with its depth.
+
+    Example:
+
+        http://api.example.org/search/?search=shoe
+        http://api.example.org/search/?search=shoe&cursor=<next cursor>
+    """
+
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    cursor_salt = "store.pagination.SearchAfterPagination"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.size = self.get_page_size(request)
+        after = self.decode_cursor(request)
+
+        sort = self.get_sort(queryset)
+        queryset = queryset.sort(*sort).extra(track_total_hits=False)
+        if after is not None:
+            # a cursor of another ordering cannot be resumed.
+            if len(after) != len(sort):
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.extra(search_after=after)
+        # one extra hit tells whether a next page exists.
+        hits = list(queryset[: self.size + 1].execute())
+
+        self.next_cursor = None
+        if len(hits) > self.size:
+            hits = hits[: self.size]
+            self.next_cursor = self.encode_cursor(list(hits[-1].meta.sort))
+        return hits
+
+    def get_sort(self, queryset):
+        """
+        This function is used to get the sort of the search, ``id`` making it total.
+
+        :param queryset: Search, sorted by the ordering filter or not.
+        :type queryset: elasticsearch_dsl.Search
+        :return: return the sort clauses ending with the ``id`` tie-breaker.
+        :rtype: list
+        """
+        sort = list(queryset._sort)
+        fields = {
+            clause if isinstance(clause, str) else next(iter(clause)) for clause in sort
+        }
+        if "id" not in fields:
+            sort.append("id")
+        return sort
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def encode_cursor(self, after):
+        return signing.dumps(after, salt=self.cursor_salt, compress=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            after = signing.loads(encoded, salt=self.cursor_salt)
+        except signing.BadSignature:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(after, list):
+            raise NotFound(self.invalid_cursor_message)
+        return after
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict([("next", self.get_next_link()), ("results", data)])
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
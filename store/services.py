@@ -0,0 +1,103 @@
+import asyncio
+import weakref
+
+from django.conf import settings
+
+from store.document import ProductDocument
+
+# Fields matched by the storefront search box and the ``/search/`` endpoint.
+SEARCH_FIELDS = ("name", "description")
+
+# Number of hits rendered on the ``/filter/`` page, Elasticsearch's own default.
+SEARCH_RESULTS_LIMIT = 10
+
+# Seconds the index may trail the database, see store.indexing. Search pages
+# are not cached while the catalog changed more recently than that.
+SEARCH_INDEX_DELAY = 5
+
+
+def product_search(query=None):
+    """
+    This function is used to build the product search against the index.
+
+    :param query: Free text typed by the user, matched on ``SEARCH_FIELDS``.
+    :type query: str
+    :return: return the un-executed search ordered by id.
+    :rtype: elasticsearch_dsl.Search
+    """
+    search = ProductDocument.search()
+    if query:
+        search = search.query("multi_match", query=query, fields=SEARCH_FIELDS)
+    return search.sort("id")
+
+
+def search_products(query=None, limit=SEARCH_RESULTS_LIMIT):
+    """
+    This function is used to run the product search in-process.
+
+    :param query: Free text typed by the user.
+    :type query: str
+    :param limit: Maximum number of hits to return.
+    :type limit: int
+    :return: return the matching products as plain dicts.
+    :rtype: list
+    """
+    response = product_search(query)[:limit].execute()
+    return [hit.to_dict() for hit in response]
+
+
+# Options of the ``default`` connection only the sync transport understands,
+# its requests based connection class would block the event loop.
+SYNC_CLIENT_OPTIONS = ("connection_class", "max_retries")
+
+# AsyncElasticsearch sessions are bound to the event loop they were opened on.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def async_client_options():
+    """
+    This function is used to get the options of the async Elasticsearch client.
+
+    :return: return the ``default`` connection options without ``SYNC_CLIENT_OPTIONS``.
+    :rtype: dict
+    """
+    return {
+        key: value
+        for key, value in settings.ELASTICSEARCH_DSL["default"].items()
+        if key not in SYNC_CLIENT_OPTIONS
+    }
+
+
+def get_async_client():
+    """
+    This function is used to get the async Elasticsearch client of the running loop.
+
+    :return: return a client configured by ``async_client_options``.
+    :rtype: elasticsearch.AsyncElasticsearch
+    """
+    # only importable with the aiohttp extra, needed by async views alone.
+    from elasticsearch import AsyncElasticsearch
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncElasticsearch(**async_client_options())
+    return client
+
+
+async def search_products_async(query=None, limit=SEARCH_RESULTS_LIMIT):
+    """
+    This function is used to run the product search without blocking the event loop.
+
+    :param query: Free text typed by the user.
+    :type query: str
+    :param limit: Maximum number of hits to return.
+    :type limit: int
+    :return: return the matching products as plain dicts, as ``search_products``.
+    :rtype: list
+    """
+    search = product_search(query)[:limit]
+    response = await get_async_client().search(
+        index=ProductDocument._index._name, body=search.to_dict()
+    )
+    return [hit["_source"] for hit in response["hits"]["hits"]]
@@ -0,0 +1,87 @@
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from safedelete.signals import post_softdelete, post_undelete
+
+from e_shop.common import post_bulk_softdelete, post_bulk_undelete
+from store.images import schedule_derivatives
+from store.models import Category, Product
+from store.utils import invalidate_catalog
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_softdelete, sender=Category)
+@receiver(post_undelete, sender=Category)
+@receiver(post_bulk_softdelete, sender=Category)
+@receiver(post_bulk_undelete, sender=Category)
+def categories_changed(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(post_init, sender=Product)
+def remember_product_category(sender, instance, **kwargs):
+    instance._saved_category_id = instance.__dict__.get("category_id")
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_softdelete, sender=Product)
+@receiver(post_undelete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    # the former category listed the product too.
+    categories = {instance.__dict__.get("category_id"), instance._saved_category_id}
+    categories.discard(None)
+    invalidate_catalog(categories or None)
+    instance._saved_category_id = instance.__dict__.get("category_id")
+
+
+@receiver(post_bulk_softdelete, sender=Product)
+@receiver(post_bulk_undelete, sender=Product)
+def products_changed(sender, pks, using, **kwargs):
+    categories = (
+        Product._base_manager.using(using)
+        .filter(pk__in=pks)
+        .values_list("category_id", flat=True)
+        .distinct()
+    )
+    invalidate_catalog(categories)
+
+
+def image_changed(instance):
+    # a deferred image was neither loaded nor assigned, reading it would load it.
+    if "image" in instance.get_deferred_fields():
+        return False
+    return instance.image.name != instance._saved_image_name
+
+
+@receiver(post_init, sender=Product)
+def remember_product_image(sender, instance, **kwargs):
+    image = instance.__dict__.get("image")
+    # None when deferred, an image assigned later counts as a new one.
+    instance._saved_image_name = getattr(image, "name", image)
+
+
+@receiver(pre_save, sender=Product)
+def forget_product_derivatives(sender, instance, **kwargs):
+    if image_changed(instance):
+        # copies of the former image, srcset falls back to the new original.
+        instance.image_derivatives = {}
+
+
+@receiver(post_save, sender=Product)
+def product_image_changed(sender, instance, **kwargs):
+    if not image_changed(instance):
+        return
+    if instance.image:
+        pk, name, category = instance.pk, instance.image.name, instance.category_id
+
+        def record(derivatives):
+            # the image may have changed again meanwhile.
+            Product.all_objects.filter(pk=pk, image=name).update(
+                image_derivatives=derivatives
+            )
+            # cached cards rendered before the copies existed are dropped.
+            invalidate_catalog([category])
+
+        schedule_derivatives(instance.image, on_done=record)
+    instance._saved_image_name = instance.image.name
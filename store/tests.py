@@ -1,4 +1,42 @@
-from django.test import TestCase
+import asyncio
+import functools
+import json
+import os
+import tempfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.backends.utils import CursorWrapper
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from elasticsearch import Elasticsearch
+from PIL import Image
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from safedelete.models import SOFT_DELETE_CASCADE
+
+from e_shop.common import PublicId
+from e_shop.concurrency import StreamingASGIHandler
+from store.exporting import export_rows
+from store.images import generate_derivatives, srcset
+from store.importing import ProductImporter
+from store.indexing import DELETE, INDEX, IndexQueue, IndexWorker
+from store.models import Category, Product
+from store.pagination import SearchAfterPagination
+from store.services import get_async_client, search_products_async
+from store.utils import catalog_validators, get_catalog_version, invalidate_catalog
+from users.models import User
 
 # Create your tests here.
 
@@ -15,3 +53,457 @@ for i in range(len(m_list)):
         continue
 
 print(out)
+
+
+class IndexWorkerTest(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name="shoe", category=Category.objects.create(name="shoes")
+        )
+        self.queue = IndexQueue()
+        # nothing listens on the discard port, every bulk request fails.
+        self.worker = IndexWorker(
+            self.queue,
+            client=Elasticsearch("http://127.0.0.1:9", max_retries=0),
+            max_retries=0,
+        )
+
+    def test_requeue_keeps_newer_actions_in_front(self):
+        self.queue.put(Product, 1)
+        self.queue.put(Product, 2)
+        batch = self.queue.take(2)
+        self.queue.put(Product, 3)
+        self.queue.put(Product, 2, DELETE)
+        self.queue.requeue(batch)
+        self.assertEqual(
+            self.queue.take(3),
+            [(Product, 1, INDEX), (Product, 3, INDEX), (Product, 2, DELETE)],
+        )
+
+    def test_failed_bulk_is_requeued(self):
+        self.queue.put(Product, self.product.pk)
+        self.assertEqual(self.worker.flush(), 0)
+        self.assertEqual(self.queue.take(10), [(Product, self.product.pk, INDEX)])
+
+    def test_failed_load_is_requeued(self):
+        self.queue.put(Product, self.product.pk)
+        with mock.patch.object(
+            IndexWorker, "get_actions", side_effect=DatabaseError("gone away")
+        ):
+            self.assertEqual(self.worker.flush(), 0)
+        self.assertEqual(self.queue.take(10), [(Product, self.product.pk, INDEX)])
+
+
+@override_settings(
+    IMAGE_DERIVATIVE_WIDTHS=(256, 512, 1024), IMAGE_DERIVATIVE_FORMATS=("jpeg",)
+)
+class ImageDerivativesTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = FileSystemStorage(location=directory.name, base_url="/m/")
+        buffer = BytesIO()
+        Image.new("RGB", (300, 150)).save(buffer, "PNG")
+        self.name = self.storage.save("shoe.png", ContentFile(buffer.getvalue()))
+        self.image = mock.Mock(storage=self.storage, name=self.name)
+
+    def test_widths_above_the_original_are_not_upscaled(self):
+        derivatives = generate_derivatives(self.storage, self.name)
+        self.assertEqual(
+            derivatives, {"jpeg": [[256, "shoe_256.jpg"], [300, "shoe_300.jpg"]]}
+        )
+        with self.storage.open("shoe_300.jpg") as copy:
+            self.assertEqual(Image.open(copy).size, (300, 150))
+        self.assertEqual(
+            srcset(self.image, "jpeg", derivatives),
+            "/m/shoe_256.jpg 256w, /m/shoe_300.jpg 300w",
+        )
+
+    def test_srcset_is_empty_until_derivatives_are_recorded(self):
+        self.assertEqual(srcset(self.image, "jpeg", {}), "")
+        self.assertEqual(srcset(self.image, "webp", {"jpeg": []}), "")
+
+    def test_deferred_image_keeps_the_derivatives(self):
+        derivatives = {"jpeg": [[256, "uploads/products/shoe_256.jpg"]]}
+        product = Product.objects.create(
+            name="shoe",
+            category=Category.objects.create(name="shoes"),
+            image="uploads/products/shoe.png",
+            image_derivatives=derivatives,
+        )
+        product = Product.objects.defer("image").get(pk=product.pk)
+        product.name = "boot"
+        with mock.patch("store.signals.schedule_derivatives") as schedule:
+            product.save()
+        schedule.assert_not_called()
+        product.refresh_from_db()
+        self.assertEqual(product.image_derivatives, derivatives)
+
+    def test_new_image_forgets_the_former_derivatives(self):
+        product = Product.objects.create(
+            name="shoe",
+            category=Category.objects.create(name="shoes"),
+            image="uploads/products/shoe.png",
+            image_derivatives={"jpeg": [[256, "uploads/products/shoe_256.jpg"]]},
+        )
+        product.refresh_from_db()
+        product.name = "boot"
+        product.save()
+        self.assertTrue(product.image_derivatives)
+        product.image = "uploads/products/boot.png"
+        with mock.patch("store.signals.schedule_derivatives") as schedule:
+            product.save()
+        product.refresh_from_db()
+        self.assertEqual(product.image_derivatives, {})
+        derivatives = {"jpeg": [[256, "uploads/products/boot_256.jpg"]]}
+        schedule.call_args.kwargs["on_done"](derivatives)
+        product.refresh_from_db()
+        self.assertEqual(product.image_derivatives, derivatives)
+
+
+class ImportProductsTest(TestCase):
+    def test_queued_rows_are_indexed_before_returning(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f"{directory.name}/products.jsonl"
+        with open(path, "w") as f:
+            f.write('{"name": "shoe", "price": 10, "category": "shoes"}\n')
+        worker = mock.Mock()
+        with mock.patch(
+            "store.management.commands.import_products.get_index_worker",
+            return_value=worker,
+        ):
+            call_command(
+                "import_products", path, "--create-categories", stdout=StringIO()
+            )
+        worker.flush.assert_called_once()
+        self.assertTrue(Product.objects.filter(name="shoe").exists())
+
+    def test_only_a_sample_of_the_rejected_rows_is_kept(self):
+        importer = ProductImporter(max_errors=2)
+        importer.run([{"name": "shoe", "category": "missing"}] * 5)
+        self.assertEqual(importer.rejected, 5)
+        self.assertEqual([line for line, _ in importer.errors], [1, 2])
+
+    def test_imported_public_ids_resolve_once_committed(self):
+        Category.objects.create(name="shoes")
+        public_id = PublicId.create_public_id()
+        self.assertEqual(Product.resolve_public_ids([public_id]), {})
+        with mock.patch(
+            "store.importing.PublicId.allocate_public_ids", return_value=[public_id]
+        ), mock.patch("store.importing.enqueue"):
+            with self.captureOnCommitCallbacks(execute=True):
+                ProductImporter().run([{"name": "shoe", "category": "shoes"}])
+        self.assertIn(public_id, Product.resolve_public_ids([public_id]))
+
+    def test_allocated_public_ids_are_not_checked(self):
+        Category.objects.create(name="shoes")
+        importer = ProductImporter()
+        rows = [{"name": "shoe", "category": "shoes"}] * 3
+        with CaptureQueriesContext(connection) as queries:
+            with mock.patch("store.importing.enqueue"):
+                importer.run(rows)
+        self.assertEqual(importer.created, 3)
+        selects = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith("SELECT") and "public_id" in query["sql"]
+        ]
+        self.assertEqual(selects, [])
+
+
+class SoftDeleteCascadeTest(TestCase):
+    def delete_category(self, products):
+        category = Category.objects.create(name=f"{products} products")
+        Product.objects.bulk_create(
+            Product(name="shoe", category=category, deleted=None)
+            for _ in range(products)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            category.delete(force_policy=SOFT_DELETE_CASCADE)
+        return category, len(queries)
+
+    def test_products_are_marked_with_a_constant_number_of_queries(self):
+        _, few = self.delete_category(3)
+        category, many = self.delete_category(300)
+        self.assertEqual(few, many)
+        self.assertFalse(Product.objects.filter(category=category).exists())
+        self.assertEqual(
+            Product.all_objects.filter(category=category, deleted=1).count(), 300
+        )
+
+    def test_undelete_restores_the_products(self):
+        category, _ = self.delete_category(3)
+        category.refresh_from_db()
+        category.undelete(force_policy=SOFT_DELETE_CASCADE)
+        self.assertEqual(Product.objects.filter(category=category).count(), 3)
+
+
+class UploadFilesTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.source = f"{directory.name}/source"
+        for i in range(6):
+            os.makedirs(f"{self.source}/{i % 2}", exist_ok=True)
+            with open(f"{self.source}/{i % 2}/{i}.txt", "w") as f:
+                f.write(str(i))
+        self.storage = FileSystemStorage(location=f"{directory.name}/storage")
+        patcher = mock.patch(
+            "store.management.commands.upload_files.default_storage", self.storage
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self):
+        stdout = StringIO()
+        call_command(
+            "upload_files",
+            self.source,
+            "--prefix",
+            "media",
+            "--workers",
+            "4",
+            stdout=stdout,
+        )
+        return stdout.getvalue()
+
+    def test_files_are_uploaded_once_on_the_pool(self):
+        self.assertIn("Uploaded 6 files", self.upload())
+        with self.storage.open("media/1/3.txt") as f:
+            self.assertEqual(f.read(), b"3")
+        with open(f"{self.source}/1/3.txt", "w") as f:
+            f.write("changed")
+        output = self.upload()
+        self.assertIn("Uploaded 1 files", output)
+        self.assertIn("skipped 5 unchanged", output)
+
+
+class CatalogValidatorsTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="shoes")
+        Product.objects.create(name="shoe", category=self.category)
+
+    def test_revalidation_and_cached_pages_cost_no_query(self):
+        etag = self.client.get("/")["ETag"]
+        # assertNumQueries would miss the queries of the ORM threads.
+        execute = CursorWrapper._execute_with_wrappers
+        with mock.patch.object(
+            CursorWrapper, "_execute_with_wrappers", autospec=True, side_effect=execute
+        ) as queries:
+            self.assertEqual(self.client.get("/").status_code, 200)
+            response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        queries.assert_not_called()
+
+    def test_product_changes_replace_the_validators(self):
+        request = self.client.get("/").wsgi_request
+        etag, last_modified = catalog_validators(request)
+        Product.objects.create(name="boot", category=self.category)
+        new_etag, new_last_modified = catalog_validators(request)
+        self.assertNotEqual(new_etag, etag)
+        self.assertGreaterEqual(new_last_modified, last_modified)
+        response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "boot")
+
+    def test_cache_calls_run_off_the_event_loop(self):
+        on_loop = []
+
+        def record(method):
+            def call(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    on_loop.append(method.__name__)
+                except RuntimeError:
+                    pass
+                return method(*args, **kwargs)
+
+            return call
+
+        # caches are per thread, patched on the class for every thread.
+        backend = type(caches["default"])
+        patchers = [
+            mock.patch.object(backend, name, record(getattr(backend, name)))
+            for name in ("get", "set", "add", "incr")
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        etag = self.client.get("/")["ETag"]
+        self.client.get("/")
+        self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(on_loop, [])
+
+    @skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_invalidation_reaches_the_other_processes(self):
+        version = get_catalog_version()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                invalidate_catalog()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_category_pages_keep_their_etag_when_other_categories_change(self):
+        boots = Category.objects.create(name="boots")
+        shoes_page = f"/?category={self.category.id}"
+        etags = {path: self.client.get(path)["ETag"] for path in ("/", shoes_page)}
+        product = Product.objects.create(name="boot", category=boots)
+        self.assertNotEqual(self.client.get("/")["ETag"], etags["/"])
+        response = self.client.get(shoes_page, HTTP_IF_NONE_MATCH=etags[shoes_page])
+        self.assertEqual(response.status_code, 304)
+        # moved in, the product is listed by the shoes page.
+        product.category = self.category
+        product.save()
+        response = self.client.get(shoes_page, HTTP_IF_NONE_MATCH=etags[shoes_page])
+        self.assertContains(response, "boot")
+
+    def test_category_changes_replace_every_etag(self):
+        shoes_page = f"/?category={self.category.id}"
+        etag = self.client.get(shoes_page)["ETag"]
+        Category.objects.create(name="boots")
+        response = self.client.get(shoes_page, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "boots")
+
+    def test_query_string_selects_the_etag(self):
+        first = self.client.get("/")["ETag"]
+        self.assertNotEqual(
+            self.client.get(f"/?category={self.category.id}")["ETag"], first
+        )
+
+
+class SearchStubHandler(BaseHTTPRequestHandler):
+    """Answers like Elasticsearch, with one hit per search."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.answer(
+            {"version": {"number": "7.17.0"}, "tagline": "You Know, for Search"}
+        )
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.searches.append(self.path)
+        self.answer({"hits": {"hits": [{"_source": {"name": "shoe"}}]}})
+
+    def answer(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class AsyncSearchTest(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SearchStubHandler)
+        self.server.searches = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_async_search_runs_with_the_default_connection_settings(self):
+        # the shared settings, sync-only options included.
+        options = {
+            **settings.ELASTICSEARCH_DSL["default"],
+            "hosts": f"http://127.0.0.1:{self.server.server_port}",
+        }
+
+        async def search():
+            try:
+                return await search_products_async("shoe")
+            finally:
+                await get_async_client().close()
+
+        with override_settings(ELASTICSEARCH_DSL={"default": options}):
+            self.assertEqual(async_to_sync(search)(), [{"name": "shoe"}])
+        self.assertEqual(len(self.server.searches), 1)
+        self.assertTrue(self.server.searches[0].startswith("/eshop_elastic/_search"))
+
+
+class SearchAfterPaginationTest(SimpleTestCase):
+    def decode(self, after):
+        paginator = SearchAfterPagination()
+        cursor = paginator.encode_cursor(after)
+        request = Request(APIRequestFactory().get("/search/", {"cursor": cursor}))
+        return paginator.decode_cursor(request)
+
+    def test_cursor_holds_the_sort_values(self):
+        self.assertEqual(self.decode([10, 42]), [10, 42])
+
+    def test_cursor_of_an_id_alone_is_rejected(self):
+        with self.assertRaises(NotFound):
+            self.decode(42)
+
+
+class ProductExportStreamTest(TransactionTestCase):
+    rows = 20000
+
+    def setUp(self):
+        category = Category.objects.create(name="shoes")
+        for start in range(0, self.rows, 5000):
+            Product.objects.bulk_create(
+                Product(name=f"shoe {i}", price=i, category=category, deleted=None)
+                for i in range(start, start + 5000)
+            )
+        admin = User.objects.create_user(
+            username="admin@example.com", email="admin@example.com", is_staff=True
+        )
+        self.client.force_login(admin)
+
+    def export(self, query):
+        messages = []
+        sent = 0
+
+        async def receive():
+            return {"type": "http.request"}
+
+        async def send(message):
+            nonlocal sent
+            sent += len(message.get("body", b""))
+            messages.append({k: v for k, v in message.items() if k != "body"})
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/export/",
+            "query_string": query.encode(),
+            "headers": [
+                (
+                    b"cookie",
+                    f"sessionid={self.client.cookies['sessionid'].value}".encode(),
+                )
+            ],
+        }
+        async_to_sync(StreamingASGIHandler())(scope, receive, send)
+        return messages, sent
+
+    def test_export_streams_under_asgi_in_bounded_memory(self):
+        # imports and caches of a first request are not the export's.
+        self.export("type=ndjson&category=0")
+        tracemalloc.start()
+        try:
+            with mock.patch(
+                "store.views.export_rows",
+                functools.partial(export_rows, chunk_size=500),
+            ):
+                messages, sent = self.export("type=ndjson")
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertEqual(messages[-1], {"type": "http.response.body"})
+        self.assertGreater(len(messages), 3)
+        # the whole export is never held, only a chunk of rows.
+        self.assertGreater(sent, 2 * 1024 * 1024)
+        self.assertLess(peak, sent / 4)
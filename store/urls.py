@@ -6,4 +6,5 @@ urlpatterns = [
     path("", views.index),
     path("filter/", views.search, name="filter_view"),
     path("search/", views.ProductDocumentView.as_view({"get": "list"})),
+    path("export/", views.ProductExportView.as_view({"get": "export"})),
 ]
@@ -1 +1,285 @@
+import hashlib
+import time
 
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import cached_property
+from django.utils.http import http_date, quote_etag
+
+from e_shop.common import bump_cache_version, get_cache_version
+from store.models import Category, Product
+
+# Versions of the cached catalog fragments and pages: the listing of every
+# product changes with any product or category, the category list with any
+# category, and the listing of one category with its own products.
+CATALOG_VERSION_KEY = "catalog_version"
+CATEGORIES_VERSION_KEY = "catalog_version:categories"
+CATEGORY_VERSION_KEY = "catalog_version:category:{}"
+CATALOG_MODIFIED_KEY = "catalog_modified"
+
+# Columns rendered by the product cards of ``index.html``.
+PRODUCT_CARD_FIELDS = (
+    "id",
+    "name",
+    "price",
+    "image",
+    "image_derivatives",
+    "category_id",
+)
+
+
+def get_catalog_version(category=None):
+    """
+    This function is used to get the version of the cached product listings.
+
+    :param category: Category id of the listing, ``None`` for every product.
+    :type category: int
+    :return: return the current version of the listing.
+    :rtype: int
+    """
+    if category is None:
+        return get_cache_version(cache, CATALOG_VERSION_KEY)
+    return get_cache_version(cache, CATEGORY_VERSION_KEY.format(category))
+
+
+def get_categories_version():
+    """
+    This function is used to get the version of the cached category list.
+
+    :return: return the current version of the category list.
+    :rtype: int
+    """
+    return get_cache_version(cache, CATEGORIES_VERSION_KEY)
+
+
+def get_catalog_modified():
+    """
+    This function is used to get the time of the latest catalog change.
+
+    A time evicted from the cache comes back as the current time, which makes
+    clients fetch the pages again rather than keep stale ones.
+
+    :return: return the Unix time of the latest catalog change.
+    :rtype: int
+    """
+    modified = cache.get(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        modified = int(time.time())
+        if not cache.add(CATALOG_MODIFIED_KEY, modified, timeout=None):
+            modified = cache.get(CATALOG_MODIFIED_KEY, modified)
+    return modified
+
+
+def invalidate_catalog(categories=None):
+    """
+    This function is used to drop the cached catalog fragments and pages.
+
+    :param categories: Category ids of the changed products, the listings of
+        other categories are kept. ``None`` drops every page, e.g. when a
+        category changed.
+    :type categories: iterable
+    """
+    cache.set(CATALOG_MODIFIED_KEY, int(time.time()), timeout=None)
+    bump_cache_version(cache, CATALOG_VERSION_KEY)
+    if categories is None:
+        bump_cache_version(cache, CATEGORIES_VERSION_KEY)
+        return
+    for category in set(categories):
+        bump_cache_version(cache, CATEGORY_VERSION_KEY.format(category))
+
+
+def parse_id(value):
+    """
+    This function is used to read an optional id from the query string.
+
+    :param value: Raw query string value.
+    :type value: str
+    :return: return the id, ``None`` when missing or not a positive integer.
+    :rtype: int
+    """
+    if value and value.isdigit() and int(value) > 0:
+        return int(value)
+    return None
+
+
+class ProductPage:
+    """
+    One keyset page of the catalog: the products with ``id > after``, ordered by id.
+
+    Nothing is queried until ``products`` or ``next_cursor`` is read, so a page
+    whose fragment is already cached costs no query at all.
+    """
+
+    def __init__(self, category=None, after=None, size=None):
+        self.category = category
+        self.after = after
+        self.size = size or settings.CATALOG_PAGE_SIZE
+
+    @cached_property
+    def _rows(self):
+        queryset = Product.objects.only(*PRODUCT_CARD_FIELDS).order_by("id")
+        if self.category:
+            queryset = queryset.filter(category_id=self.category)
+        if self.after:
+            queryset = queryset.filter(id__gt=self.after)
+        # one extra row tells whether a next page exists.
+        return list(queryset[: self.size + 1])
+
+    @property
+    def products(self):
+        return self._rows[: self.size]
+
+    @property
+    def next_cursor(self):
+        if len(self._rows) > self.size:
+            return self._rows[self.size - 1].id
+        return None
+
+
+def catalog_context(category=None):
+    """
+    This function is used to build the context shared by the catalog templates.
+
+    :param category: Category id of the listed products, ``None`` for every product.
+    :type category: int
+    :return: return the lazy category list and the fragment cache settings.
+    :rtype: dict
+    """
+    return {
+        "categories": Category.objects.only("id", "name").order_by("id"),
+        "categories_version": get_categories_version(),
+        "catalog_version": get_catalog_version(category),
+        "catalog_timeout": settings.CATALOG_CACHE_TIMEOUT,
+    }
+
+
+def catalog_validators(request, category=None):
+    """
+    This function is used to compute the ETag and Last-Modified of a catalog page.
+
+    Both come from the catalog versions and change time kept in the shared
+    cache, which the product and category signals bump, so answering a
+    request from them costs no query. The ETag of a category page only
+    changes with its products and the category list. It also covers the
+    query string, which selects the page.
+
+    :param request: Request of the page.
+    :type request: django.http.HttpRequest
+    :param category: Category id of the listed products, ``None`` for every product.
+    :type category: int
+    :return: return the quoted ETag and the Last-Modified timestamp.
+    :rtype: tuple
+    """
+    if category is None:
+        versions = (get_catalog_version(),)
+    else:
+        versions = (get_categories_version(), get_catalog_version(category))
+    digest = hashlib.md5(repr((request.get_full_path(), versions)).encode()).hexdigest()
+    return quote_etag(digest), get_catalog_modified()
+
+
+def get_page_response(request, etag, last_modified):
+    """
+    This function is used to answer a catalog request without rendering it.
+
+    :param request: Request of the page.
+    :type request: django.http.HttpRequest
+    :param etag: ETag from ``catalog_validators``.
+    :type etag: str
+    :param last_modified: Last-Modified timestamp from ``catalog_validators``.
+    :type last_modified: int
+    :return: return a 304 when the client copy is current, the server-side
+        cached page, or ``None`` when the page must be rendered.
+    :rtype: django.http.HttpResponse
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content = cache.get(f"catalog_page:{etag}")
+        if content is not None:
+            response = HttpResponse(content)
+    return set_page_headers(response, etag, last_modified)
+
+
+def lookup_page(request, category=None, settle_delay=None):
+    """
+    This function is used to compute the validators of a catalog page and answer
+    it from them when possible, with blocking cache calls run off the event loop.
+
+    :param request: Request of the page.
+    :type request: django.http.HttpRequest
+    :param category: Category id of the listed products, ``None`` for every product.
+    :type category: int
+    :param settle_delay: Seconds after a catalog change during which the page
+        is always rendered again, e.g. until the search index caught up.
+    :type settle_delay: int
+    :return: return the ETag, the Last-Modified timestamp and the response of
+        ``get_page_response``, ``None`` when the page must be rendered.
+    :rtype: tuple
+    """
+    etag, last_modified = catalog_validators(request, category)
+    response = None
+    if settle_delay is None or time.time() - last_modified > settle_delay:
+        response = get_page_response(request, etag, last_modified)
+    return etag, last_modified, response
+
+
+def render_page(request, context, etag, last_modified, category=None, keep=True):
+    """
+    This function is used to render a catalog page with the shared catalog context.
+
+    :param request: Request of the page.
+    :type request: django.http.HttpRequest
+    :param context: Context of the page, e.g. its products.
+    :type context: dict
+    :param etag: ETag from ``catalog_validators``.
+    :type etag: str
+    :param last_modified: Last-Modified timestamp from ``catalog_validators``.
+    :type last_modified: int
+    :param category: Category id of the listed products, ``None`` for every product.
+    :type category: int
+    :param keep: Whether the page is kept for the next requests, see
+        ``cache_page_response``.
+    :type keep: bool
+    :return: return the rendered page.
+    :rtype: django.http.HttpResponse
+    """
+    response = render(request, "index.html", {**context, **catalog_context(category)})
+    if not keep:
+        return response
+    return cache_page_response(response, etag, last_modified)
+
+
+def cache_page_response(response, etag, last_modified):
+    """
+    This function is used to keep a rendered catalog page for the next requests.
+
+    Entries are keyed by ETag, so any change of the catalog makes them unused
+    until they expire after ``settings.CATALOG_CACHE_TIMEOUT`` seconds.
+
+    :param response: Rendered page.
+    :type response: django.http.HttpResponse
+    :param etag: ETag from ``catalog_validators``.
+    :type etag: str
+    :param last_modified: Last-Modified timestamp from ``catalog_validators``.
+    :type last_modified: int
+    :return: return the response with its validators and Cache-Control headers.
+    :rtype: django.http.HttpResponse
+    """
+    if response.status_code == 200:
+        cache.set(
+            f"catalog_page:{etag}", response.content, settings.CATALOG_CACHE_TIMEOUT
+        )
+    return set_page_headers(response, etag, last_modified)
+
+
+def set_page_headers(response, etag, last_modified):
+    if response is None:
+        return None
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # browsers reuse the page for max-age seconds, then revalidate it.
+    patch_cache_control(response, public=True, max_age=settings.CATALOG_HTTP_MAX_AGE)
+    return response
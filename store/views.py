@@ -1,6 +1,6 @@
-import requests
-from django.http import HttpResponse
-from django.shortcuts import render
+import time
+
+from django.http import HttpResponse, StreamingHttpResponse
 
 # Create your views here.
 from django_elasticsearch_dsl_drf.filter_backends import (
@@ -8,43 +8,61 @@ from django_elasticsearch_dsl_drf.filter_backends import (
     FilteringFilterBackend,
     OrderingFilterBackend,
 )
-from django_elasticsearch_dsl_drf.pagination import LimitOffsetPagination
 from django_elasticsearch_dsl_drf.viewsets import DocumentViewSet
 from elasticsearch import Elasticsearch
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from rest_framework import viewsets
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
 
-from e_shop.settings import LOCAL_HOST
+from e_shop.concurrency import orm_to_async
 from store.document import ProductDocument
-from store.models import Category, Product
+from store.exporting import CONTENT_TYPES, CSV, RENDERERS, VISIBILITY, export_rows
+from store.pagination import SearchAfterPagination
 from store.serializers import ProductDocumentSerializer
+from store.services import (
+    SEARCH_FIELDS,
+    SEARCH_INDEX_DELAY,
+    product_search,
+    search_products_async,
+)
+from store.utils import ProductPage, lookup_page, parse_id, render_page
 
 
-def index(request):
-    category_id = request.GET.get("category")
-    products = (
-        Product.objects.filter(category_id=category_id)
-        if category_id
-        else Product.objects.all()
+async def index(request):
+    category = parse_id(request.GET.get("category"))
+    etag, last_modified, response = await orm_to_async(lookup_page)(
+        request, category=category
     )
-    return render(
-        request,
-        "index.html",
-        {"products": products, "categories": Category.objects.all()},
+    if response is not None:
+        return response
+
+    page = ProductPage(category=category, after=parse_id(request.GET.get("after")))
+    # the page and categories are lazy, queried while rendering when not cached.
+    return await orm_to_async(render_page)(
+        request, {"page": page}, etag, last_modified, category=category
     )
 
 
-def search(request):
-    rest_search_url = LOCAL_HOST + f"/search/?search={request.GET.get('search')}"
-    response = requests.get(rest_search_url, verify=False)
-    return render(
-        request,
-        "index.html",
-        {"products": response.json(), "categories": Category.objects.all()},
+async def search(request):
+    # hits may predate the latest change until the index caught up.
+    etag, last_modified, response = await orm_to_async(lookup_page)(
+        request, settle_delay=SEARCH_INDEX_DELAY
+    )
+    if response is not None:
+        return response
+
+    products = await search_products_async(request.GET.get("search"))
+    settled = time.time() - last_modified > SEARCH_INDEX_DELAY
+    return await orm_to_async(render_page)(
+        request, {"products": products}, etag, last_modified, keep=settled
     )
 
 
 class ProductDocumentView(DocumentViewSet):
     document = ProductDocument
-    pagination_class = LimitOffsetPagination
+    pagination_class = SearchAfterPagination
     serializer_class = ProductDocumentSerializer
     fielddata = True
     filter_backends = [
@@ -52,8 +70,8 @@ class ProductDocumentView(DocumentViewSet):
         OrderingFilterBackend,
         CompoundSearchFilterBackend,
     ]
-    search_fields = ("name", "description")
-    multi_match_search_fields = ("name", "description")
+    search_fields = SEARCH_FIELDS
+    multi_match_search_fields = SEARCH_FIELDS
     filter_fields = {
         "name": "name",
         "description": "description",
@@ -63,6 +81,40 @@ class ProductDocumentView(DocumentViewSet):
     }
     ordering = ("id",)
 
+    def get_queryset(self):
+        queryset = product_search()
+        queryset.model = self.document.Django.model
+        return queryset
+
+
+class ProductExportView(viewsets.ViewSet):
+    """
+    Streams the whole catalog as CSV or NDJSON, e.g.
+    ``/export/?type=ndjson&category=3&visibility=all``.
+    """
+
+    authentication_classes = [OAuth2Authentication, SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def export(self, req):
+        file_type = req.query_params.get("type", CSV)
+        visibility = req.query_params.get("visibility", "visible")
+        if file_type not in RENDERERS:
+            raise ValidationError({"type": f"Expected one of {', '.join(RENDERERS)}."})
+        if visibility not in VISIBILITY:
+            raise ValidationError(
+                {"visibility": f"Expected one of {', '.join(VISIBILITY)}."}
+            )
+        rows = export_rows(
+            category=parse_id(req.query_params.get("category")),
+            visibility=visibility,
+        )
+        response = StreamingHttpResponse(
+            RENDERERS[file_type](rows), content_type=CONTENT_TYPES[file_type]
+        )
+        response["Content-Disposition"] = f'attachment; filename="products.{file_type}"'
+        return response
+
 
 # def autocomplete(request):
 #     max_items = 5
@@ -1,6 +1,23 @@
+import logging
+
 from django.apps import AppConfig
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
 
 
 class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "users"
+
+    def ready(self):
+        from e_shop.common import start_public_id_generator
+        from users import signals  # noqa: F401
+
+        # leased now rather than by the first model instance built, e.g. by
+        # the system checks.
+        try:
+            start_public_id_generator()
+        except DatabaseError:
+            # e.g. collectstatic without a database, ids lease it when needed.
+            logger.warning("Public id worker id not leased at startup.", exc_info=True)
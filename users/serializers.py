@@ -3,7 +3,6 @@ from django.forms import forms
 from rest_framework import serializers
 from rest_framework.response import Response
 
-from e_shop.common import PublicId
 from users.models import Roles, Scopes, User
 
 
@@ -18,9 +17,7 @@ class RegistrationSerializer(serializers.ModelSerializer):
         fields = ["firstName", "lastName", "email", "passWord", "role"]
 
     def create(self, data):
-        data.update(
-            {"username": data.get("email"), "public_id": PublicId.create_public_id()}
-        )
+        data.update({"username": data.get("email")})
         roles = data.pop("role")
         user = User.objects.create_user(**data)
         for role in roles:
@@ -104,7 +101,6 @@ class RoleSerializer(serializers.ModelSerializer):
         fields = ["name", "publicId"]
 
     def create(self, data):
-        data.update({"public_id": PublicId.create_public_id()})
         return Roles.objects.create(**data)
 
 
@@ -116,9 +112,20 @@ class ScopeSerializer(serializers.ModelSerializer):
         fields = ["name", "publicId"]
 
     def create(self, data):
-        data.update({"public_id": PublicId.create_public_id()})
         return Scopes.objects.create(**data)
 
 
 class ScopeUpdateSerializer(serializers.Serializer):
     roles = serializers.CharField()
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    userId = serializers.IntegerField(required=False)
+    clientId = serializers.CharField(required=False)
+
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError(
+                {"error": "userId or clientId is required."}
+            )
+        return data
@@ -0,0 +1,30 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from safedelete.signals import post_softdelete, post_undelete
+
+from e_shop.common import post_bulk_softdelete, post_bulk_undelete
+from users.models import Roles, Scopes
+from users.utils import invalidate_user_scopes
+
+
+@receiver(m2m_changed, sender=Roles.user.through)
+@receiver(m2m_changed, sender=Scopes.roles.through)
+def user_scopes_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_user_scopes()
+
+
+@receiver(post_save, sender=Roles)
+@receiver(post_save, sender=Scopes)
+@receiver(post_delete, sender=Roles)
+@receiver(post_delete, sender=Scopes)
+@receiver(post_softdelete, sender=Roles)
+@receiver(post_softdelete, sender=Scopes)
+@receiver(post_undelete, sender=Roles)
+@receiver(post_undelete, sender=Scopes)
+@receiver(post_bulk_softdelete, sender=Roles)
+@receiver(post_bulk_softdelete, sender=Scopes)
+@receiver(post_bulk_undelete, sender=Roles)
+@receiver(post_bulk_undelete, sender=Scopes)
+def roles_or_scopes_changed(sender, **kwargs):
+    invalidate_user_scopes()
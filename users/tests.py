@@ -1,3 +1,259 @@
-from django.test import TestCase
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from oauth2_provider.models import AccessToken, Application, RefreshToken
+
+from e_shop.common import CustomPermissions, collation_normalizer
+from users.models import Roles, Scopes, User
+from users.utils import SCOPES_CACHE, get_user_scopes, issue_token
+from users.views import UserLogOutView
 
 # Create your tests here.
+
+
+class CustomPermissionsQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="buyer@example.com", email="buyer@example.com", password="x"
+        )
+        cls.role = Roles.objects.create(name="buyer")
+        cls.role.user.add(cls.user)
+        Scopes.objects.create(name="create").roles.add(cls.role)
+
+    def setUp(self):
+        caches[SCOPES_CACHE].clear()
+
+    def get_request(self):
+        # GET of UserLogOutView requires the "create" scope.
+        request = RequestFactory().get("/user/logout/")
+        request.user = self.user
+        return request
+
+    def has_permission(self, request=None):
+        return CustomPermissions().has_permission(
+            request or self.get_request(), UserLogOutView()
+        )
+
+    def test_cold_cache_costs_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(self.has_permission())
+
+    def test_warm_cache_costs_no_query(self):
+        self.has_permission()
+        with self.assertNumQueries(0):
+            self.assertTrue(self.has_permission())
+
+    def test_scopes_are_resolved_once_per_request(self):
+        request = self.get_request()
+        with self.assertNumQueries(1):
+            self.assertTrue(self.has_permission(request))
+            self.assertEqual(get_user_scopes(request), {"create"})
+
+    def test_role_change_invalidates_cached_scopes(self):
+        self.assertTrue(self.has_permission())
+        self.role.user.remove(self.user)
+        self.assertFalse(self.has_permission())
+
+
+class BulkUniqueErrorsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user(username="taken", email="taken@example.com")
+
+    def get_users(self, *emails):
+        return [User(username=email, email=email) for email in emails]
+
+    def test_unique_checks_of_a_save_run_in_one_query(self):
+        user = User(username="taken", email="taken@example.com")
+        with self.assertNumQueries(1):
+            errors = user._perform_unique_checks(user._get_unique_checks()[0])
+        self.assertEqual(set(errors), {"username", "email"})
+
+    def test_taken_values_are_read_from_the_routed_database(self):
+        with mock.patch(
+            "e_shop.common.router.db_for_read", return_value="default"
+        ) as db_for_read:
+            User.bulk_unique_errors(self.get_users("new@example.com"))
+        db_for_read.assert_called_with(User)
+
+    def test_taken_and_repeated_values_are_reported(self):
+        errors = User.bulk_unique_errors(
+            self.get_users("taken@example.com", "new@example.com", "new@example.com")
+        )
+        self.assertIn("email", errors[0])
+        self.assertNotIn("email", errors[1])
+        self.assertIn("email", errors[2])
+
+    def test_values_are_compared_under_the_column_collation(self):
+        with mock.patch(
+            "e_shop.common.get_collation_normalizer",
+            return_value=collation_normalizer("utf8mb4_0900_ai_ci"),
+        ):
+            errors = User.bulk_unique_errors(
+                self.get_users("New@Example.com", "new@example.com")
+            )
+        self.assertNotIn("email", errors[0])
+        self.assertIn("email", errors[1])
+
+    def test_collation_normalizer(self):
+        ci = collation_normalizer("utf8mb4_0900_ai_ci")
+        self.assertEqual(ci("Élan@Example.com"), ci("elan@example.com"))
+        self.assertNotEqual(ci("a "), ci("a"))
+        pad_space = collation_normalizer("utf8mb4_bin")
+        self.assertEqual(pad_space("a "), "a")
+        self.assertNotEqual(pad_space("A"), pad_space("a"))
+        self.assertIsNone(collation_normalizer("utf8mb4_0900_bin"))
+
+
+class TokenRevocationTest(TransactionTestCase):
+    def setUp(self):
+        caches[SCOPES_CACHE].clear()
+        role = Roles.objects.create(name="buyer")
+        for name in ("create", "delete"):
+            Scopes.objects.create(name=name).roles.add(role)
+        self.buyer, self.other, self.admin = (
+            self.create_user(email, is_staff=is_staff, role=role)
+            for email, is_staff in (
+                ("buyer@example.com", False),
+                ("other@example.com", False),
+                ("admin@example.com", True),
+            )
+        )
+
+    def create_user(self, email, is_staff, role):
+        user = User.objects.create_user(
+            username=email, email=email, password="x", is_staff=is_staff
+        )
+        role.user.add(user)
+        Application.objects.create(
+            user=user,
+            authorization_grant_type="password",
+            client_type="confidential",
+            name=email,
+        )
+        return user
+
+    def issue(self, user):
+        return issue_token(user, Application.objects.get(user=user))
+
+    def auth(self, token):
+        return {"HTTP_AUTHORIZATION": f"Bearer {token['access_token']}"}
+
+    def revoke_all(self, token, **data):
+        return self.client.post(
+            "/user/logout/all/",
+            data,
+            content_type="application/json",
+            **self.auth(token),
+        )
+
+    def test_logout_revokes_only_the_presented_token(self):
+        presented, kept = self.issue(self.buyer), self.issue(self.buyer)
+        response = self.client.get("/user/logout/", **self.auth(presented))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            AccessToken.objects.filter(token=presented["access_token"]).exists()
+        )
+        self.assertIsNotNone(
+            RefreshToken.objects.get(token=presented["refresh_token"]).revoked
+        )
+        self.assertTrue(AccessToken.objects.filter(token=kept["access_token"]).exists())
+        self.assertIsNone(RefreshToken.objects.get(token=kept["refresh_token"]).revoked)
+
+    def test_revoke_all_revokes_every_token_of_the_caller(self):
+        token = self.issue(self.buyer)
+        self.issue(self.buyer)
+        self.issue(self.other)
+        response = self.revoke_all(token, userId=self.buyer.public_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["accessTokens"], 2)
+        self.assertEqual(response.json()["refreshTokens"], 2)
+        self.assertFalse(AccessToken.objects.filter(user=self.buyer).exists())
+        self.assertFalse(
+            RefreshToken.objects.filter(user=self.buyer, revoked__isnull=True).exists()
+        )
+        self.assertTrue(AccessToken.objects.filter(user=self.other).exists())
+
+    def test_non_staff_cannot_revoke_tokens_of_others(self):
+        token = self.issue(self.buyer)
+        self.issue(self.other)
+        client_id = Application.objects.get(user=self.other).client_id
+        for data in ({"userId": self.other.public_id}, {"clientId": client_id}):
+            with self.subTest(**data):
+                response = self.revoke_all(token, **data)
+                self.assertEqual(response.status_code, 403)
+                self.assertIn("Only staff", response.json()["error"])
+        self.assertTrue(AccessToken.objects.filter(user=self.other).exists())
+
+    def test_staff_can_revoke_tokens_of_others(self):
+        self.issue(self.other)
+        response = self.revoke_all(self.issue(self.admin), userId=self.other.public_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["accessTokens"], 1)
+        self.assertFalse(AccessToken.objects.filter(user=self.other).exists())
+        self.assertTrue(AccessToken.objects.filter(user=self.admin).exists())
+
+
+class LoginTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="buyer@example.com", email="buyer@example.com", password="x"
+        )
+        self.application = Application.objects.create(
+            user=self.user,
+            authorization_grant_type="password",
+            client_type="confidential",
+            name=self.user.email,
+        )
+
+    def login(self, password):
+        return self.client.post(
+            "/user/login/",
+            {"email": self.user.email, "passWord": password},
+            content_type="application/json",
+        )
+
+    def test_token_has_the_shape_of_the_password_grant(self):
+        # the former login relayed the answer of the password grant.
+        granted = self.client.post(
+            "/o/token/",
+            {
+                "username": self.user.username,
+                "password": "x",
+                "client_id": self.application.client_id,
+                "client_secret": self.application.client_secret,
+                "grant_type": "password",
+            },
+        ).json()
+        response = self.login("x")
+        self.assertEqual(response.status_code, 200)
+        token = response.json()
+        self.assertEqual(
+            set(token),
+            {"access_token", "expires_in", "token_type", "scope", "refresh_token"},
+        )
+        self.assertEqual(set(token), set(granted))
+        for key in ("expires_in", "token_type", "scope"):
+            self.assertEqual(token[key], granted[key])
+        access_token = AccessToken.objects.get(token=token["access_token"])
+        self.assertEqual(access_token.user, self.user)
+        self.assertEqual(access_token.application, self.application)
+        self.assertEqual(
+            RefreshToken.objects.get(token=token["refresh_token"]).access_token,
+            access_token,
+        )
+
+    def test_invalid_credentials_issue_no_token(self):
+        for response in (
+            self.login("wrong"),
+            self.client.post(
+                "/user/login/",
+                {"email": "nobody@example.com", "passWord": "x"},
+                content_type="application/json",
+            ),
+        ):
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("Error", response.json())
+        self.assertFalse(AccessToken.objects.exists())
@@ -1,11 +1,13 @@
 from django.urls import path
 
+from e_shop.concurrency import async_view
 from users import views
 
 urlpatterns = [
     path("signup/", views.UserView.as_view({"post": "sign_up"})),
-    path("login/", views.UserView.as_view({"post": "login"})),
-    path("logout/", views.UserLogOutView.as_view({"get": "logout"})),
+    path("login/", async_view(views.UserView.as_view({"post": "login"}))),
+    path("logout/", async_view(views.UserLogOutView.as_view({"get": "logout"}))),
+    path("logout/all/", views.UserLogOutView.as_view({"post": "revoke_all"})),
     path("roles/", views.UserView.as_view({"get": "role_list", "post": "create_role"})),
     path(
         "scopes/",
@@ -0,0 +1,137 @@
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, RefreshToken
+from oauth2_provider.oauth2_backends import get_oauthlib_core
+from oauthlib.common import Request
+
+from e_shop.common import bump_cache_version, get_cache_version
+from users.models import Scopes
+
+# Cache alias holding the resolved scopes of each user, see settings.CACHES.
+SCOPES_CACHE = "scopes"
+SCOPES_VERSION_KEY = "user_scopes_version"
+
+
+def issue_token(user, application):
+    """
+    This function is used to issue an access token for an authenticated user.
+
+    The password grant is skipped on purpose: the caller has already checked
+    the credentials, so the token is created straight from the oauthlib
+    server's bearer token handler and stored by its request validator.
+
+    :param user: User whose password was already verified.
+    :type user: users.models.User
+    :param application: OAuth application registered for the user.
+    :type application: oauth2_provider.models.Application
+    :return: return the token payload, same shape as ``/o/token/``.
+    :rtype: dict
+    """
+    server = get_oauthlib_core().server
+    validator = server.request_validator
+    request = Request("")
+    request.user = user
+    request.client = application
+    request.client_id = application.client_id
+    request.grant_type = "password"
+    request.scopes = validator.get_default_scopes(application.client_id, request)
+    token = server.default_token_type.create_token(request, refresh_token=True)
+    validator.save_token(token, request)
+    return dict(token)
+
+
+def revoke_access_token(access_token):
+    """
+    This function is used to revoke a single access token and its refresh token.
+
+    :param access_token: Token presented by the user on logout.
+    :type access_token: oauth2_provider.models.AccessToken
+    """
+    with transaction.atomic():
+        RefreshToken.objects.filter(
+            access_token=access_token, revoked__isnull=True
+        ).update(revoked=timezone.now(), access_token=None)
+        access_token.delete()
+
+
+def revoke_tokens(user=None, application=None):
+    """
+    This function is used to revoke every token of a user and/or application.
+
+    Refresh tokens are marked revoked with one UPDATE and access tokens are
+    removed with one bulk DELETE, whatever the number of tokens.
+
+    :param user: Revoke only the tokens issued to this user.
+    :type user: users.models.User
+    :param application: Revoke only the tokens issued to this application.
+    :type application: oauth2_provider.models.Application
+    :return: return the number of access and refresh tokens revoked.
+    :rtype: dict
+    """
+    filters = {}
+    if user is not None:
+        filters["user"] = user
+    if application is not None:
+        filters["application"] = application
+    if not filters:
+        raise ValueError("A user or an application is required to revoke tokens.")
+    with transaction.atomic():
+        refresh_tokens = RefreshToken.objects.filter(
+            revoked__isnull=True, **filters
+        ).update(revoked=timezone.now(), access_token=None)
+        access_tokens = AccessToken.objects.filter(**filters).delete()[0]
+    return {"accessTokens": access_tokens, "refreshTokens": refresh_tokens}
+
+
+def get_user_scopes(request):
+    """
+    This function is used to get the scope names granted to the request user.
+
+    The result is memoized on the request so that every permission class and
+    alternative checked during the same request reuses it.
+
+    :param request: Incoming request with an authenticated user.
+    :type request: rest_framework.request.Request
+    :return: return the scope names granted through the user roles.
+    :rtype: frozenset
+    """
+    scopes = getattr(request, "_user_scopes", None)
+    if scopes is None:
+        scopes = resolve_user_scopes(request.user)
+        request._user_scopes = scopes
+    return scopes
+
+
+def resolve_user_scopes(user):
+    """
+    This function is used to resolve the scope names of a user in one query.
+
+    Results are kept in the ``scopes`` cache under the current scopes version,
+    bumping the version (see ``invalidate_user_scopes``) makes every cached
+    entry stale at once.
+
+    :param user: User whose roles grant the scopes.
+    :type user: users.models.User
+    :return: return the scope names granted through the user roles.
+    :rtype: frozenset
+    """
+    cache = caches[SCOPES_CACHE]
+    version = get_cache_version(cache, SCOPES_VERSION_KEY)
+    key = f"user_scopes:{user.pk}"
+    scopes = cache.get(key, version=version)
+    if scopes is None:
+        scopes = frozenset(
+            Scopes.objects.filter(roles__user=user, roles__deleted__isnull=True)
+            .values_list("name", flat=True)
+            .distinct()
+        )
+        cache.set(key, scopes, version=version)
+    return scopes
+
+
+def invalidate_user_scopes():
+    """
+    This function is used to drop every cached user scope set.
+    """
+    bump_cache_version(caches[SCOPES_CACHE], SCOPES_VERSION_KEY)
@@ -1,4 +1,3 @@
-import requests
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.hashers import check_password
@@ -13,12 +12,16 @@ from oauth2_provider.contrib.rest_framework import (
 )
 from oauth2_provider.models import AccessToken, Application
 from rest_framework import viewsets
-from rest_framework.exceptions import APIException, NotFound, ValidationError
+from rest_framework.exceptions import (
+    APIException,
+    NotFound,
+    PermissionDenied,
+    ValidationError,
+)
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from e_shop.common import CustomPermissions, validate_url_value
-from e_shop.settings import LOCAL_HOST
+from e_shop.common import AlternateScopesMixin, CustomPermissions, validate_url_value
 from users.models import Roles, Scopes, User
 from users.serializers import (
     LoginSerializer,
@@ -26,7 +29,9 @@ from users.serializers import (
     RoleSerializer,
     ScopeSerializer,
     ScopeUpdateSerializer,
+    TokenRevokeSerializer,
 )
+from users.utils import issue_token, revoke_access_token, revoke_tokens
 
 
 class UserView(viewsets.ViewSet):
@@ -55,18 +60,11 @@ class UserView(viewsets.ViewSet):
                     raise ValidationError({"Error": f"User {email} does not exist."})
                 if not check_password(password, account.password):
                     raise ValidationError({"Error": "Incorrect Login credentials"})
-                application = Application.objects.get(user=account)
-                body_param = {
-                    "username": account.username,
-                    "password": password,
-                    "client_id": application.client_id,
-                    "client_secret": application.client_secret,
-                    "grant_type": "password",
-                }
-                response = requests.post(LOCAL_HOST + "/o/token/", data=body_param)
-                if response.status_code != 200:
-                    raise APIException(response.json())
-                return Response(response.json())
+                try:
+                    application = Application.objects.get(user=account)
+                except Application.DoesNotExist:
+                    raise APIException({"Error": f"No application for user {email}."})
+                return Response(issue_token(account, application))
 
     def create_role(self, req):
         serialize_data = RoleSerializer(data=req.data)
@@ -98,7 +96,7 @@ class UserView(viewsets.ViewSet):
             validate_url_value(scope_public_id, "scopeId")
             serialize_data = ScopeUpdateSerializer(data=req.data)
             if serialize_data.is_valid(raise_exception=True):
-                scope = Scopes.objects.get(public_id=scope_public_id)
+                scope = Scopes.objects.get(pk=Scopes.resolve_public_id(scope_public_id))
                 for role in serialize_data.data.get("roles").split(","):
                     query_filter = role.strip()
                     role = Roles.objects.get(name__icontains=query_filter)
@@ -116,21 +114,40 @@ class UserView(viewsets.ViewSet):
         return Response(serializer_data.data)
 
 
-class UserLogOutView(viewsets.ViewSet):
+class UserLogOutView(AlternateScopesMixin, viewsets.ViewSet):
     authentication_classes = [OAuth2Authentication]
     permission_classes = [TokenMatchesOASRequirements, CustomPermissions]
     required_alternate_scopes = {
-        "POST": [["create"]],
+        "POST": [["delete"]],
         "GET": [["create"], ["custom_scope1", "custom_scope2"]],
     }
 
     def logout(self, req):
-        token = req.auth.token
-        application = Application.objects.get(user=req.user)
-        data = {
-            "token": token,
-            "client_id": application.client_id,
-            "client_secret": application.client_secret,
-        }
-        requests.post(LOCAL_HOST + "/o/revoke_token/", data=data)
+        revoke_access_token(req.auth)
         return Response({"message": "User Logged out successfully"})
+
+    def revoke_all(self, req):
+        serialize_data = TokenRevokeSerializer(data=req.data)
+        if serialize_data.is_valid(raise_exception=True):
+            user_public_id = serialize_data.data.get("userId")
+            client_id = serialize_data.data.get("clientId")
+            try:
+                user = application = None
+                if user_public_id is not None:
+                    validate_url_value(str(user_public_id), "userId")
+                    user = User.objects.get(pk=User.resolve_public_id(user_public_id))
+                if client_id is not None:
+                    application = Application.objects.get(client_id=client_id)
+            except User.DoesNotExist:
+                raise NotFound(
+                    {"error": f"No user found on public id {user_public_id}"}
+                )
+            except Application.DoesNotExist:
+                raise NotFound({"error": f"No application found for {client_id}"})
+            owner = user or application.user
+            if not req.user.is_staff and owner != req.user:
+                raise PermissionDenied(
+                    {"error": "Only staff can revoke tokens of other users."}
+                )
+            revoked = revoke_tokens(user=user, application=application)
+            return Response({"message": "Tokens revoked successfully", **revoked})